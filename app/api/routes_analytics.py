@@ -0,0 +1,18 @@
+from typing import Optional
+from fastapi import APIRouter, Depends
+from app.common.dependencies import get_redis
+from app.common.redis_manager import RedisStorage
+from app.services.analytics_service import analytics
+
+router = APIRouter(tags=["analytics"])
+
+
+@router.get("")
+async def get_analytics(scenario: Optional[str] = None, difficulty: Optional[str] = None,
+                        redis: RedisStorage = Depends(get_redis)):
+    """
+    Сводная статистика по всем партиям: число событий, разбивки (купленные
+    карты, уровни сокровищ и т.п.) и волна конца партии по исходам —
+    по группам (сценарий, сложность) и итогом. Логи партий не читаются.
+    """
+    return await analytics.summary(redis, scenario, difficulty)
@@ -0,0 +1,53 @@
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.responses import JSONResponse, RedirectResponse
+from app.common.http_cache import etag_matches
+from app.services.catalog_assets import get_catalog_assets
+
+router = APIRouter(tags=["catalog"])
+
+# версия входит в URL, поэтому содержимое по адресу никогда не меняется
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+
+
+@router.get("")
+async def catalog_index():
+    """Текущая версия справочника и адреса его ресурсов."""
+    assets = get_catalog_assets()
+    return JSONResponse(
+        {
+            "version": assets.version,
+            "resources": {name: f"/catalog/{assets.version}/{name}" for name in assets.assets},
+        },
+        headers={"Cache-Control": "no-cache"},
+    )
+
+
+@router.get("/{resource}")
+async def catalog_latest(resource: str):
+    """Неверсионированный адрес — перенаправление на текущую версию."""
+    assets = get_catalog_assets()
+    if not assets.get(resource):
+        raise HTTPException(status_code=404, detail="Unknown catalog resource")
+    return RedirectResponse(
+        url=f"/catalog/{assets.version}/{resource}",
+        status_code=307,
+        headers={"Cache-Control": "no-cache"},
+    )
+
+
+@router.get("/{version}/{resource}")
+async def catalog_resource(version: str, resource: str, request: Request):
+    assets = get_catalog_assets()
+    if version != assets.version:
+        raise HTTPException(status_code=404, detail="Unknown catalog version")
+    asset = assets.get(resource)
+    if not asset:
+        raise HTTPException(status_code=404, detail="Unknown catalog resource")
+
+    encoding, body, etag = asset.negotiate(request.headers.get("accept-encoding"))
+    headers = {"ETag": etag, "Cache-Control": IMMUTABLE_CACHE, "Vary": "Accept-Encoding"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -1,9 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException
+import json
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from pydantic import BaseModel, Field
 from typing import List, Optional
+from app.common.config import BULK_NEW_MAX_GAMES
 from app.common.dependencies import get_redis
+from app.common.http_cache import etag_matches, make_etag
 from app.common.redis_manager import RedisStorage
+from app.services.game_actor import game_actors
+from app.services.game_directory import game_directory
 from app.services.game_service import GameService
+from app.services.legal_actions import legal_action_cache, legal_actions
+from app.services.state_codec import StateCodec
 from app.services.ws_manager import ws_manager
 
 router = APIRouter(tags=["game"])
@@ -14,44 +21,210 @@ class CreateNewGameRequest(BaseModel):
     player_names: List[str] = Field(..., description="Список имён игроков")
     scenario_id: str = Field(..., description="ID сценария")
     difficulty: Optional[str] = Field("family", description="Уровень сложности")
+    fill_bots: bool = Field(False, description="Свободные места классов монстров занимают боты")
+
+
+@router.get("")
+async def list_games(
+    status: Optional[str] = Query(None, description="active или finished"),
+    scenario: Optional[str] = None,
+    difficulty: Optional[str] = None,
+    cursor: Optional[str] = Query(None, description="next_cursor предыдущей страницы"),
+    limit: int = Query(50, ge=1, le=200),
+    redis: RedisStorage = Depends(get_redis),
+):
+    """Партии по убыванию последней активности, с фильтрами; постранично по курсору."""
+    try:
+        return await game_directory.list(redis, status, scenario, difficulty, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 @router.post("/new")
 async def create_new_game(req: CreateNewGameRequest, redis: RedisStorage = Depends(get_redis)):
     service = GameService(redis)
-    state = await service.create_game(req.game_id, req.player_names, req.scenario_id, req.difficulty)
+    # партия перезаписывается — актор со старым состоянием останавливается,
+    # партию другого узла перезаписывает только он (GameOwnedElsewhere -> перенаправление)
+    async with game_actors.owning(redis, [req.game_id]) as busy:
+        if busy:
+            raise busy[req.game_id]
+        try:
+            state = await service.create_game(req.game_id, req.player_names, req.scenario_id, req.difficulty, req.fill_bots)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
     # notify via ws (if clients subscribed)
     await ws_manager.broadcast_game_update(state.id, {"event": "game_created", "game_id": state.id})
-    return {"game_id": state.id, "state": state.to_dict()}
+    return {"game_id": state.id, "state": service.to_response(state)}
+
+
+class BulkCreateGamesRequest(BaseModel):
+    games: List[CreateNewGameRequest] = Field(..., max_length=BULK_NEW_MAX_GAMES, description="Параметры создаваемых партий")
+    overwrite: bool = Field(False, description="Перезаписывать существующие партии (иначе — ошибка по партии)")
+
+
+@router.post("/bulk_new")
+async def create_games_bulk(req: BulkCreateGamesRequest, redis: RedisStorage = Depends(get_redis)):
+    """
+    Создание многих партий за один запрос (не больше BULK_NEW_MAX_GAMES);
+    ошибки возвращаются по каждой партии. Существующие партии
+    перезаписываются только с overwrite=true.
+    """
+    service = GameService(redis)
+    async with game_actors.owning(redis, [g.game_id for g in req.games]) as busy:
+        specs = [g.model_dump() for g in req.games if g.game_id not in busy]
+        results = await service.create_games_bulk(specs, req.overwrite)
+    results += [(game_id, None, str(e)) for game_id, e in busy.items()]
+    created = [game_id for game_id, state, _ in results if state is not None]
+    if created:
+        await ws_manager.broadcast_game_update("lobby", {"event": "games_created", "game_ids": created})
+    return {
+        "created": len(created),
+        "failed": len(results) - len(created),
+        "results": [
+            {"game_id": game_id, "ok": True} if state is not None else {"game_id": game_id, "ok": False, "error": error}
+            for game_id, state, error in results
+        ],
+    }
 
 
 @router.get("/{game_id}/state")
-async def get_state(game_id: str, redis: RedisStorage = Depends(get_redis)):
+async def get_state(game_id: str, request: Request, expand: bool = True, redis: RedisStorage = Depends(get_redis)):
+    """
+    Текущее состояние партии.
+
+    Ответ помечается ETag по хешу сохранённых байт (и версии справочника для
+    развёрнутой витрины); при совпадении If-None-Match возвращается 304.
+    С expand=false витрина магазина остаётся списком id, и сохранённые байты
+    отдаются клиенту без разбора.
+    """
     service = GameService(redis)
-    state = await service.get_state(game_id)
-    if not state:
+    raw = await service.get_state_raw(game_id)
+    if not raw:
         raise HTTPException(status_code=404, detail="Game not found")
-    return state
+
+    body = raw.encode("utf-8")
+    packed = StateCodec.is_packed_raw(raw)
+    etag = make_etag(body, service.shop.catalog.version if (expand or packed) else "raw", expand)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    if expand or packed:
+        data = await service.render_stored(json.loads(raw), expand)
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+    return Response(content=body, media_type="application/json", headers=headers)
 
 
 @router.post("/{game_id}/end_turn")
 async def end_turn(game_id: str, redis: RedisStorage = Depends(get_redis)):
-    service = GameService(redis)
-    state = await service.start_next_wave(game_id)
+    state = await game_actors.call(redis, game_id, "end_turn")
     if not state:
         raise HTTPException(status_code=404, detail="Game not found")
-    await ws_manager.broadcast_game_update(game_id, {"event": "wave_completed", "game_id": game_id, "wave": state.wave})
+    await ws_manager.broadcast_game_update(game_id, {"event": "wave_completed", "game_id": game_id, "wave": state["wave"]})
     return state
 
 
 @router.post("/{game_id}/treasure/{tier}")
 async def open_treasure(game_id: str, tier: int, redis: RedisStorage = Depends(get_redis)):
-    service = GameService(redis)
-    state = await service.load_state(game_id)
-    if not state:
-        raise HTTPException(status_code=404, detail="Game not found")
     # apply effects directly (admin/manual trigger)
-    await service.rule_engine.apply_treasure_effect(state, str(tier))
-    await service.save_state(game_id, state)
+    result = await game_actors.call(redis, game_id, "open_treasure", str(tier))
+    if not result:
+        raise HTTPException(status_code=404, detail="Game not found")
     await ws_manager.broadcast_game_update(game_id, {"event": "treasure_opened", "tier": tier})
-    return {"status": "ok"}
+    return result
+
+
+@router.post("/{game_id}/treasures/{treasure_id}/opened")
+async def mark_treasure_opened(game_id: str, treasure_id: str, hero: Optional[str] = None,
+                               redis: RedisStorage = Depends(get_redis)):
+    """Отметить сокровище открытым без применения эффектов (admin/manual trigger)."""
+    try:
+        result = await game_actors.call(redis, game_id, "mark_treasure", treasure_id, hero)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not result:
+        raise HTTPException(status_code=404, detail="Game not found")
+    if result["opened"]:
+        await ws_manager.broadcast_game_update(game_id, {"event": "treasure_opened", "treasure": treasure_id})
+    return result
+
+
+@router.post("/{game_id}/draw")
+async def draw_card(game_id: str, player_id: Optional[str] = None, redis: RedisStorage = Depends(get_redis)):
+    """Взять карту из колоды игрока (по умолчанию — текущего); пустой сброс перемешивается в колоду."""
+    try:
+        result = await game_actors.call(redis, game_id, "draw_card", player_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not result:
+        raise HTTPException(status_code=404, detail="Game not found")
+    await ws_manager.broadcast_game_update(game_id, {"event": "card_drawn", "player_id": player_id})
+    return result
+
+
+@router.post("/{game_id}/shop/buy/{card_id}")
+async def buy_shop_card(game_id: str, card_id: str, player_id: Optional[str] = None, redis: RedisStorage = Depends(get_redis)):
+    try:
+        result = await game_actors.call(redis, game_id, "shop_buy", card_id, player_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not result:
+        raise HTTPException(status_code=404, detail="Game not found")
+    await ws_manager.broadcast_game_update(game_id, {"event": "shop_buy", "card_id": card_id})
+    return result
+
+
+@router.post("/{game_id}/play/{card_id}")
+async def play_card(
+    game_id: str,
+    card_id: str,
+    player_id: Optional[str] = None,
+    option: int = 0,
+    monster_id: Optional[str] = None,
+    target: List[str] = Query(default=[], description="Цели шагов по порядку (залы для move)"),
+    redis: RedisStorage = Depends(get_redis),
+):
+    """Розыгрыш карты из руки: вариант option действий карты."""
+    try:
+        result = await game_actors.call(redis, game_id, "play_card", card_id, player_id, option, monster_id, target)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not result:
+        raise HTTPException(status_code=404, detail="Game not found")
+    await ws_manager.broadcast_game_update(game_id, {"event": "card_played", "card_id": card_id})
+    return result
+
+
+@router.get("/{game_id}/actions")
+async def get_legal_actions(game_id: str, request: Request, player_id: Optional[str] = None,
+                            redis: RedisStorage = Depends(get_redis)):
+    """
+    Допустимые действия игрока (по умолчанию — текущего): куда могут пойти
+    его монстры, какие варианты карт руки что-то изменят, что можно купить.
+
+    Ответ кэшируется по версии состояния (хеш сохранённых байт), повторный
+    запрос без изменений партии не пересчитывается; ETag/304 — как у state.
+    """
+    service = GameService(redis)
+    raw = await service.get_state_raw(game_id)
+    if not raw:
+        raise HTTPException(status_code=404, detail="Game not found")
+
+    catalog = service.rule_engine.catalog
+    version = make_etag(raw.encode("utf-8"), catalog.version)
+    etag = make_etag(version, player_id or "", "actions")
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    key = (game_id, version, player_id)
+    body = legal_action_cache.get(key)
+    if body is None:
+        try:
+            actions = legal_actions(await service.parse_state(raw), player_id, catalog)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        body = json.dumps(actions, ensure_ascii=False).encode("utf-8")
+        legal_action_cache.put(key, body)
+    return Response(content=body, media_type="application/json", headers=headers)
+
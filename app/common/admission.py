@@ -0,0 +1,215 @@
+"""
+Допуск запросов к роутеру партий (/game): ограничение частоты и сброс нагрузки.
+
+Изменяющие запросы (не GET/HEAD/OPTIONS) берут по токену из двух корзин:
+клиента и партии из пути. Клиент — адрес соединения. За обратным прокси
+это адрес прокси, и все клиенты делят одну корзину: нужно задать
+ADMISSION_CLIENT_HEADER (например x-forwarded-for) и адреса прокси в
+ADMISSION_TRUSTED_PROXIES. Заголовок читается только у соединений от
+этих прокси, из его списка берётся самый правый адрес, не являющийся
+прокси, — начало списка клиент может подделать.
+Корзины лежат в Redis (RedisStorage.take_tokens — один EVALSHA), поэтому
+лимит общий для всех процессов и узлов. Пустая корзина — 429 с
+Retry-After до появления токена. Если хранилище недоступно, запрос
+пропускается: ограничитель не должен останавливать игру.
+
+Запросы, запускающие волну (end_turn, treasure/{tier}), дополнительно
+занимают слот WaveGate: одновременно в процессе идёт не больше
+WAVE_MAX_CONCURRENCY волн. Остальные ждут в очереди; если ожидаемое
+ожидание (очередь * средняя длительность волны / слоты) больше
+WAVE_QUEUE_BUDGET_MS или слот не освободился за это время — 503 с
+Retry-After. Так несколько разбушевавшихся клиентов упираются в лимиты,
+а задержка остальных партий не растёт вместе с их очередью.
+"""
+import asyncio
+import json
+import math
+import re
+from time import perf_counter
+from typing import Optional, Tuple
+from app.common.config import (
+    ADMISSION,
+    ADMISSION_CLIENT_HEADER,
+    ADMISSION_TRUSTED_PROXIES,
+    RATE_LIMIT_CLIENT_BURST,
+    RATE_LIMIT_CLIENT_RPS,
+    RATE_LIMIT_GAME_BURST,
+    RATE_LIMIT_GAME_RPS,
+    WAVE_MAX_CONCURRENCY,
+    WAVE_QUEUE_BUDGET_MS,
+)
+from app.common.dependencies import get_redis
+from app.common.logger import logger
+from app.common.metrics import ADMISSION_REJECTED, WAVE_QUEUE_SECONDS, Gauge
+
+SAFE_METHODS = frozenset(("GET", "HEAD", "OPTIONS"))
+FORWARDED_HEADERS = frozenset((b"x-forwarded-for", b"forwarded", b"x-real-ip"))
+# пути роутера без id партии
+RESERVED = frozenset(("new", "bulk_new"))
+# маршруты, запускающие волну героев или эффекты сокровищ
+WAVE_ROUTE = re.compile(r"^/[^/]+/(?:end_turn|treasure/[^/]+)/?$")
+
+_REJECTED_CLIENT = ADMISSION_REJECTED.labels("client")
+_REJECTED_GAME = ADMISSION_REJECTED.labels("game")
+_REJECTED_OVERLOAD = ADMISSION_REJECTED.labels("overload")
+_QUEUE_SECONDS = WAVE_QUEUE_SECONDS.labels()
+
+
+class Overloaded(Exception):
+    """Очередь волн длиннее бюджета задержки."""
+
+    def __init__(self, retry_after: float):
+        super().__init__("Too many waves in progress")
+        self.retry_after = retry_after
+
+
+class WaveGate:
+    """Не больше limit одновременных волн; очередь — в пределах budget секунд ожидания."""
+
+    def __init__(self, limit: int = WAVE_MAX_CONCURRENCY, budget: float = WAVE_QUEUE_BUDGET_MS / 1000):
+        self.limit = limit
+        self.budget = budget
+        self.active = 0
+        self.waiting = 0
+        self.avg = 0.0  # скользящее среднее длительности волны, с
+        self._slots = asyncio.Semaphore(limit)
+
+    def expected_wait(self) -> float:
+        if self.active < self.limit:
+            return 0.0
+        return (self.waiting + 1) * self.avg / self.limit
+
+    async def acquire(self):
+        if self._slots.locked():
+            wait = self.expected_wait()
+            if wait > self.budget:
+                raise Overloaded(wait)
+            start = perf_counter()
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._slots.acquire(), self.budget)
+            except asyncio.TimeoutError:
+                raise Overloaded(max(self.budget, self.expected_wait()))
+            finally:
+                self.waiting -= 1
+            _QUEUE_SECONDS.observe(perf_counter() - start)
+        else:
+            await self._slots.acquire()
+        self.active += 1
+
+    def release(self, elapsed: float):
+        self.active -= 1
+        self.avg = elapsed if not self.avg else 0.8 * self.avg + 0.2 * elapsed
+        self._slots.release()
+
+
+wave_gate = WaveGate()
+
+Gauge("ttkt_waves_in_flight", "Wave requests holding a concurrency slot", lambda: wave_gate.active)
+
+
+class AdmissionMiddleware:
+    """ASGI-middleware: лимиты клиента и партии, сброс нагрузки по очереди волн."""
+
+    def __init__(self, app, prefix: str = "/game", enabled: bool = ADMISSION,
+                 client_header: str = ADMISSION_CLIENT_HEADER, trusted_proxies: str = ADMISSION_TRUSTED_PROXIES,
+                 gate: Optional[WaveGate] = None):
+        self.app = app
+        self.prefix = prefix
+        self.enabled = enabled
+        self.client_header = client_header.lower().encode("latin-1")
+        self.trusted = frozenset(p.strip() for p in trusted_proxies.split(",") if p.strip())
+        self.gate = gate or wave_gate
+        self._proxy_warned = False
+        if self.enabled and self.client_header and not self.trusted:
+            logger.warning("[Admission] ADMISSION_CLIENT_HEADER is set without ADMISSION_TRUSTED_PROXIES, header ignored")
+
+    def _client(self, scope) -> str:
+        client = scope.get("client")
+        peer = client[0] if client else "unknown"
+        if self.client_header and self.trusted and ("*" in self.trusted or peer in self.trusted):
+            for k, v in scope.get("headers", ()):
+                if k == self.client_header:
+                    hops = [h.strip() for h in v.decode("latin-1").split(",") if h.strip()]
+                    # справа налево: последний адрес перед доверенными прокси добавлен ими самими
+                    for hop in reversed(hops):
+                        if hop not in self.trusted:
+                            return hop
+                    return hops[0] if hops else peer
+        elif not self._proxy_warned and not self.client_header:
+            if any(k in FORWARDED_HEADERS for k, _ in scope.get("headers", ())):
+                self._proxy_warned = True
+                logger.warning("[Admission] Requests come through a proxy but ADMISSION_CLIENT_HEADER is not set, "
+                               "all clients behind %s share one rate limit", peer)
+        return peer
+
+    def _game_id(self, rest: str) -> Optional[str]:
+        game_id = rest.strip("/").split("/", 1)[0]
+        return game_id if game_id and game_id not in RESERVED else None
+
+    async def _take(self, client: str, game_id: Optional[str]) -> Tuple[int, Optional[str]]:
+        """(мс до повтора, какая корзина пуста) или (0, None)."""
+        buckets = [(f"ratelimit:client:{client}", RATE_LIMIT_CLIENT_RPS, RATE_LIMIT_CLIENT_BURST)]
+        if game_id:
+            buckets.append((f"ratelimit:game:{game_id}", RATE_LIMIT_GAME_RPS, RATE_LIMIT_GAME_BURST))
+        try:
+            redis = await get_redis()
+            wait_ms, index = await redis.take_tokens(buckets)
+        except Exception as e:
+            logger.warning("[Admission] Rate limiter unavailable, request admitted: %s", e)
+            return 0, None
+        if not wait_ms:
+            return 0, None
+        return wait_ms, "client" if index == 0 else "game"
+
+    @staticmethod
+    async def _reject(send, status: int, detail: str, retry_after: float):
+        body = json.dumps({"detail": detail}).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.enabled or scope["method"] in SAFE_METHODS:
+            await self.app(scope, receive, send)
+            return
+        path = scope["path"]
+        rest = path[len(self.prefix):]
+        # /games и т.п. — не роутер партий
+        if not path.startswith(self.prefix) or (rest and not rest.startswith("/")):
+            await self.app(scope, receive, send)
+            return
+
+        game_id = self._game_id(rest)
+        client = self._client(scope)
+        wait_ms, bucket = await self._take(client, game_id)
+        if wait_ms:
+            (_REJECTED_CLIENT if bucket == "client" else _REJECTED_GAME).inc()
+            logger.debug("[Admission] %s limit hit by %s on %s", bucket, client, path,
+                        extra={"game_id": game_id, "event": "rate_limited"})
+            await self._reject(send, 429, f"Too many requests ({bucket} limit)", wait_ms / 1000)
+            return
+
+        if not WAVE_ROUTE.match(rest):
+            await self.app(scope, receive, send)
+            return
+        try:
+            await self.gate.acquire()
+        except Overloaded as e:
+            _REJECTED_OVERLOAD.inc()
+            logger.info("[Admission] Wave queue over budget, shedding %s", path,
+                           extra={"game_id": game_id, "event": "load_shed"})
+            await self._reject(send, 503, str(e), e.retry_after)
+            return
+        start = perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.gate.release(perf_counter() - start)
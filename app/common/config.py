@@ -1,7 +1,76 @@
 import os
+import socket
+import uuid
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 DATA_DIR = os.path.join(BASE_DIR, "data")
 
+# memory:// — хранилище в памяти процесса (один узел, без сохранения между запусками)
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
-LOG_LEVEL = os.getenv("LOG_LEVEL", "DEBUG")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+# Логирование (app/common/logger.py): формат "text" (по умолчанию) или "json", размер очереди фонового потока
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Выборка событий "hero_move=0.1,treasure=0.5" и лимит записей в секунду на (партия, событие)
+LOG_SAMPLE = os.getenv("LOG_SAMPLE", "")
+LOG_RATE_LIMIT = float(os.getenv("LOG_RATE_LIMIT", "20"))
+
+# Формат хранения GameState в Redis: "json" (публичная модель) или "packed" (app/services/state_codec.py)
+STATE_FORMAT = os.getenv("STATE_FORMAT", "json")
+
+# Через сколько секунд без команд актор партии выгружается из памяти
+GAME_ACTOR_IDLE_TIMEOUT = float(os.getenv("GAME_ACTOR_IDLE_TIMEOUT", "300"))
+# Сколько команд актор применяет за одно сохранение состояния
+GAME_ACTOR_MAX_BATCH = int(os.getenv("GAME_ACTOR_MAX_BATCH", "32"))
+
+# Аренда партий узлами кластера (см. app/services/game_lease.py)
+NODE_ID = os.getenv("NODE_ID") or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+# Адрес этого узла для перенаправления запросов (например http://10.0.0.5:8000)
+NODE_URL = os.getenv("NODE_URL", "")
+# По умолчанию аренда включена, только если задан NODE_URL: без адреса запрос к партии
+# чужого узла получает 503 до выгрузки её актора владельцем
+GAME_LEASES = os.getenv("GAME_LEASES", "1" if NODE_URL else "0") == "1"
+GAME_LEASE_TTL = float(os.getenv("GAME_LEASE_TTL", "15"))
+
+# Каталог партий (app/services/game_directory.py): как часто обновлять время активности
+# без смены фазы, через сколько секунд удалять завершённые и брошенные партии, период уборки
+GAME_DIRECTORY_TOUCH_INTERVAL = float(os.getenv("GAME_DIRECTORY_TOUCH_INTERVAL", "30"))
+GAME_FINISHED_TTL = float(os.getenv("GAME_FINISHED_TTL", str(24 * 3600)))
+GAME_IDLE_TTL = float(os.getenv("GAME_IDLE_TTL", str(7 * 24 * 3600)))
+GAME_SWEEP_INTERVAL = float(os.getenv("GAME_SWEEP_INTERVAL", "60"))  # 0 — уборка выключена
+GAME_SWEEP_BATCH = int(os.getenv("GAME_SWEEP_BATCH", "500"))
+# Наибольшее число партий в одном запросе POST /game/bulk_new
+BULK_NEW_MAX_GAMES = int(os.getenv("BULK_NEW_MAX_GAMES", "500"))
+
+# Допуск запросов к /game (app/common/admission.py): корзины токенов на клиента и на партию
+# (запросов в секунду и ёмкость), заголовок с id клиента ("" — адрес соединения),
+# сколько волн процесс выполняет одновременно и сколько мс запрос волны может ждать очереди
+ADMISSION = os.getenv("ADMISSION", "1") == "1"
+RATE_LIMIT_CLIENT_RPS = float(os.getenv("RATE_LIMIT_CLIENT_RPS", "20"))
+RATE_LIMIT_CLIENT_BURST = float(os.getenv("RATE_LIMIT_CLIENT_BURST", "40"))
+RATE_LIMIT_GAME_RPS = float(os.getenv("RATE_LIMIT_GAME_RPS", "5"))
+RATE_LIMIT_GAME_BURST = float(os.getenv("RATE_LIMIT_GAME_BURST", "10"))
+ADMISSION_CLIENT_HEADER = os.getenv("ADMISSION_CLIENT_HEADER", "").lower()
+# Адреса прокси через запятую, от которых принимается ADMISSION_CLIENT_HEADER ("*" — от любого
+# соединения, только если приложение доступно лишь через прокси); без них заголовок не читается
+ADMISSION_TRUSTED_PROXIES = os.getenv("ADMISSION_TRUSTED_PROXIES", "")
+WAVE_MAX_CONCURRENCY = int(os.getenv("WAVE_MAX_CONCURRENCY", "8"))
+WAVE_QUEUE_BUDGET_MS = float(os.getenv("WAVE_QUEUE_BUDGET_MS", "500"))
+
+# Счётчики сводной статистики при записи лога партии (app/services/analytics_service.py)
+ANALYTICS = os.getenv("ANALYTICS", "1") == "1"
+
+# Боты за монстров (app/services/bot_service.py): время на план хода, пул "process" или "thread".
+# Поиск — чистый Python: в пуле потоков он держит GIL и на время плана тормозит event loop
+# и остальные партии процесса; "thread" — только для отладки и тестов
+BOT_TIME_BUDGET_MS = float(os.getenv("BOT_TIME_BUDGET_MS", "200"))
+BOT_POOL = os.getenv("BOT_POOL", "process")
+BOT_WORKERS = int(os.getenv("BOT_WORKERS", "2"))
+
+# Трассировка запросов (app/common/tracing.py): "off", "header" (по заголовку X-Trace) или "all".
+# Заголовок X-Trace принимается только вместе с X-Trace-Token, равным TRACE_TOKEN (пустой — никогда);
+# в TRACE_DIR хранится не больше TRACE_MAX_FILES файлов, старые удаляются
+TRACE_MODE = os.getenv("TRACE_MODE", "off")
+TRACE_TOKEN = os.getenv("TRACE_TOKEN", "")
+TRACE_DIR = os.getenv("TRACE_DIR", os.path.join(os.path.dirname(BASE_DIR), "traces"))
+TRACE_MAX_FILES = int(os.getenv("TRACE_MAX_FILES", "200"))
@@ -1,12 +1,182 @@
+"""
+Логирование приложения.
+
+Записи не пишутся в stdout из вызывающего потока: logger кладёт их в
+ограниченную очередь, а форматирование и запись выполняет фоновый поток
+(QueueListener). Если очередь переполнена, запись отбрасывается —
+медленный stdout не останавливает event loop.
+
+Форматирование ленивое: в горячих путях используйте %-аргументы
+(logger.debug("[GameLog] %s <- %s", game_id, entry_type)), тогда строка
+собирается только для записей, прошедших уровень и выборку, и уже в
+фоновом потоке.
+
+Многочисленные события помечаются через extra={"game_id": ..., "event": ...}.
+Для отмеченных записей уровня INFO и ниже действуют выборка и лимит
+по паре (партия, событие): LOG_SAMPLE задаёт долю сохраняемых записей
+по событиям, LOG_RATE_LIMIT — не больше N записей в секунду на пару.
+WARNING и выше проходят всегда.
+
+LOG_FORMAT: "text" (по умолчанию) — прежний формат, "json" — одна JSON-строка
+на запись с полями extra (game_id, event) для сборщиков логов.
+"""
+import atexit
+import json
 import logging
+import queue
 import sys
-from app.common.config import LOG_LEVEL
+import threading
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional, Tuple
+from app.common.config import LOG_FORMAT, LOG_LEVEL, LOG_QUEUE_SIZE, LOG_RATE_LIMIT, LOG_SAMPLE
+from app.common.metrics import Counter
+
+LOG_RECORDS_DROPPED = Counter(
+    "ttkt_log_records_dropped_total", "Log records dropped before output", ("reason",)
+)
+_DROPPED_SAMPLED = LOG_RECORDS_DROPPED.labels("sampled")
+_DROPPED_RATE = LOG_RECORDS_DROPPED.labels("rate_limited")
+_DROPPED_FULL = LOG_RECORDS_DROPPED.labels("queue_full")
+
+# аргументы этих типов не меняются после вызова — форматирование можно отложить
+_IMMUTABLE = (str, int, float, bool, type(None), bytes)
+
+
+class JsonFormatter(logging.Formatter):
+    """Структурированная запись: время, уровень, сообщение и поля из extra."""
+
+    FIELDS = ("game_id", "event")
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "msg": record.getMessage(),
+        }
+        for field in self.FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Выборка и ограничение частоты для записей с extra event.
+    sample: {событие: доля 0..1}; rate_limit: записей в секунду на (партия, событие), 0 — без лимита.
+    """
+
+    def __init__(self, sample: Dict[str, float], rate_limit: float):
+        super().__init__()
+        self.sample = sample
+        self.rate_limit = rate_limit
+        self._seen: Dict[str, int] = {}
+        # (партия, событие) -> (начало текущей секунды, записей в ней)
+        self._windows: Dict[Tuple[str, str], Tuple[float, int]] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        event = getattr(record, "event", None)
+        if event is None or record.levelno >= logging.WARNING:
+            return True
+        share = self.sample.get(event)
+        if share is not None and share < 1:
+            with self._lock:
+                n = self._seen[event] = self._seen.get(event, 0) + 1
+            # детерминированная выборка: каждая k-я запись события
+            if share <= 0 or n % max(1, round(1 / share)) != 0:
+                _DROPPED_SAMPLED.inc()
+                return False
+        if self.rate_limit > 0:
+            key = (getattr(record, "game_id", None), event)
+            now = time.monotonic()
+            with self._lock:
+                start, count = self._windows.get(key, (now, 0))
+                if now - start >= 1:
+                    start, count = now, 0
+                    if len(self._windows) > 10000:
+                        self._windows.clear()  # старые окна партий не копятся
+                if count >= self.rate_limit:
+                    self._windows[key] = (start, count)
+                    _DROPPED_RATE.inc()
+                    return False
+                self._windows[key] = (start, count + 1)
+        return True
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """QueueHandler, который не ждёт места в очереди и не форматирует запись заранее."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        args = record.args
+        if args and not (isinstance(args, tuple) and all(isinstance(a, _IMMUTABLE) for a in args)):
+            # изменяемые объекты форматируются сразу, пока они ещё в нужном состоянии
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _DROPPED_FULL.inc()
+
+
+def parse_sample(spec: str) -> Dict[str, float]:
+    """'hero_move=0.1,wave_start=0.5' -> {'hero_move': 0.1, 'wave_start': 0.5}"""
+    result = {}
+    for part in spec.split(","):
+        if "=" in part:
+            name, value = part.split("=", 1)
+            result[name.strip()] = float(value)
+    return result
+
+
+def _setup(log: logging.Logger) -> QueueListener:
+    level = getattr(logging, LOG_LEVEL.upper(), logging.INFO)
+    log.setLevel(level)
+    log.propagate = False
+
+    out = logging.StreamHandler(sys.stdout)
+    if LOG_FORMAT == "json":
+        out.setFormatter(JsonFormatter())
+    else:
+        out.setFormatter(logging.Formatter("[%(asctime)s] [%(levelname)s] %(message)s", "%H:%M:%S"))
+
+    handler = NonBlockingQueueHandler(queue.Queue(maxsize=LOG_QUEUE_SIZE))
+    handler.addFilter(SamplingFilter(parse_sample(LOG_SAMPLE), LOG_RATE_LIMIT))
+    log.addHandler(handler)
+
+    listener = QueueListener(handler.queue, out, respect_handler_level=False)
+    listener.start()
+    atexit.register(listener.stop)  # дописать очередь при выходе
+    return listener
+
+
+def direct_output():
+    """
+    Писать записи сразу в stdout, без фонового потока. Для рабочих процессов
+    (пул ботов): они почти не пишут логов, а поток очереди в каждом не нужен.
+    """
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    atexit.unregister(_listener.stop)
+    for handler in [h for h in logger.handlers if isinstance(h, NonBlockingQueueHandler)]:
+        logger.removeHandler(handler)
+        for out in _listener.handlers:
+            for f in handler.filters:
+                out.addFilter(f)
+            logger.addHandler(out)
+    _listener = None
+
 
 logger = logging.getLogger("ttkt_heroes_out")
-logger.setLevel(getattr(logging, LOG_LEVEL.upper(), logging.DEBUG))
+_listener: Optional[QueueListener] = None
 if not logger.handlers:
-    ch = logging.StreamHandler(sys.stdout)
-    ch.setLevel(getattr(logging, LOG_LEVEL.upper(), logging.DEBUG))
-    fmt = logging.Formatter("[%(asctime)s] [%(levelname)s] %(message)s", "%H:%M:%S")
-    ch.setFormatter(fmt)
-    logger.addHandler(ch)
+    _listener = _setup(logger)
@@ -0,0 +1,378 @@
+"""
+Redis в памяти процесса — для бенчмарков, нагрузочных прогонов и запуска
+без сервера (REDIS_URL=memory://).
+
+Реализует только команды, которые использует RedisStorage, с семантикой
+redis.asyncio при decode_responses=True. Lua-скрипты не исполняются:
+для каждого скрипта RedisStorage регистрируется эквивалент на Python
+(emulate_script), EVAL выбирает его по тексту скрипта. EVALSHA, как
+в Redis, знает только скрипты, загруженные SCRIPT LOAD, иначе NOSCRIPT.
+"""
+import time
+from fnmatch import fnmatchcase
+from typing import Callable, Dict, List, Optional, Sequence
+from redis.exceptions import NoScriptError
+from app.common.redis_scripts import script_sha
+
+# скрипт -> fn(client, keys, argv); заполняется модулем, объявившим скрипт
+_SCRIPTS: Dict[str, Callable] = {}
+
+
+def emulate_script(script: str):
+    """Декоратор: Python-эквивалент Lua-скрипта для InMemoryRedis."""
+
+    def decorator(fn):
+        _SCRIPTS[script] = fn
+        return fn
+    return decorator
+
+
+class InMemoryRedis:
+    """Подмножество redis.asyncio.Redis: строки с TTL, списки, хеши, sorted set, pipeline, eval."""
+
+    def __init__(self):
+        self.values: Dict[str, str] = {}
+        self.lists: Dict[str, List[str]] = {}
+        self.hashes: Dict[str, Dict[str, str]] = {}
+        self.zsets: Dict[str, Dict[str, float]] = {}
+        self.expires: Dict[str, float] = {}
+        self.scripts: Dict[str, str] = {}  # sha1 -> текст (SCRIPT LOAD)
+
+    # ----------------------------
+    # Служебное
+    # ----------------------------
+    def _alive(self, key: str) -> bool:
+        deadline = self.expires.get(key)
+        if deadline is not None and deadline <= time.monotonic():
+            self.values.pop(key, None)
+            self.lists.pop(key, None)
+            self.hashes.pop(key, None)
+            self.zsets.pop(key, None)
+            del self.expires[key]
+            return False
+        return key in self.values or key in self.lists or key in self.hashes or key in self.zsets
+
+    @staticmethod
+    def _str(value) -> str:
+        return value if isinstance(value, str) else str(value)
+
+    def _check_type(self, key: str, store: dict):
+        self._alive(key)
+        for other in (self.values, self.lists, self.hashes, self.zsets):
+            if other is not store and key in other:
+                raise TypeError("WRONGTYPE Operation against a key holding the wrong kind of value")
+
+    @staticmethod
+    def _bound(value):
+        """Граница диапазона ZRANGEBYSCORE: число, "-inf"/"+inf", "(x" — строгая."""
+        text = str(value)
+        strict = text.startswith("(")
+        number = float(text[1:] if strict else text)
+        return number, strict
+
+    # ----------------------------
+    # Синхронные версии команд (их же вызывают pipeline и эмуляция скриптов)
+    # ----------------------------
+    def get_now(self, key: str) -> Optional[str]:
+        return self.values.get(key) if self._alive(key) else None
+
+    def set_now(self, key: str, value, ex: int = None, px: int = None, nx: bool = False) -> Optional[bool]:
+        if nx and self._alive(key):
+            return None
+        self.lists.pop(key, None)
+        self.hashes.pop(key, None)
+        self.zsets.pop(key, None)
+        self.values[key] = self._str(value)
+        self.expires.pop(key, None)
+        if ex is not None:
+            px = int(ex) * 1000
+        if px is not None:
+            self.expires[key] = time.monotonic() + int(px) / 1000
+        return True
+
+    def pexpire_now(self, key: str, ms: int) -> int:
+        if not self._alive(key):
+            return 0
+        self.expires[key] = time.monotonic() + int(ms) / 1000
+        return 1
+
+    def exists_now(self, *keys: str) -> int:
+        return sum(1 for k in keys if self._alive(k))
+
+    def delete_now(self, *keys: str) -> int:
+        removed = 0
+        for key in keys:
+            if self._alive(key):
+                removed += 1
+            self.values.pop(key, None)
+            self.lists.pop(key, None)
+            self.hashes.pop(key, None)
+            self.zsets.pop(key, None)
+            self.expires.pop(key, None)
+        return removed
+
+    def rpush_now(self, key: str, *values) -> int:
+        self._alive(key)
+        if key in self.values or key in self.hashes:
+            raise TypeError("WRONGTYPE Operation against a key holding the wrong kind of value")
+        items = self.lists.setdefault(key, [])
+        items.extend(self._str(v) for v in values)
+        return len(items)
+
+    def lrange_now(self, key: str, start: int, end: int) -> List[str]:
+        if not self._alive(key):
+            return []
+        items = self.lists.get(key, [])
+        n = len(items)
+        if start < 0:
+            start = max(n + start, 0)
+        end = n + end if end < 0 else min(end, n - 1)
+        return items[start:end + 1]
+
+    def hincrby_now(self, key: str, field: str, amount: int = 1) -> int:
+        self._check_type(key, self.hashes)
+        fields = self.hashes.setdefault(key, {})
+        value = int(fields.get(field, 0)) + int(amount)
+        fields[field] = str(value)
+        return value
+
+    def hgetall_now(self, key: str) -> Dict[str, str]:
+        return dict(self.hashes.get(key, {})) if self._alive(key) else {}
+
+    def hset_now(self, key: str, field: str = None, value=None, mapping: dict = None) -> int:
+        self._check_type(key, self.hashes)
+        fields = self.hashes.setdefault(key, {})
+        items = dict(mapping or {})
+        if field is not None:
+            items[field] = value
+        added = sum(1 for f in items if f not in fields)
+        fields.update((f, self._str(v)) for f, v in items.items())
+        return added
+
+    def hmget_now(self, key: str, fields: Sequence[str]) -> List[Optional[str]]:
+        stored = self.hashes.get(key, {}) if self._alive(key) else {}
+        return [stored.get(f) for f in fields]
+
+    def hdel_now(self, key: str, *fields: str) -> int:
+        stored = self.hashes.get(key) if self._alive(key) else None
+        if not stored:
+            return 0
+        removed = sum(1 for f in fields if stored.pop(f, None) is not None)
+        if not stored:
+            del self.hashes[key]
+        return removed
+
+    def zadd_now(self, key: str, mapping: Dict[str, float]) -> int:
+        self._check_type(key, self.zsets)
+        members = self.zsets.setdefault(key, {})
+        added = sum(1 for m in mapping if m not in members)
+        members.update((self._str(m), float(s)) for m, s in mapping.items())
+        return added
+
+    def zrem_now(self, key: str, *members: str) -> int:
+        stored = self.zsets.get(key) if self._alive(key) else None
+        if not stored:
+            return 0
+        removed = sum(1 for m in members if stored.pop(m, None) is not None)
+        if not stored:
+            del self.zsets[key]
+        return removed
+
+    def zcard_now(self, key: str) -> int:
+        return len(self.zsets.get(key, {})) if self._alive(key) else 0
+
+    def _zrange(self, key: str, low, high, start, num, withscores: bool, reverse: bool):
+        if not self._alive(key):
+            return []
+        lo, lo_strict = self._bound(low)
+        hi, hi_strict = self._bound(high)
+        items = [
+            (m, s) for m, s in self.zsets.get(key, {}).items()
+            if (s > lo if lo_strict else s >= lo) and (s < hi if hi_strict else s <= hi)
+        ]
+        # порядок Redis: по score, при равенстве — лексикографически по member
+        items.sort(key=lambda item: (item[1], item[0]), reverse=reverse)
+        if start is not None:
+            items = items[start:] if num is None or num < 0 else items[start:start + num]
+        return items if withscores else [m for m, _ in items]
+
+    def zrangebyscore_now(self, key: str, min, max, start=None, num=None, withscores: bool = False):
+        return self._zrange(key, min, max, start, num, withscores, reverse=False)
+
+    def zrevrangebyscore_now(self, key: str, max, min, start=None, num=None, withscores: bool = False):
+        return self._zrange(key, min, max, start, num, withscores, reverse=True)
+
+    def eval_now(self, script: str, numkeys: int, *args):
+        fn = _SCRIPTS.get(script)
+        if fn is None:
+            raise NotImplementedError("InMemoryRedis: no emulation registered for this script")
+        return fn(self, list(args[:numkeys]), [self._str(a) for a in args[numkeys:]])
+
+    def evalsha_now(self, sha: str, numkeys: int, *args):
+        script = self.scripts.get(sha)
+        if script is None:
+            raise NoScriptError("No matching script. Please use EVAL.")
+        return self.eval_now(script, numkeys, *args)
+
+    def script_load_now(self, script: str) -> str:
+        sha = script_sha(script)
+        self.scripts[sha] = script
+        return sha
+
+    # ----------------------------
+    # API redis.asyncio
+    # ----------------------------
+    async def get(self, key: str):
+        return self.get_now(key)
+
+    async def set(self, key: str, value, ex: int = None, px: int = None, nx: bool = False):
+        return self.set_now(key, value, ex=ex, px=px, nx=nx)
+
+    async def pexpire(self, key: str, ms: int):
+        return self.pexpire_now(key, ms)
+
+    async def delete(self, *keys: str):
+        return self.delete_now(*keys)
+
+    async def exists(self, *keys: str):
+        return self.exists_now(*keys)
+
+    async def rpush(self, key: str, *values):
+        return self.rpush_now(key, *values)
+
+    async def lrange(self, key: str, start: int, end: int):
+        return self.lrange_now(key, start, end)
+
+    async def hincrby(self, key: str, field: str, amount: int = 1):
+        return self.hincrby_now(key, field, amount)
+
+    async def hgetall(self, key: str):
+        return self.hgetall_now(key)
+
+    async def hset(self, key: str, field: str = None, value=None, mapping: dict = None):
+        return self.hset_now(key, field, value, mapping)
+
+    async def hmget(self, key: str, fields, *args):
+        return self.hmget_now(key, list(fields) + list(args) if not isinstance(fields, str) else [fields, *args])
+
+    async def hdel(self, key: str, *fields: str):
+        return self.hdel_now(key, *fields)
+
+    async def zadd(self, key: str, mapping: Dict[str, float]):
+        return self.zadd_now(key, mapping)
+
+    async def zrem(self, key: str, *members: str):
+        return self.zrem_now(key, *members)
+
+    async def zcard(self, key: str):
+        return self.zcard_now(key)
+
+    async def zrangebyscore(self, key: str, min, max, start=None, num=None, withscores: bool = False):
+        return self.zrangebyscore_now(key, min, max, start, num, withscores)
+
+    async def zrevrangebyscore(self, key: str, max, min, start=None, num=None, withscores: bool = False):
+        return self.zrevrangebyscore_now(key, max, min, start, num, withscores)
+
+    async def eval(self, script: str, numkeys: int, *args):
+        return self.eval_now(script, numkeys, *args)
+
+    async def evalsha(self, sha: str, numkeys: int, *args):
+        return self.evalsha_now(sha, numkeys, *args)
+
+    async def script_load(self, script: str):
+        return self.script_load_now(script)
+
+    async def scan_iter(self, match: str = None, count: int = None):
+        stores = (self.values, self.lists, self.hashes, self.zsets)
+        for key in [k for store in stores for k in store]:
+            if self._alive(key) and fnmatchcase(key, match or "*"):
+                yield key
+
+    async def script_flush(self, sync_type=None):
+        self.scripts.clear()
+        return True
+
+    def pipeline(self, transaction: bool = True) -> "_Pipeline":
+        return _Pipeline(self)
+
+    async def ping(self):
+        return True
+
+    async def close(self):
+        pass
+
+
+class _Pipeline:
+    """Команды копятся и выполняются по порядку в execute()."""
+
+    def __init__(self, client: InMemoryRedis):
+        self.client = client
+        self.ops: List[tuple] = []
+
+    def _add(self, name: str, args: Sequence, kwargs: Optional[dict] = None):
+        self.ops.append((name, args, kwargs or {}))
+        return self
+
+    def get(self, key):
+        return self._add("get_now", (key,))
+
+    def set(self, key, value, ex=None, px=None, nx=False):
+        return self._add("set_now", (key, value), {"ex": ex, "px": px, "nx": nx})
+
+    def delete(self, *keys):
+        return self._add("delete_now", keys)
+
+    def exists(self, *keys):
+        return self._add("exists_now", keys)
+
+    def rpush(self, key, *values):
+        return self._add("rpush_now", (key,) + values)
+
+    def lrange(self, key, start, end):
+        return self._add("lrange_now", (key, start, end))
+
+    def hincrby(self, key, field, amount=1):
+        return self._add("hincrby_now", (key, field, amount))
+
+    def hgetall(self, key):
+        return self._add("hgetall_now", (key,))
+
+    def hset(self, key, field=None, value=None, mapping=None):
+        return self._add("hset_now", (key, field, value, mapping))
+
+    def hmget(self, key, fields, *args):
+        return self._add("hmget_now", (key, list(fields) + list(args) if not isinstance(fields, str) else [fields, *args]))
+
+    def hdel(self, key, *fields):
+        return self._add("hdel_now", (key,) + fields)
+
+    def zadd(self, key, mapping):
+        return self._add("zadd_now", (key, mapping))
+
+    def zrem(self, key, *members):
+        return self._add("zrem_now", (key,) + members)
+
+    def zrangebyscore(self, key, min, max, start=None, num=None, withscores=False):
+        return self._add("zrangebyscore_now", (key, min, max, start, num, withscores))
+
+    def zrevrangebyscore(self, key, max, min, start=None, num=None, withscores=False):
+        return self._add("zrevrangebyscore_now", (key, max, min, start, num, withscores))
+
+    def eval(self, script, numkeys, *args):
+        return self._add("eval_now", (script, numkeys) + args)
+
+    def evalsha(self, sha, numkeys, *args):
+        return self._add("evalsha_now", (sha, numkeys) + args)
+
+    def script_load(self, script):
+        return self._add("script_load_now", (script,))
+
+    async def execute(self):
+        ops, self.ops = self.ops, []
+        return [getattr(self.client, name)(*args, **kwargs) for name, args, kwargs in ops]
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.ops = []
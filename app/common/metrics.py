@@ -0,0 +1,255 @@
+"""
+Встроенные метрики в текстовом формате Prometheus (GET /metrics).
+
+Счётчики — обычные int в заранее созданных списках: без блокировок
+(в event loop гонок нет, а из рабочих потоков допустима редкая потеря
+единицы) и без выделения памяти на каждое наблюдение. Дочерние серии
+по меткам создаются один раз; в горячих путях их стоит получать заранее.
+"""
+from bisect import bisect_left
+from time import perf_counter
+from typing import Callable, Dict, List, Sequence, Tuple
+
+# секунды: от 100 мкс до 10 с
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# размеры: от 256 до 4М
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+# штуки: записи лога, получатели рассылки
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250, 1000, 5000)
+
+
+def _fmt_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(v) -> str:
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt_float(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class _HistogramChild:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        registry.register(self)
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def render(self, out: List[str]):
+        out.append(f"# HELP {self.name} {self.help}")
+        out.append(f"# TYPE {self.name} {self.type}")
+        for values, child in list(self._children.items()):
+            self._render_child(out, values, child)
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def _render_child(self, out: List[str], values, child: _HistogramChild):
+        cumulative = 0
+        for bound, n in zip(self.buckets + (float("inf"),), child.counts):
+            cumulative += n
+            labels = _fmt_labels(self.labelnames, values, f'le="{_fmt_float(bound)}"')
+            out.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _fmt_labels(self.labelnames, values)
+        out.append(f"{self.name}_sum{labels} {_fmt_float(child.sum)}")
+        out.append(f"{self.name}_count{labels} {child.count}")
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+    def _render_child(self, out: List[str], values, child: _CounterChild):
+        out.append(f"{self.name}{_fmt_labels(self.labelnames, values)} {_fmt_float(child.value)}")
+
+
+class Gauge(_Metric):
+    """Значение читается функцией в момент выдачи метрик."""
+    type = "gauge"
+
+    def __init__(self, name: str, help: str, fn: Callable[[], float]):
+        self.fn = fn
+        super().__init__(name, help)
+
+    def render(self, out: List[str]):
+        out.append(f"# HELP {self.name} {self.help}")
+        out.append(f"# TYPE {self.name} {self.type}")
+        out.append(f"{self.name} {_fmt_float(self.fn())}")
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric '{metric.name}' is already registered")
+        self.metrics[metric.name] = metric
+
+    def render(self) -> str:
+        out: List[str] = []
+        for metric in self.metrics.values():
+            metric.render(out)
+        return "\n".join(out) + "\n"
+
+
+registry = Registry()
+
+
+# ----------------------------
+# Метрики приложения
+# ----------------------------
+HTTP_REQUEST_SECONDS = Histogram(
+    "ttkt_http_request_duration_seconds", "HTTP request latency by route", ("method", "route")
+)
+HTTP_RESPONSES = Counter(
+    "ttkt_http_responses_total", "HTTP responses by route and status", ("method", "route", "status")
+)
+REDIS_COMMAND_SECONDS = Histogram(
+    "ttkt_redis_command_duration_seconds", "RedisStorage operation latency by command", ("command",)
+)
+STATE_SERIALIZE_SECONDS = Histogram(
+    "ttkt_state_serialize_seconds", "GameState serialization time"
+)
+STATE_DESERIALIZE_SECONDS = Histogram(
+    "ttkt_state_deserialize_seconds", "GameState deserialization time"
+)
+STATE_BYTES = Histogram(
+    "ttkt_state_size", "Serialized GameState size in characters", ("op",), buckets=SIZE_BUCKETS
+)
+WAVE_SECONDS = Histogram(
+    "ttkt_wave_duration_seconds", "HeroAIService.run_wave duration"
+)
+WAVE_LOG_ENTRIES = Histogram(
+    "ttkt_wave_log_entries", "Game log entries written per wave", buckets=COUNT_BUCKETS
+)
+WS_BROADCAST_SECONDS = Histogram(
+    "ttkt_ws_broadcast_duration_seconds", "Websocket broadcast fan-out time"
+)
+WS_BROADCAST_RECIPIENTS = Histogram(
+    "ttkt_ws_broadcast_recipients", "Websocket connections per broadcast", buckets=COUNT_BUCKETS
+)
+
+BOT_DECISION_SECONDS = Histogram(
+    "ttkt_bot_decision_seconds", "Bot turn planning time including pool wait"
+)
+BOT_PLAYOUTS = Histogram(
+    "ttkt_bot_playouts", "Tree search playouts per bot decision", buckets=COUNT_BUCKETS
+)
+ADMISSION_REJECTED = Counter(
+    "ttkt_admission_rejected_total", "Game requests rejected by admission control", ("reason",)
+)
+WAVE_QUEUE_SECONDS = Histogram(
+    "ttkt_wave_queue_seconds", "Time a wave request waited for a concurrency slot"
+)
+
+
+def render_metrics() -> str:
+    return registry.render()
+
+
+def _route_template(scope) -> str:
+    """
+    Шаблон маршрута с префиксом роутера. route.path у маршрутов из
+    include_router относительный ("/{game_id}/state"), поэтому префикс
+    берётся из фактического пути: столько же последних сегментов, сколько
+    их в шаблоне, отбрасываются.
+    """
+    route = scope.get("route")
+    template = getattr(route, "path", None)
+    if template is None:
+        return "unmatched"
+    path = scope.get("path", "")
+    depth = template.count("/")
+    parts = path.split("/")
+    prefix = "/".join(parts[:len(parts) - depth]) if depth else path.rstrip("/")
+    return prefix + template
+
+
+class MetricsMiddleware:
+    """ASGI-middleware: задержка и статусы по шаблону маршрута (/game/{game_id}/state)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            path = _route_template(scope)
+            method = scope["method"]
+            HTTP_REQUEST_SECONDS.labels(method, path).observe(perf_counter() - start)
+            HTTP_RESPONSES.labels(method, path, status).inc()
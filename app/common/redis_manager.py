@@ -1,14 +1,183 @@
 import json
+import math
+import time
 import redis.asyncio as aioredis
-from typing import Optional
+from functools import wraps
+from time import perf_counter
+from typing import Optional, Tuple
+from redis.exceptions import NoScriptError
 from app.common.config import REDIS_URL
 from app.common.logger import logger
+from app.common.memory_redis import InMemoryRedis, emulate_script
+from app.common.metrics import REDIS_COMMAND_SECONDS
+from app.common.redis_scripts import SCRIPTS, RedisScript, redis_script
+from app.common.tracing import span
+
+
+def _timed(command: str):
+    """Замер задержки операции хранилища (метка command в /metrics, span в трассировке)."""
+    child = REDIS_COMMAND_SECONDS.labels(command)
+
+    def decorator(fn):
+        name = f"RedisStorage.{fn.__name__}"
+
+        @wraps(fn)
+        async def wrapper(*args, **kwargs):
+            start = perf_counter()
+            try:
+                with span(name, "redis"):
+                    return await fn(*args, **kwargs)
+            finally:
+                child.observe(perf_counter() - start)
+        return wrapper
+    return decorator
+
+# ----------------------------
+# Аренда (lease) ключей владельцем — атомарно на стороне Redis
+# ----------------------------
+# KEYS[1]=lease, ARGV[1]=owner, ARGV[2]=ttl_ms -> текущий владелец
+_LUA_ACQUIRE_LEASE = """
+if redis.call('set', KEYS[1], ARGV[1], 'NX', 'PX', ARGV[2]) then return ARGV[1] end
+local cur = redis.call('get', KEYS[1])
+if cur == ARGV[1] then redis.call('pexpire', KEYS[1], ARGV[2]) end
+return cur
+"""
+# KEYS[1]=lease, ARGV[1]=owner, ARGV[2]=ttl_ms -> 1 если продлено
+_LUA_RENEW_LEASE = """
+if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('pexpire', KEYS[1], ARGV[2]) end
+return 0
+"""
+# KEYS[1]=lease, ARGV[1]=owner -> 1 если освобождено
+_LUA_RELEASE_LEASE = """
+if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end
+return 0
+"""
+# KEYS[1]=key, KEYS[2]=lease, ARGV[1]=owner, ARGV[2]=value -> 1 если записано.
+# Для KEYS[3..] в ARGV дальше: 'l' (RPUSH значений) или 'h' (HINCRBY пар поле, n),
+# число значений и сами значения — записываются только вместе с KEYS[1].
+_LUA_SET_IF_OWNER = """
+if redis.call('get', KEYS[2]) ~= ARGV[1] then return 0 end
+redis.call('set', KEYS[1], ARGV[2])
+local a = 3
+for k = 3, #KEYS do
+  local kind, n = ARGV[a], tonumber(ARGV[a + 1])
+  a = a + 2
+  if kind == 'l' then
+    for i = a, a + n - 1, 1000 do redis.call('rpush', KEYS[k], unpack(ARGV, i, math.min(i + 999, a + n - 1))) end
+  else
+    for i = a, a + n - 1, 2 do redis.call('hincrby', KEYS[k], ARGV[i], ARGV[i + 1]) end
+  end
+  a = a + n
+end
+return 1
+"""
+
+# ----------------------------
+# Корзины токенов (ограничение частоты), общие для всех процессов
+# ----------------------------
+# KEYS[i] — хеш корзины {tokens, ts}; ARGV[2i-1]=токенов в секунду, ARGV[2i]=ёмкость.
+# Токен берётся из всех корзин или ни из одной -> {0, 0} или {мс до токена, номер корзины}
+_LUA_TAKE_TOKENS = """
+local t = redis.call('time')
+local now = t[1] * 1000 + math.floor(t[2] / 1000)
+local left = {}
+for i, key in ipairs(KEYS) do
+  local rate, burst = tonumber(ARGV[2 * i - 1]), tonumber(ARGV[2 * i])
+  local v = redis.call('hmget', key, 'tokens', 'ts')
+  local n = tonumber(v[1]) or burst
+  local ts = tonumber(v[2]) or now
+  n = math.min(burst, n + math.max(0, now - ts) * rate / 1000)
+  if n < 1 then return {math.ceil((1 - n) * 1000 / rate), i} end
+  left[i] = n - 1
+end
+for i, key in ipairs(KEYS) do
+  local rate, burst = tonumber(ARGV[2 * i - 1]), tonumber(ARGV[2 * i])
+  redis.call('hset', key, 'tokens', left[i], 'ts', now)
+  redis.call('pexpire', key, math.ceil(burst * 1000 / rate) + 1000)
+end
+return {0, 0}
+"""
+
+_ACQUIRE_LEASE = redis_script("acquire_lease", _LUA_ACQUIRE_LEASE)
+_RENEW_LEASE = redis_script("renew_lease", _LUA_RENEW_LEASE)
+_RELEASE_LEASE = redis_script("release_lease", _LUA_RELEASE_LEASE)
+_SET_IF_OWNER = redis_script("set_if_owner", _LUA_SET_IF_OWNER)
+_TAKE_TOKENS = redis_script("take_tokens", _LUA_TAKE_TOKENS)
+
+
+# Эквиваленты скриптов для InMemoryRedis (REDIS_URL=memory://, бенчмарки)
+@emulate_script(_LUA_ACQUIRE_LEASE)
+def _acquire_lease_emulated(r: InMemoryRedis, keys, argv):
+    if r.set_now(keys[0], argv[0], px=int(argv[1]), nx=True):
+        return argv[0]
+    cur = r.get_now(keys[0])
+    if cur == argv[0]:
+        r.pexpire_now(keys[0], int(argv[1]))
+    return cur
+
+
+@emulate_script(_LUA_RENEW_LEASE)
+def _renew_lease_emulated(r: InMemoryRedis, keys, argv):
+    if r.get_now(keys[0]) == argv[0]:
+        return r.pexpire_now(keys[0], int(argv[1]))
+    return 0
+
+
+@emulate_script(_LUA_RELEASE_LEASE)
+def _release_lease_emulated(r: InMemoryRedis, keys, argv):
+    if r.get_now(keys[0]) == argv[0]:
+        return r.delete_now(keys[0])
+    return 0
+
+
+@emulate_script(_LUA_SET_IF_OWNER)
+def _set_if_owner_emulated(r: InMemoryRedis, keys, argv):
+    if r.get_now(keys[1]) != argv[0]:
+        return 0
+    r.set_now(keys[0], argv[1])
+    a = 2
+    for key in keys[2:]:
+        kind, n = argv[a], int(argv[a + 1])
+        values = argv[a + 2:a + 2 + n]
+        a += 2 + n
+        if kind == "l":
+            r.rpush_now(key, *values)
+        else:
+            for i in range(0, n, 2):
+                r.hincrby_now(key, values[i], int(values[i + 1]))
+    return 1
+
+
+@emulate_script(_LUA_TAKE_TOKENS)
+def _take_tokens_emulated(r: InMemoryRedis, keys, argv):
+    now = int(time.time() * 1000)
+    left = []
+    for i, key in enumerate(keys):
+        rate, burst = float(argv[2 * i]), float(argv[2 * i + 1])
+        tokens, ts = r.hmget_now(key, ["tokens", "ts"])
+        n = float(tokens) if tokens is not None else burst
+        ts = int(ts) if ts is not None else now
+        n = min(burst, n + max(0, now - ts) * rate / 1000)
+        if n < 1:
+            return [math.ceil((1 - n) * 1000 / rate), i + 1]
+        left.append(n - 1)
+    for i, key in enumerate(keys):
+        rate, burst = float(argv[2 * i]), float(argv[2 * i + 1])
+        r.hset_now(key, mapping={"tokens": left[i], "ts": now})
+        r.pexpire_now(key, math.ceil(burst * 1000 / rate) + 1000)
+    return [0, 0]
+
 
 class RedisStorage:
     def __init__(self, url: Optional[str] = None):
         url = url or REDIS_URL
-        self.client = aioredis.from_url(url, decode_responses=True)
+        if url.startswith("memory://"):
+            # хранилище в памяти процесса (см. app/common/memory_redis.py)
+            self.client = InMemoryRedis()
+        else:
+            self.client = aioredis.from_url(url, decode_responses=True)
 
+    @_timed("get")
     async def get(self, key: str):
         v = await self.client.get(key)
         if v is None:
@@ -19,17 +188,224 @@ class RedisStorage:
             logger.exception("Failed to parse JSON from Redis for key %s", key)
             return None
 
+    @_timed("get")
+    async def get_raw(self, key: str) -> Optional[str]:
+        """Сохранённое значение как есть, без json.loads."""
+        return await self.client.get(key)
+
+    @_timed("pipeline")
+    async def get_raw_many(self, keys) -> list:
+        """get_raw() нескольких ключей одним pipeline."""
+        keys = list(keys)
+        if not keys:
+            return []
+        pipe = self.client.pipeline(transaction=False)
+        for key in keys:
+            pipe.get(key)
+        return await pipe.execute()
+
+    async def scan_keys(self, pattern: str, count: int = 1000):
+        """Ключи по шаблону через SCAN — без блокировки сервера, как у KEYS."""
+        async for key in self.client.scan_iter(match=pattern, count=count):
+            yield key
+
+    @_timed("set")
     async def set(self, key: str, value, ex: int = None):
         await self.client.set(key, json.dumps(value, ensure_ascii=False), ex=ex)
 
+    @_timed("set")
+    async def set_raw(self, key: str, raw: str, ex: int = None, px: int = None):
+        """set() для уже сериализованного значения."""
+        await self.client.set(key, raw, ex=ex, px=px)
+
+    @_timed("pipeline")
+    async def write_batch(self, values: dict = None, pushes: dict = None, increments: dict = None, raw: dict = None):
+        """
+        Запись пачки ключей и добавлений в списки одним pipeline (один round-trip).
+        values: {key: value} — как set(); raw: {key: str} — как set_raw();
+        pushes: {key: [str, ...]} — как rpush(); increments: {key: {field: n}} — HINCRBY полей хешей.
+        """
+        pipe = self.client.pipeline(transaction=False)
+        for key, value in (raw or {}).items():
+            pipe.set(key, value)
+        for key, value in (values or {}).items():
+            pipe.set(key, json.dumps(value, ensure_ascii=False))
+        for key, items in (pushes or {}).items():
+            if items:
+                pipe.rpush(key, *items)
+        for key, fields in (increments or {}).items():
+            for field, amount in fields.items():
+                pipe.hincrby(key, field, amount)
+        await pipe.execute()
+
+    @_timed("pipeline")
+    async def hgetall_many(self, keys) -> list:
+        """HGETALL нескольких хешей одним pipeline; значения — строки."""
+        keys = list(keys)
+        if not keys:
+            return []
+        pipe = self.client.pipeline(transaction=False)
+        for key in keys:
+            pipe.hgetall(key)
+        return await pipe.execute()
+
+    async def _evalsha(self, script: RedisScript, keys, args):
+        try:
+            return await self.client.evalsha(script.sha, len(keys), *keys, *args)
+        except NoScriptError:
+            # Redis перезапущен или кэш скриптов сброшен — загружаем и повторяем
+            logger.info("[Redis] Reloading script %s", script.name)
+            await self.client.script_load(script.lua)
+            return await self.client.evalsha(script.sha, len(keys), *keys, *args)
+
+    @_timed("evalsha")
+    async def run_script(self, script: RedisScript, keys=(), args=()):
+        """Выполнить скрипт из реестра (app/common/redis_scripts.py) по SHA1."""
+        return await self._evalsha(script, list(keys), list(args))
+
+    @_timed("script_load")
+    async def load_scripts(self):
+        """SCRIPT LOAD всех скриптов реестра одним pipeline."""
+        pipe = self.client.pipeline(transaction=False)
+        for script in SCRIPTS.values():
+            pipe.script_load(script.lua)
+        await pipe.execute()
+
+    @_timed("evalsha")
+    async def acquire_lease(self, key: str, owner: str, ttl_ms: int) -> Optional[str]:
+        """Захватить или продлить аренду; возвращает текущего владельца."""
+        return await self._evalsha(_ACQUIRE_LEASE, [key], [owner, ttl_ms])
+
+    @_timed("pipeline")
+    async def renew_leases(self, keys, owner: str, ttl_ms: int) -> list:
+        """Продлить несколько аренд одним pipeline; возвращает ключи, которые потеряны."""
+        keys = list(keys)
+        if not keys:
+            return []
+        for attempt in range(2):
+            pipe = self.client.pipeline(transaction=False)
+            for key in keys:
+                pipe.evalsha(_RENEW_LEASE.sha, 1, key, owner, ttl_ms)
+            try:
+                results = await pipe.execute()
+                break
+            except NoScriptError:
+                if attempt:
+                    raise
+                # продление идемпотентно — pipeline можно повторить целиком
+                await self.client.script_load(_RENEW_LEASE.lua)
+        return [k for k, ok in zip(keys, results) if not ok]
+
+    @_timed("evalsha")
+    async def release_lease(self, key: str, owner: str) -> bool:
+        return bool(await self._evalsha(_RELEASE_LEASE, [key], [owner]))
+
+    @_timed("evalsha")
+    async def set_if_owner(self, key: str, raw: str, lease_key: str, owner: str,
+                           pushes: dict = None, increments: dict = None) -> bool:
+        """
+        set_raw() только если аренда lease_key принадлежит owner (защита от записи
+        бывшим владельцем). pushes/increments — как в write_batch, записываются
+        тем же скриптом и только вместе с key.
+        """
+        keys, args = [key, lease_key], [owner, raw]
+        for list_key, items in (pushes or {}).items():
+            if items:
+                keys.append(list_key)
+                args += ["l", len(items), *items]
+        for hash_key, fields in (increments or {}).items():
+            if fields:
+                keys.append(hash_key)
+                args += ["h", 2 * len(fields), *(x for pair in fields.items() for x in pair)]
+        return bool(await self._evalsha(_SET_IF_OWNER, keys, args))
+
+    @_timed("evalsha")
+    async def take_tokens(self, buckets) -> Tuple[int, Optional[int]]:
+        """
+        Взять по токену из корзин [(key, токенов в секунду, ёмкость), ...] —
+        из всех сразу или ни из одной. Возвращает (0, None) или
+        (мс до появления токена, индекс исчерпанной корзины).
+        """
+        keys, args = [], []
+        for key, rate, burst in buckets:
+            keys.append(key)
+            args += [rate, burst]
+        wait_ms, index = await self._evalsha(_TAKE_TOKENS, keys, args)
+        return (0, None) if not wait_ms else (int(wait_ms), int(index) - 1)
+
+    @_timed("pipeline")
+    async def index_put_many(self, meta_key: str, entries):
+        """
+        Запись в индекс на sorted set одной транзакцией, entries —
+        [(member, meta, score, add_keys, remove_keys), ...]: meta — в хеш
+        meta_key, member со score — во все add_keys, из remove_keys — удалить.
+        """
+        pipe = self.client.pipeline(transaction=True)
+        for member, meta, score, add_keys, remove_keys in entries:
+            pipe.hset(meta_key, member, meta)
+            for key in add_keys:
+                pipe.zadd(key, {member: score})
+            for key in remove_keys:
+                pipe.zrem(key, member)
+        await pipe.execute()
+
+    @_timed("pipeline")
+    async def index_drop(self, meta_key: str, members: dict, delete_keys=()):
+        """Удалить из индекса: members — {member: ключи sorted set}; delete_keys — удалить целиком."""
+        pipe = self.client.pipeline(transaction=True)
+        for member, keys in members.items():
+            for key in keys:
+                pipe.zrem(key, member)
+        if members:
+            pipe.hdel(meta_key, *members)
+        for key in delete_keys:
+            pipe.delete(key)
+        await pipe.execute()
+
+    @_timed("zrange")
+    async def zrevrange_by_score(self, key: str, max_score, start: int, count: int) -> list:
+        """[(member, score), ...] по убыванию score, начиная с max_score."""
+        return await self.client.zrevrangebyscore(key, max_score, "-inf", start=start, num=count, withscores=True)
+
+    @_timed("zrange")
+    async def zrange_by_score(self, key: str, max_score, count: int) -> list:
+        """До count членов со score <= max_score, по возрастанию."""
+        return await self.client.zrangebyscore(key, "-inf", max_score, start=0, num=count)
+
+    @_timed("hmget")
+    async def hmget(self, key: str, fields) -> list:
+        fields = list(fields)
+        if not fields:
+            return []
+        return await self.client.hmget(key, fields)
+
+    @_timed("hset")
+    async def hset(self, key: str, field: str, value: str):
+        await self.client.hset(key, field, value)
+
+    @_timed("delete")
     async def delete(self, key: str):
         await self.client.delete(key)
 
-    async def rpush(self, key: str, value: str):
-        await self.client.rpush(key, value)
+    @_timed("rpush")
+    async def rpush(self, key: str, *values: str):
+        await self.client.rpush(key, *values)
 
+    @_timed("lrange")
     async def lrange(self, key: str, start: int = 0, end: int = -1):
         return await self.client.lrange(key, start, end)
 
+    @_timed("exists")
     async def exists(self, key: str) -> bool:
         return bool(await self.client.exists(key))
+
+    @_timed("pipeline")
+    async def exists_many(self, keys) -> list:
+        """exists() нескольких ключей одним pipeline."""
+        keys = list(keys)
+        if not keys:
+            return []
+        pipe = self.client.pipeline(transaction=False)
+        for key in keys:
+            pipe.exists(key)
+        return [bool(n) for n in await pipe.execute()]
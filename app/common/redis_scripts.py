@@ -0,0 +1,44 @@
+"""
+Реестр Lua-скриптов Redis.
+
+Скрипт объявляется один раз (redis_script) и вызывается по SHA1 через
+RedisStorage.run_script (EVALSHA) — текст скрипта не передаётся при каждом
+вызове. Если Redis скрипта не знает (перезапуск, SCRIPT FLUSH, другой
+экземпляр), он загружается (SCRIPT LOAD) и вызов повторяется.
+RedisStorage.load_scripts загружает весь реестр при старте приложения.
+
+Для InMemoryRedis у каждого скрипта должен быть Python-эквивалент
+(emulate_script из app/common/memory_redis.py).
+"""
+import hashlib
+from typing import Dict
+
+
+def script_sha(lua: str) -> str:
+    """SHA1 текста скрипта — как его считает Redis для EVALSHA."""
+    return hashlib.sha1(lua.encode("utf-8")).hexdigest()
+
+
+class RedisScript:
+    __slots__ = ("name", "lua", "sha")
+
+    def __init__(self, name: str, lua: str):
+        self.name = name
+        self.lua = lua
+        self.sha = script_sha(lua)
+
+    def __repr__(self):
+        return f"RedisScript({self.name!r}, {self.sha[:8]})"
+
+
+# имя -> скрипт; заполняется модулями, объявившими скрипты
+SCRIPTS: Dict[str, RedisScript] = {}
+
+
+def redis_script(name: str, lua: str) -> RedisScript:
+    """Зарегистрировать скрипт под именем name."""
+    existing = SCRIPTS.get(name)
+    if existing is not None and existing.lua != lua:
+        raise ValueError(f"Redis script '{name}' is already registered")
+    script = SCRIPTS[name] = RedisScript(name, lua)
+    return script
@@ -0,0 +1,318 @@
+"""
+Трассировка и профилирование отдельных запросов.
+
+Запрос трассируется, если TRACE_MODE="header" и клиент прислал заголовок
+X-Trace, или если TRACE_MODE="all". Профиль замедляет весь процесс и
+раскрывает внутренности сервиса, поэтому X-Trace учитывается только с
+заголовком X-Trace-Token, совпадающим с TRACE_TOKEN (по умолчанию
+трассировка выключена и токена нет). Для такого запроса:
+  - span'ы сервисов (GameService -> HeroAIService/RuleEngine -> RedisStorage/...)
+    собираются в дерево в формате Chrome trace (chrome://tracing, Perfetto);
+  - запрос выполняется под cProfile (детерминированный профиль, формат pstats).
+
+X-Trace: 1       — результат пишется в TRACE_DIR ({id}.trace.json и {id}.prof),
+                   id возвращается в заголовке X-Trace-Id;
+X-Trace: inline  — вместо тела ответа возвращается Chrome trace JSON, исходные
+                   статус и тело лежат в otherData.
+
+В TRACE_DIR остаются TRACE_MAX_FILES последних файлов, более старые удаляются.
+
+Без активной трассировки span() и @traced стоят одного ContextVar.get().
+cProfile в процессе один: пока профилируется один запрос, остальные
+трассируемые запросы получают только span'ы. Профиль event loop общий,
+поэтому в него попадают и параллельные запросы этого процесса.
+"""
+import asyncio
+import cProfile
+import hmac
+import inspect
+import io
+import json
+import os
+import pstats
+import threading
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from time import perf_counter_ns, time
+from typing import Dict, List, Optional, Tuple
+from app.common.config import TRACE_DIR, TRACE_MAX_FILES, TRACE_MODE, TRACE_TOKEN
+from app.common.logger import logger
+
+TRACE_HEADER = b"x-trace"
+TOKEN_HEADER = b"x-trace-token"
+PROFILE_TOP = 40  # сколько функций профиля попадает в inline-ответ
+
+_active: ContextVar[Tuple["Trace", ...]] = ContextVar("ttkt_traces", default=())
+
+
+class Trace:
+    """Собранные span'ы одного запроса."""
+
+    def __init__(self, name: str):
+        self.id = f"{int(time())}-{uuid.uuid4().hex[:8]}"
+        self.name = name
+        self.t0 = perf_counter_ns()
+        self.events: List[dict] = []
+        self._tids: Dict[Tuple[int, int], int] = {}
+
+    def _tid(self) -> int:
+        """Дорожка в Chrome trace: поток + задача asyncio (актор партии — своя дорожка)."""
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        key = (threading.get_ident(), id(task) if task else 0)
+        tid = self._tids.get(key)
+        if tid is None:
+            tid = self._tids[key] = len(self._tids) + 1
+            label = task.get_name() if task else threading.current_thread().name
+            self.events.append({"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": label}})
+        return tid
+
+    def add(self, name: str, cat: str, start_ns: int, end_ns: int, args: Optional[dict] = None):
+        event = {
+            "name": name,
+            "cat": cat,
+            "ph": "X",
+            "ts": (start_ns - self.t0) / 1000,
+            "dur": (end_ns - start_ns) / 1000,
+            "pid": 1,
+            "tid": self._tid(),
+        }
+        if args:
+            event["args"] = args
+        self.events.append(event)
+
+    def to_chrome(self, other: Optional[dict] = None) -> dict:
+        return {
+            "traceEvents": self.events,
+            "displayTimeUnit": "ms",
+            "otherData": {"trace_id": self.id, "name": self.name, **(other or {})},
+        }
+
+
+class _Span:
+    __slots__ = ("name", "cat", "args", "traces", "start")
+
+    def __init__(self, name: str, cat: str, args: Optional[dict], traces: Tuple[Trace, ...]):
+        self.name = name
+        self.cat = cat
+        self.args = args
+        self.traces = traces
+
+    def __enter__(self):
+        self.start = perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = perf_counter_ns()
+        args = self.args
+        if exc_type is not None:
+            args = {**(args or {}), "error": exc_type.__name__}
+        for trace in self.traces:
+            trace.add(self.name, self.cat, self.start, end, args)
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def current() -> Tuple[Trace, ...]:
+    """Активные трассировки текущего контекста (для передачи в другие задачи)."""
+    return _active.get()
+
+
+@contextmanager
+def activate(*traces: Trace):
+    """Сделать трассировки активными (например, в задаче актора для команды запроса)."""
+    token = _active.set(tuple(t for t in traces if t is not None))
+    try:
+        yield
+    finally:
+        _active.reset(token)
+
+
+def span(name: str, cat: str = "app", **args):
+    """with span("name"): ... — интервал во всех активных трассировках."""
+    traces = _active.get()
+    if not traces:
+        return _NULL_SPAN
+    return _Span(name, cat, args or None, traces)
+
+
+def traced(name: Optional[str] = None, cat: str = "app"):
+    """Декоратор: вызов функции (обычной или async) — span с именем Class.method."""
+
+    def decorator(fn):
+        span_name = name or fn.__qualname__
+
+        if inspect.iscoroutinefunction(fn):
+            @wraps(fn)
+            async def wrapper(*args, **kwargs):
+                traces = _active.get()
+                if not traces:
+                    return await fn(*args, **kwargs)
+                with _Span(span_name, cat, None, traces):
+                    return await fn(*args, **kwargs)
+        else:
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                traces = _active.get()
+                if not traces:
+                    return fn(*args, **kwargs)
+                with _Span(span_name, cat, None, traces):
+                    return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# ----------------------------
+# Профилирование
+# ----------------------------
+_profiler_lock = threading.Lock()
+
+
+def _profile_summary(profiler: cProfile.Profile, top: int = PROFILE_TOP) -> List[dict]:
+    stats = pstats.Stats(profiler, stream=io.StringIO())
+    rows = []
+    for (filename, line, func), (cc, nc, tt, ct, _) in stats.stats.items():
+        rows.append({
+            "function": f"{func} ({os.path.basename(filename)}:{line})",
+            "calls": nc,
+            "tottime_ms": round(tt * 1000, 3),
+            "cumtime_ms": round(ct * 1000, 3),
+        })
+    rows.sort(key=lambda r: r["cumtime_ms"], reverse=True)
+    return rows[:top]
+
+
+def _write_files(trace_doc: dict, profiler: Optional[cProfile.Profile], trace_id: str, directory: str,
+                 max_files: int = TRACE_MAX_FILES):
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, f"{trace_id}.trace.json"), "w", encoding="utf-8") as f:
+        json.dump(trace_doc, f, ensure_ascii=False)
+    if profiler is not None:
+        profiler.dump_stats(os.path.join(directory, f"{trace_id}.prof"))
+    _rotate(directory, max_files)
+
+
+def _rotate(directory: str, max_files: int):
+    """Удалить самые старые файлы трасс сверх max_files."""
+    entries = [e for e in os.scandir(directory)
+               if e.is_file() and (e.name.endswith(".trace.json") or e.name.endswith(".prof"))]
+    if len(entries) <= max_files:
+        return
+    entries.sort(key=lambda e: e.stat().st_mtime)
+    for entry in entries[:len(entries) - max_files]:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
+
+
+class TracingMiddleware:
+    """ASGI-middleware: включает трассировку и профиль для выбранных запросов."""
+
+    def __init__(self, app, mode: str = TRACE_MODE, directory: str = TRACE_DIR, token: str = TRACE_TOKEN):
+        self.app = app
+        self.mode = mode
+        self.directory = directory
+        self.token = token.encode("latin-1")
+
+    def _requested(self, scope) -> Optional[str]:
+        """None — не трассировать, иначе "file" или "inline"."""
+        if self.mode == "off":
+            return None
+        value = token = None
+        for k, v in scope.get("headers", ()):
+            if k == TRACE_HEADER:
+                value = v.decode("latin-1").strip().lower()
+            elif k == TOKEN_HEADER:
+                token = v.strip()
+        # заголовок X-Trace — только от того, кто знает токен
+        if value is not None and not (self.token and token and hmac.compare_digest(token, self.token)):
+            value = None
+        if value == "inline":
+            return "inline"
+        if value in ("1", "true", "file") or self.mode == "all":
+            return "file"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        output = self._requested(scope)
+        if output is None:
+            await self.app(scope, receive, send)
+            return
+
+        trace = Trace(f"{scope['method']} {scope['path']}")
+        trace_id_header = (b"x-trace-id", trace.id.encode())
+        start_message = None
+        body = []
+
+        async def send_wrapper(message):
+            nonlocal start_message
+            if output == "inline":
+                # ответ собирается целиком и заменяется трассой
+                if message["type"] == "http.response.start":
+                    start_message = message
+                elif message["type"] == "http.response.body":
+                    body.append(message.get("body", b""))
+                return
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": list(message.get("headers", [])) + [trace_id_header]}
+            await send(message)
+
+        profiler = cProfile.Profile() if _profiler_lock.acquire(blocking=False) else None
+        token = _active.set(_active.get() + (trace,))
+        start = perf_counter_ns()
+        try:
+            if profiler is not None:
+                profiler.enable()
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                _profiler_lock.release()
+            _active.reset(token)
+            trace.add(trace.name, "http", start, perf_counter_ns(), {"mode": output})
+
+        other = {"profiled": profiler is not None}
+        if output == "file":
+            try:
+                await asyncio.to_thread(_write_files, trace.to_chrome(other), profiler, trace.id, self.directory)
+                logger.info(f"[Trace] {trace.name} -> {self.directory}/{trace.id}.trace.json")
+            except OSError:
+                logger.exception(f"[Trace] Failed to write trace {trace.id}")
+            return
+
+        status = start_message["status"] if start_message else 500
+        other["status"] = status
+        other["response"] = b"".join(body).decode("utf-8", "replace")
+        if profiler is not None:
+            other["profile"] = _profile_summary(profiler)
+        payload = json.dumps(trace.to_chrome(other), ensure_ascii=False).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(payload)).encode()),
+                trace_id_header,
+            ],
+        })
+        await send({"type": "http.response.body", "body": payload})
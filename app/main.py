@@ -1,27 +1,97 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, PlainTextResponse, RedirectResponse
 from fastapi.middleware.cors import CORSMiddleware
+from app.api.routes_analytics import router as analytics_router
+from app.api.routes_catalog import router as catalog_router
 from app.api.routes_game import router as game_router
+from app.common.admission import AdmissionMiddleware
+from app.common.logger import logger
+from app.common.metrics import MetricsMiddleware, render_metrics
+from app.common.tracing import TracingMiddleware
+from app.services.bot_service import bot_service
+from app.common.dependencies import get_redis
+from app.services.game_actor import game_actors
+from app.services.game_directory import game_directory
+from app.services.game_lease import GameOwnedElsewhere, LeaseLost
+from app.services.game_service import GameService
 from app.services.ws_manager import ws_manager
 
 app = FastAPI(title="TTKT Heroes Out API", version="1.0.0")
 
+# лимиты /game — внутри CORS (у ответов 429/503 есть CORS-заголовки, браузер
+# покажет клиенту Retry-After) и внутри метрик (ответы попадают в статистику HTTP)
+app.add_middleware(AdmissionMiddleware, prefix="/game")
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Retry-After"],
 )
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(TracingMiddleware)
 
 app.include_router(game_router, prefix="/game")
+app.include_router(catalog_router, prefix="/catalog")
+app.include_router(analytics_router, prefix="/analytics")
+
+@app.exception_handler(GameOwnedElsewhere)
+async def game_owned_elsewhere(request: Request, exc: GameOwnedElsewhere):
+    # партией владеет другой узел — отправляем клиента к нему
+    if exc.owner_url:
+        target = exc.owner_url + request.url.path
+        if request.url.query:
+            target += "?" + request.url.query
+        return RedirectResponse(url=target, status_code=307, headers={"X-Game-Owner": exc.owner})
+    return JSONResponse(
+        {"detail": f"Game is owned by node {exc.owner}"},
+        status_code=503,
+        headers={"Retry-After": "1", "X-Game-Owner": exc.owner},
+    )
+
+@app.exception_handler(LeaseLost)
+async def lease_lost(request: Request, exc: LeaseLost):
+    return JSONResponse({"detail": str(exc)}, status_code=503, headers={"Retry-After": "1"})
 
 @app.on_event("startup")
 async def on_startup():
     await ws_manager.startup()
+    await game_actors.startup()
+    redis = await get_redis()
+    try:
+        await redis.load_scripts()
+    except Exception:
+        # скрипты загрузятся при первом вызове (NOSCRIPT)
+        logger.exception("[Redis] Failed to preload Redis scripts")
+    try:
+        await GameService(redis).publish_codec_table()
+    except Exception:
+        logger.exception("[Redis] Failed to publish state codec table")
+    await game_directory.startup(redis, game_actors.owning)
 
 @app.on_event("shutdown")
 async def on_shutdown():
+    await game_directory.shutdown()
+    await game_actors.shutdown()
     await ws_manager.shutdown()
+    bot_service.shutdown()
 
 @app.get("/")
 async def root():
     return {"status": "ok", "project": "TTKT Heroes Out"}
+
+@app.websocket("/ws")
+async def websocket_updates(websocket: WebSocket):
+    """Подписка на обновления партий (рассылка ws_manager.broadcast_game_update)."""
+    await ws_manager.connect(websocket)
+    try:
+        while True:
+            await websocket.receive_text()  # входящие сообщения не используются
+    except WebSocketDisconnect:
+        pass
+    finally:
+        ws_manager.disconnect(websocket)
+
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
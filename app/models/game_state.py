@@ -1,4 +1,5 @@
 from typing import List, Dict, Optional
+from pydantic import field_validator
 from .base import TTKTBaseModel, PhaseType
 from .player import Player
 from .hall import Hall
@@ -13,6 +14,7 @@ class GameState(TTKTBaseModel):
     heroes: List[Hero] = []
     monsters: List[Monster] = []
     treasures: List[Treasure] = []
+    scenario_id: Optional[str] = None
     difficulty: str = "family"
     phase: PhaseType = PhaseType.PLAYER
     current_player_id: Optional[str] = None
@@ -24,7 +26,15 @@ class GameState(TTKTBaseModel):
     monster_decks: Optional[Dict[str, List[str]]] = None
 
     shop_deck: Optional[List[str]] = None                 # id карт в колоде магазина (оставшиеся)
-    shop_display: Optional[List[Dict[str, object]]] = None  # полные данные карт на витрине
+    shop_display: Optional[List[str]] = None              # id карт на витрине (данные карт — в справочнике)
+
+    @field_validator("shop_deck", "shop_display", mode="before")
+    @classmethod
+    def _card_ids(cls, value):
+        # состояния, сохранённые до перехода на id, хранят на витрине полные данные карт
+        if isinstance(value, list):
+            return [card["id"] if isinstance(card, dict) else card for card in value]
+        return value
 
     def next_player(self) -> Optional[Player]:
         return next((p for p in self.players if p.id == self.current_player_id), None)
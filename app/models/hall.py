@@ -36,6 +36,6 @@ class Hall(TTKTBaseModel):
         if "closed_portal" in self.tokens:
             self.tokens.remove("closed_portal")
             self.open_portal = True
-            logger.info(f"[Hall] Портал открыт в зале '{self.id}'")
+            logger.info("[Hall] Портал открыт в зале '%s'", self.id)
             return True
         return False
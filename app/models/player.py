@@ -1,4 +1,4 @@
-from typing import List, Optional
+from typing import Dict, List, Optional
 from random import shuffle
 from pydantic import Field
 from .base import TTKTBaseModel
@@ -17,8 +17,10 @@ class Player(TTKTBaseModel):
     deck: List[str] = Field(default_factory=list)           # id карт в колоде
     discard_pile: List[str] = Field(default_factory=list)   # id карт в сбросе
     monsters: List[str] = Field(default_factory=list)       # id монстров под контролем игрока
+    resources: Dict[str, int] = Field(default_factory=dict)  # ресурсы игрока (gold и т.п.)
 
     defeated: bool = False
+    bot: bool = False  # место занято ботом (app/services/bot_service.py)
 
     def shuffle_deck(self):
         """Перемешать текущую колоду."""
@@ -0,0 +1,100 @@
+"""
+Заполнение сводной статистики (analytics_service) из архивных логов партий.
+
+    python -m app.services.analytics_backfill archive/*.jsonl[.gz] [--batch 5000] [--reset] [--dry-run]
+
+Архив — JSON-строки с записями лога {"type", "payload", ...}. Если в записи
+нет "game_id", им считается имя файла без расширений (например, дамп
+LRANGE game:{id}:log в файл {id}.jsonl). Файлы читаются построчно,
+приращения копятся в памяти и отправляются в хранилище пачками по --batch
+записей, поэтому размер архива не ограничен памятью.
+
+Счётчики только увеличиваются: повторный прогон по тем же архивам удвоит
+их. --reset удаляет хеши сводки перед заполнением.
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import sys
+from typing import Dict, Iterator, Optional, Tuple
+from app.common.redis_manager import RedisStorage
+from app.services.analytics_service import AnalyticsService
+
+
+def _open(path: str):
+    if path == "-":
+        return sys.stdin
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, encoding="utf-8")
+
+
+def _game_id_from_path(path: str) -> Optional[str]:
+    if path == "-":
+        return None
+    name = os.path.basename(path)
+    for ext in (".gz", ".jsonl", ".json", ".log"):
+        if name.endswith(ext):
+            name = name[: -len(ext)]
+    return name
+
+
+def iter_entries(path: str) -> Iterator[Tuple[str, str, dict]]:
+    """(game_id, тип, payload) по одной записи; битые строки пропускаются."""
+    default_game = _game_id_from_path(path)
+    with _open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            game_id = entry.get("game_id") or default_game
+            if game_id and entry.get("type"):
+                yield game_id, entry["type"], entry.get("payload")
+
+
+async def backfill(storage: RedisStorage, paths, batch: int = 5000, reset: bool = False, dry_run: bool = False) -> int:
+    """Прогнать архивы через AnalyticsService; возвращает число учтённых записей."""
+    service = AnalyticsService()
+    if reset and not dry_run:
+        for scenario, difficulty in service.groups():
+            await storage.delete(service.key(scenario, difficulty))
+
+    pending: Dict[str, Dict[str, int]] = {}
+    buffered = total = 0
+    for path in paths:
+        for game_id, entry_type, payload in iter_entries(path):
+            service.increments(game_id, [(entry_type, payload)], pending)
+            buffered += 1
+            total += 1
+            if buffered >= batch:
+                if not dry_run:
+                    await storage.write_batch(increments=pending)
+                pending, buffered = {}, 0
+    if pending and not dry_run:
+        await storage.write_batch(increments=pending)
+    return total
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="+", help="файлы архива (.jsonl, .jsonl.gz или - для stdin)")
+    parser.add_argument("--batch", type=int, default=5000, help="записей на один pipeline")
+    parser.add_argument("--reset", action="store_true", help="удалить счётчики сводки перед заполнением")
+    parser.add_argument("--dry-run", action="store_true", help="только разобрать архивы, ничего не записывать")
+    parser.add_argument("--redis-url", help="по умолчанию REDIS_URL")
+    args = parser.parse_args()
+
+    storage = RedisStorage(args.redis_url)
+    total = asyncio.run(backfill(storage, args.paths, args.batch, args.reset, args.dry_run))
+    print(f"Processed {total} log entries from {len(args.paths)} file(s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,140 @@
+"""
+Сводная статистика по всем партиям без чтения логов.
+
+Каждая запись лога при записи (GameLogService) превращается в приращения
+полей хеша analytics:{сценарий}:{сложность}:
+  e:{тип}             — сколько раз было событие;
+  b:{тип}:{значение}  — разбивка события по полю payload (BREAKDOWN);
+  w:{исход}:{волна}   — на какой волне закончилась партия.
+Приращения уходят тем же pipeline, что и RPUSH в лог, — без лишнего
+round-trip. Сводка читает по хешу на пару (сценарий, сложность) из
+справочника — её стоимость не зависит от числа партий и длины логов.
+
+Сценарий и сложность партии запоминаются из game_start и из загруженных
+состояний (remember); события партий, о которых процесс не знает,
+попадают в группу "unknown".
+"""
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+from app.services.catalog import get_catalog
+
+UNKNOWN = "unknown"
+KEY_PREFIX = "analytics:"
+
+# тип события -> поле payload, по значениям которого ведётся разбивка
+BREAKDOWN: Dict[str, str] = {
+    "shop_buy": "card",
+    "card_play": "card",
+    "treasure_open": "tier",
+    "monster_spawn": "hall",
+    "game_defeat": "tier",
+}
+
+# события конца партии -> исход (None — из payload["result"])
+GAME_END: Dict[str, Optional[str]] = {
+    "game_victory": "victory",
+    "game_defeat": None,
+}
+
+
+class AnalyticsService:
+    def __init__(self, maxsize: int = 100000):
+        self.maxsize = maxsize
+        self._dims: "OrderedDict[str, Tuple[str, str]]" = OrderedDict()
+
+    @staticmethod
+    def key(scenario: str, difficulty: str) -> str:
+        return f"{KEY_PREFIX}{scenario}:{difficulty}"
+
+    def remember(self, game_id: str, scenario: Optional[str], difficulty: Optional[str]):
+        """Запомнить сценарий и сложность партии (ключ группы её событий)."""
+        self._dims[game_id] = (scenario or UNKNOWN, difficulty or UNKNOWN)
+        self._dims.move_to_end(game_id)
+        if len(self._dims) > self.maxsize:
+            self._dims.popitem(last=False)
+
+    def dims(self, game_id: str) -> Tuple[str, str]:
+        return self._dims.get(game_id, (UNKNOWN, UNKNOWN))
+
+    @staticmethod
+    def fields(entry_type: str, payload) -> List[str]:
+        """Поля хеша, которые увеличивает одна запись лога."""
+        result = [f"e:{entry_type}"]
+        if not isinstance(payload, dict):
+            return result
+        name = BREAKDOWN.get(entry_type)
+        if name is not None and payload.get(name) is not None:
+            result.append(f"b:{entry_type}:{payload[name]}")
+        if entry_type in GAME_END and payload.get("wave") is not None:
+            outcome = GAME_END[entry_type] or payload.get("result") or UNKNOWN
+            result.append(f"w:{outcome}:{payload['wave']}")
+        return result
+
+    def increments(self, game_id: str, entries: Iterable[Tuple[str, dict]],
+                   into: Optional[Dict[str, Dict[str, int]]] = None) -> Dict[str, Dict[str, int]]:
+        """Записи лога партии -> {ключ хеша: {поле: приращение}} для RedisStorage.write_batch."""
+        into = {} if into is None else into
+        for entry_type, payload in entries:
+            if entry_type == "game_start" and isinstance(payload, dict):
+                self.remember(game_id, payload.get("scenario"), payload.get("difficulty"))
+            counters = into.setdefault(self.key(*self.dims(game_id)), {})
+            for field in self.fields(entry_type, payload):
+                counters[field] = counters.get(field, 0) + 1
+        return into
+
+    # ----------------------------
+    # Чтение сводки
+    # ----------------------------
+    @staticmethod
+    def groups(scenario: Optional[str] = None, difficulty: Optional[str] = None) -> List[Tuple[str, str]]:
+        """Пары (сценарий, сложность) из справочника, включая "unknown"."""
+        catalog = get_catalog()
+        scenarios = [scenario] if scenario else list(catalog.scenarios) + [UNKNOWN]
+        difficulties = [difficulty] if difficulty else list(catalog.difficulty_config) + [UNKNOWN]
+        return [(s, d) for s in scenarios for d in difficulties]
+
+    @staticmethod
+    def parse(fields: Dict[str, str]) -> dict:
+        """Поля хеша -> события, разбивки и распределение волн конца партии."""
+        events: Dict[str, int] = {}
+        breakdown: Dict[str, Dict[str, int]] = {}
+        waves: Dict[str, Dict[str, int]] = {}
+        for field, value in fields.items():
+            kind, _, rest = field.partition(":")
+            n = int(value)
+            if kind == "e":
+                events[rest] = n
+            elif kind == "b":
+                entry_type, _, label = rest.partition(":")
+                breakdown.setdefault(entry_type, {})[label] = n
+            elif kind == "w":
+                outcome, _, wave = rest.partition(":")
+                waves.setdefault(outcome, {})[wave] = n
+        return {
+            "events": dict(sorted(events.items())),
+            "breakdown": {t: dict(sorted(v.items(), key=lambda kv: -kv[1])) for t, v in sorted(breakdown.items())},
+            "waves": {
+                outcome: {
+                    "games": sum(hist.values()),
+                    "avg_waves": round(sum(int(w) * n for w, n in hist.items()) / max(1, sum(hist.values())), 3),
+                    "histogram": dict(sorted(hist.items(), key=lambda kv: int(kv[0]))),
+                }
+                for outcome, hist in sorted(waves.items())
+            },
+        }
+
+    async def summary(self, redis, scenario: Optional[str] = None, difficulty: Optional[str] = None) -> dict:
+        """Сводка по группам и итог по всем выбранным группам."""
+        groups = self.groups(scenario, difficulty)
+        hashes = await redis.hgetall_many([self.key(s, d) for s, d in groups])
+        result, total = [], {}
+        for (s, d), fields in zip(groups, hashes):
+            if not fields:
+                continue
+            result.append({"scenario": s, "difficulty": d, **self.parse(fields)})
+            for field, value in fields.items():
+                total[field] = total.get(field, 0) + int(value)
+        return {"groups": result, "total": self.parse(total)}
+
+
+analytics = AnalyticsService()
@@ -0,0 +1,188 @@
+"""
+Боты за монстров: занимают свободные места партии (fill_bots при создании).
+
+Перед волной героев (GameService.apply_next_wave) каждый бот планирует
+свой ход поиском Монте-Карло по дереву (UCT) над SimState: узлы дерева —
+розыгрыши карт в пределах хода, после "закончить ход" партия доигрывается
+случайно (волны героев и случайные ходы всех игроков) до конца.
+Ветви не копируют состояние — каждая итерация откатывается по журналу
+отмены SimState.
+
+Поиск ограничен временем BOT_TIME_BUDGET_MS и выполняется в пуле процессов
+(BOT_POOL=process, по умолчанию), event loop только ждёт результат. Пул
+потоков (BOT_POOL=thread) дешевле на передаче SimState, но поиск держит
+GIL, и весь бюджет времени event loop почти не получает. План хода
+применяется обычным RuleEngine.play_card — с проверками и записями лога;
+розыгрыш, ставший недопустимым (например, карта не пришла из колоды, как
+в симуляции), пропускается.
+"""
+import asyncio
+import math
+import multiprocessing
+import random
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from time import perf_counter
+from typing import Dict, List, Optional, Sequence, Tuple
+from app.common.config import BOT_POOL, BOT_TIME_BUDGET_MS, BOT_WORKERS
+from app.common.logger import direct_output, logger
+from app.common.metrics import BOT_DECISION_SECONDS, BOT_PLAYOUTS
+from app.common.tracing import traced
+from app.models import GameState
+from app.services.catalog import Catalog
+from app.services.sim_state import Action, SimState
+
+_DECISION_SECONDS = BOT_DECISION_SECONDS.labels()
+_PLAYOUTS = BOT_PLAYOUTS.labels()
+
+EXPLORATION = 0.7  # оценки в [0, 1]
+
+# розыгрыш для RuleEngine.play_card: (карта, вариант, id монстра, цели)
+PlannedPlay = Tuple[str, int, Optional[str], List[str]]
+
+
+class _Node:
+    __slots__ = ("children", "untried", "visits", "value")
+
+    def __init__(self):
+        self.children: Dict[Action, "_Node"] = {}
+        self.untried: Optional[List[Action]] = None  # действия строятся при первом заходе
+        self.visits = 0
+        self.value = 0.0
+
+
+def _uct(parent_visits: int):
+    log_n = math.log(parent_visits)
+
+    def score(item):
+        node = item[1]
+        return node.value / node.visits + EXPLORATION * math.sqrt(log_n / node.visits)
+    return score
+
+
+def rollout(sim: SimState, player: int, pending: Sequence[int], rng: random.Random, ended: bool) -> float:
+    """Доигрывание до конца партии случайными ходами."""
+    if not ended:
+        sim.random_turn(player, rng)
+    for p in pending:
+        sim.random_turn(p, rng)
+    while not sim.game_over:
+        sim.run_wave(rng)
+        if sim.game_over:
+            break
+        for p in sim.active_players():
+            sim.random_turn(p, rng)
+    return sim.score()
+
+
+def search(sim: SimState, player: int, pending: Sequence[int] = (), budget: float = 0.2,
+           seed: Optional[int] = None, max_iterations: Optional[int] = None) -> Tuple[List[Action], int]:
+    """
+    UCT-поиск хода игрока player. pending — боты, которые ходят после него
+    в этой же фазе. Возвращает (розыгрыши по порядку, число доигрываний).
+    """
+    rng = random.Random(seed)
+    root = _Node()
+    deadline = perf_counter() + budget
+    iterations = 0
+    while (max_iterations is None or iterations < max_iterations) and perf_counter() < deadline:
+        mark = sim.snapshot()
+        node, path, ended = root, [root], False
+        while True:
+            if node.untried is None:
+                node.untried = sim.actions(player)
+                node.untried.append(None)
+                rng.shuffle(node.untried)
+            if node.untried:
+                action = node.untried.pop()
+                child = node.children[action] = _Node()
+            else:
+                action, child = max(node.children.items(), key=_uct(node.visits))
+            path.append(child)
+            if action is None:
+                ended = True
+                break
+            sim.play(player, action)
+            if child.visits == 0:
+                break
+            node = child
+        reward = rollout(sim, player, pending, rng, ended)
+        for n in path:
+            n.visits += 1
+            n.value += reward
+        sim.undo(mark)
+        iterations += 1
+
+    plan: List[Action] = []
+    node = root
+    while node.children:
+        action, node = max(node.children.items(), key=lambda item: item[1].visits)
+        if action is None:
+            break
+        plan.append(action)
+    return plan, iterations
+
+
+def _plan_turn(sim: SimState, player: int, pending: Sequence[int], budget: float) -> Tuple[List[PlannedPlay], int]:
+    """Точка входа рабочего потока/процесса: план хода в виде аргументов play_card."""
+    plan, playouts = search(sim, player, pending, budget)
+    hall_ids = sim.rules.hall_ids
+    # id монстров, появившихся по ходу плана, получаются так же, как в движке
+    mon_ids = sim.mon_ids[:]
+    n = sim.player_monsters[player]
+    result = []
+    for card, option, m, target in plan:
+        monster_id = None
+        if m >= 0:
+            while m >= len(mon_ids):
+                n += 1
+                mon_ids.append(f"{sim.rules.player_ids[player]}_m{n}")
+            monster_id = mon_ids[m]
+        result.append((card, option, monster_id, [hall_ids[target]] if target >= 0 else []))
+    return result, playouts
+
+
+class BotService:
+    """Планирование ходов ботов вне event loop."""
+
+    def __init__(self, pool: str = BOT_POOL, workers: int = BOT_WORKERS, budget_ms: float = BOT_TIME_BUDGET_MS):
+        self.pool = pool
+        self.workers = workers
+        self.budget = budget_ms / 1000
+        self._executor: Optional[Executor] = None
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.pool == "process":
+                # spawn: в процессе есть фоновые потоки (логгер), fork с ними небезопасен.
+                # Пул создаётся при первом ходе бота — процессы без ботов его не запускают
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"),
+                                                     initializer=direct_output)
+            else:
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="bot")
+        return self._executor
+
+    @traced()
+    async def plan_turn(self, state: GameState, player_id: str, catalog: Catalog,
+                        pending_ids: Sequence[str] = ()) -> List[PlannedPlay]:
+        """План хода бота player_id; pending_ids — боты, которые ходят после него."""
+        sim = SimState.from_game(state, catalog)
+        players = {pid: i for i, pid in enumerate(sim.rules.player_ids)}
+        pending = [players[pid] for pid in pending_ids if pid in players]
+        start = perf_counter()
+        loop = asyncio.get_running_loop()
+        plan, playouts = await loop.run_in_executor(
+            self._get_executor(), _plan_turn, sim, players[player_id], pending, self.budget
+        )
+        _DECISION_SECONDS.observe(perf_counter() - start)
+        _PLAYOUTS.observe(playouts)
+        logger.debug("[Bots] %s: %s planned %d plays after %d playouts", state.id, player_id, len(plan), playouts,
+                     extra={"game_id": state.id, "event": "bot_plan"})
+        return plan
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+bot_service = BotService()
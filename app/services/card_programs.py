@@ -0,0 +1,323 @@
+"""
+Действия карт монстров и магазина: компиляция и исполнение.
+
+В данных действия карты — список вариантов розыгрыша, каждый вариант —
+список шагов {"kind": ..., "params": {...}}. Игрок выбирает один вариант
+и выполняет его шаги по порядку. Встречаются и отклонения от этой формы:
+плоский список шагов (один вариант) и лишний уровень вложенности внутри
+варианта — компилятор приводит их к общей форме.
+
+При загрузке справочника каждая карта компилируется в программу:
+кортеж вариантов, вариант — кортеж инструкций (опкод, аргумент).
+Неизвестный kind, лишние или недостающие параметры, ссылки на
+несуществующие залы и классы — CardCompileError при загрузке, а не
+посреди партии. Розыгрыш — проход по кортежу с вызовом обработчика
+по индексу опкода.
+
+Шаги, требующие цели (перемещение, атака), берут её из targets, если она
+допустима, иначе выбирают детерминированно (первый подходящий зал,
+самый слабый герой) или пропускаются — программа не падает на середине.
+"""
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+from app.models import GameState, Hall, Hero, Monster, Player
+
+# ----------------------------
+# Опкоды
+# ----------------------------
+(
+    OP_MOVE,
+    OP_ATTACK,
+    OP_RANGE_ATTACK,
+    OP_ALL_MOVE,
+    OP_ALL_ATTACK,
+    OP_ALL_RANGE_ATTACK,
+    OP_ACTION,
+    OP_DEFENSE,
+    OP_SPAWN,
+    OP_TAKE_CARD,
+    OP_VIEW_TAKE_CARD,
+    OP_CREATE_TRAP,
+    OP_CREATE_PORTAL,
+) = range(13)
+
+Instruction = Tuple[int, Optional[str]]
+Program = Tuple[Tuple[Instruction, ...], ...]
+
+# kind -> (опкод, параметр-аргумент или None, обязателен ли он)
+KINDS: Dict[str, Tuple[int, Optional[str], bool]] = {
+    "move": (OP_MOVE, None, False),
+    "attack": (OP_ATTACK, None, False),
+    "range_attack": (OP_RANGE_ATTACK, None, False),
+    "all_move": (OP_ALL_MOVE, None, False),
+    "all_attack": (OP_ALL_ATTACK, None, False),
+    "all_range_attack": (OP_ALL_RANGE_ATTACK, None, False),
+    "action": (OP_ACTION, None, False),
+    "defense": (OP_DEFENSE, "kind", False),
+    "spawn": (OP_SPAWN, "hall", True),
+    "take_card": (OP_TAKE_CARD, None, False),
+    "view_take_card": (OP_VIEW_TAKE_CARD, "value", True),
+    "create_trap": (OP_CREATE_TRAP, None, False),
+    "create_portal": (OP_CREATE_PORTAL, None, False),
+}
+OPCODE_NAMES: Tuple[str, ...] = tuple(sorted(KINDS, key=lambda k: KINDS[k][0]))
+
+
+class CardCompileError(ValueError):
+    """Действия карты не соответствуют формату."""
+
+
+# ----------------------------
+# Компилятор
+# ----------------------------
+def _flatten_steps(card_id: str, items: Sequence, path: str) -> List[Tuple[str, Any]]:
+    """Шаги варианта с путями для сообщений об ошибках; лишняя вложенность раскрывается."""
+    steps = []
+    for i, item in enumerate(items):
+        where = f"{path}[{i}]"
+        if isinstance(item, dict):
+            steps.append((where, item))
+        elif isinstance(item, list):
+            steps.extend(_flatten_steps(card_id, item, where))
+        else:
+            raise CardCompileError(f"Card '{card_id}': {where} must be an object, got {type(item).__name__}")
+    return steps
+
+
+def _compile_step(card_id: str, where: str, step: dict, allowed_args: Dict[str, Set[str]]) -> Instruction:
+    kind = step.get("kind")
+    spec = KINDS.get(kind)
+    if spec is None:
+        raise CardCompileError(f"Card '{card_id}': {where} has unknown kind '{kind}'")
+    extra = set(step) - {"kind", "params"}
+    if extra:
+        raise CardCompileError(f"Card '{card_id}': {where} has unexpected keys {sorted(extra)}")
+
+    opcode, arg_name, required = spec
+    params = step.get("params") or {}
+    if not isinstance(params, dict):
+        raise CardCompileError(f"Card '{card_id}': {where}.params must be an object")
+    unknown = set(params) - ({arg_name} if arg_name else set())
+    if unknown:
+        raise CardCompileError(f"Card '{card_id}': {where} ({kind}) does not take params {sorted(unknown)}")
+
+    arg = params.get(arg_name) if arg_name else None
+    if arg is None:
+        if required:
+            raise CardCompileError(f"Card '{card_id}': {where} ({kind}) requires params.{arg_name}")
+        return (opcode, None)
+    if not isinstance(arg, str):
+        raise CardCompileError(f"Card '{card_id}': {where} ({kind}) params.{arg_name} must be a string")
+    allowed = allowed_args.get(kind)
+    if allowed is not None and arg not in allowed:
+        raise CardCompileError(f"Card '{card_id}': {where} ({kind}) refers to unknown {arg_name} '{arg}'")
+    return (opcode, arg)
+
+
+def compile_card(card_id: str, actions: Any, allowed_args: Optional[Dict[str, Set[str]]] = None) -> Program:
+    """
+    Действия одной карты -> программа.
+    allowed_args: kind -> допустимые значения аргумента (залы появления, классы карт и т.п.).
+    """
+    allowed_args = allowed_args or {}
+    if not isinstance(actions, list) or not actions:
+        raise CardCompileError(f"Card '{card_id}': actions must be a non-empty list")
+    # плоский список шагов — один вариант
+    options = [actions] if all(isinstance(a, dict) for a in actions) else actions
+
+    program = []
+    for i, option in enumerate(options):
+        where = f"actions[{i}]"
+        if isinstance(option, dict):
+            option = [option]
+        if not isinstance(option, list):
+            raise CardCompileError(f"Card '{card_id}': {where} must be a list of steps")
+        steps = _flatten_steps(card_id, option, where)
+        if not steps:
+            raise CardCompileError(f"Card '{card_id}': {where} has no steps")
+        program.append(tuple(_compile_step(card_id, w, s, allowed_args) for w, s in steps))
+    return tuple(program)
+
+
+def compile_cards(cards: Iterable[Dict[str, Any]], allowed_args: Optional[Dict[str, Set[str]]] = None) -> Dict[str, Program]:
+    """Компиляция всех карт справочника: id -> программа. Дубликаты id — ошибка."""
+    programs: Dict[str, Program] = {}
+    for card in cards:
+        card_id = card.get("id")
+        if card_id in programs:
+            raise CardCompileError(f"Duplicate card id '{card_id}'")
+        programs[card_id] = compile_card(card_id, card.get("actions"), allowed_args)
+    return programs
+
+
+# ----------------------------
+# Интерпретатор
+# ----------------------------
+class PlayContext:
+    """Всё, что нужно обработчикам опкодов во время одного розыгрыша."""
+
+    __slots__ = ("state", "player", "monster", "halls", "targets", "entries", "catalog")
+
+    def __init__(self, state: GameState, player: Player, monster: Optional[Monster], targets: Sequence[str], catalog):
+        self.state = state
+        self.player = player
+        self.monster = monster
+        self.halls: Dict[str, Hall] = {h.id: h for h in state.halls}
+        self.targets = list(reversed(targets))  # pop() с конца — следующая цель
+        self.entries: List[Tuple[str, dict]] = []
+        self.catalog = catalog
+
+    def next_target(self) -> Optional[str]:
+        return self.targets.pop() if self.targets else None
+
+    def own_monsters(self) -> List[Monster]:
+        return [m for m in self.state.monsters if m.owner_id == self.player.id]
+
+
+def _heroes_in(state: GameState, hall_ids: Iterable[str]) -> List[Hero]:
+    ids = set(hall_ids)
+    return [h for h in state.heroes if h.location in ids]
+
+
+def _damage(ctx: PlayContext, hero: Hero, source: str):
+    hero.hp -= 1
+    ctx.entries.append(("monster_attack", {"monster": ctx.monster.id, "hero": hero.name, "kind": source, "hp": hero.hp}))
+    if hero.hp <= 0:
+        ctx.state.heroes.remove(hero)
+        ctx.entries.append(("hero_defeated", {"hero": hero.name, "hall": hero.location}))
+
+
+def _op_move(ctx: PlayContext, arg):
+    monster = ctx.monster
+    target = ctx.next_target()
+    if monster is None:
+        return
+    hall = ctx.halls.get(monster.location)
+    connections = (hall.connections or []) if hall else []
+    if target not in connections:
+        # без допустимой цели — к первому соседнему залу с героями
+        target = next((c for c in connections if _heroes_in(ctx.state, [c])), None)
+    if target is None:
+        return
+    ctx.entries.append(("monster_move", {"monster": monster.id, "from": monster.location, "to": target}))
+    monster.location = target
+
+
+def _op_attack(ctx: PlayContext, arg):
+    if ctx.monster is None:
+        return
+    heroes = _heroes_in(ctx.state, [ctx.monster.location])
+    if heroes:
+        _damage(ctx, min(heroes, key=lambda h: h.hp), "attack")
+
+
+def _op_range_attack(ctx: PlayContext, arg):
+    if ctx.monster is None:
+        return
+    hall = ctx.halls.get(ctx.monster.location)
+    heroes = _heroes_in(ctx.state, hall.connections or []) if hall else []
+    if heroes:
+        _damage(ctx, min(heroes, key=lambda h: h.hp), "range_attack")
+
+
+def _for_each_monster(handler: Callable[[PlayContext, Any], None]):
+    def run(ctx: PlayContext, arg):
+        acting = ctx.monster
+        for monster in ctx.own_monsters():
+            ctx.monster = monster
+            handler(ctx, arg)
+        ctx.monster = acting
+    return run
+
+
+def _op_action(ctx: PlayContext, arg):
+    hall = ctx.halls.get(ctx.monster.location) if ctx.monster else None
+    if hall and hall.action and hall.action != "none":
+        ctx.entries.append(("hall_action", {"player": ctx.player.id, "hall": hall.id, "action": hall.action}))
+
+
+def _op_defense(ctx: PlayContext, arg):
+    key = f"defense:{arg}" if arg else "defense"
+    ctx.player.resources[key] = ctx.player.resources.get(key, 0) + 1
+    ctx.entries.append(("monster_defense", {"player": ctx.player.id, "kind": arg}))
+
+
+def _op_spawn(ctx: PlayContext, tag):
+    cls = ctx.catalog.monster_classes_by_id.get(ctx.player.monster_class)
+    if cls is None:
+        return
+    own = ctx.own_monsters()
+    if len(own) >= int(cls.get("max_count", 1)):
+        return
+    hall = next((h for h in ctx.state.halls if h.spawn == tag), None)
+    if hall is None:
+        return
+    n = len(ctx.player.monsters) + 1
+    monster = Monster(
+        id=f"{ctx.player.id}_m{n}", class_id=cls["class"], owner_id=ctx.player.id,
+        hp=int(cls.get("hp", 1)), location=hall.id,
+    )
+    ctx.state.monsters.append(monster)
+    ctx.player.monsters.append(monster.id)
+    if ctx.monster is None:
+        ctx.monster = monster
+    ctx.entries.append(("monster_spawn", {"monster": monster.id, "hall": hall.id}))
+
+
+def _op_take_card(ctx: PlayContext, arg):
+    card = ctx.player.draw_card()
+    if card:
+        ctx.entries.append(("card_draw", {"player": ctx.player.id}))
+
+
+def _op_view_take_card(ctx: PlayContext, value):
+    """Взять из колоды магазина первую карту класса value (или с действием value)."""
+    deck = ctx.state.shop_deck or []
+    cards = ctx.catalog.shop_cards_by_id
+    programs = ctx.catalog.card_programs
+    opcode = KINDS[value][0] if value in KINDS else None
+    for i in range(len(deck) - 1, -1, -1):
+        card_id = deck[i]
+        card = cards.get(card_id) or {}
+        if card.get("class_id") == value or (
+            opcode is not None and any(op == opcode for option in programs.get(card_id, ()) for op, _ in option)
+        ):
+            deck.pop(i)
+            ctx.player.hand.append(card_id)
+            ctx.entries.append(("card_take", {"player": ctx.player.id, "card": card_id}))
+            return
+
+
+def _place_token(token: str):
+    def run(ctx: PlayContext, arg):
+        hall = ctx.halls.get(ctx.monster.location) if ctx.monster else None
+        if hall is not None:
+            hall.tokens.append(token)
+            ctx.entries.append(("token_placed", {"hall": hall.id, "token": token}))
+    return run
+
+
+# индекс — опкод
+OP_HANDLERS: Tuple[Callable[[PlayContext, Any], None], ...] = (
+    _op_move,
+    _op_attack,
+    _op_range_attack,
+    _for_each_monster(_op_move),
+    _for_each_monster(_op_attack),
+    _for_each_monster(_op_range_attack),
+    _op_action,
+    _op_defense,
+    _op_spawn,
+    _op_take_card,
+    _op_view_take_card,
+    _place_token("trap"),
+    _place_token("closed_portal"),
+)
+assert len(OP_HANDLERS) == len(KINDS)
+
+
+def run_program(ctx: PlayContext, program: Program, option: int) -> List[Tuple[str, dict]]:
+    """Выполнить вариант option программы; возвращает записи лога."""
+    handlers = OP_HANDLERS
+    for opcode, arg in program[option]:
+        handlers[opcode](ctx, arg)
+    return ctx.entries
@@ -0,0 +1,113 @@
+import hashlib
+import json
+from typing import Any, Dict, List, Optional
+from app.common.logger import logger
+from app.models import ShopCard
+from app.services.card_programs import KINDS, Program, compile_cards
+from app.services.data_loader import DataLoader
+from app.services.effects import CompiledEffect, compile_effects
+
+
+class Catalog:
+    """
+    Справочник игровых данных, загружаемый один раз на процесс.
+
+    Всё, что не меняется от партии к партии (залы, герои, монстры,
+    карты магазина, эффекты сокровищ), читается с диска и проверяется
+    здесь, а сервисы получают уже готовые структуры.
+    """
+
+    def __init__(self, loader: Optional[DataLoader] = None):
+        self.loader = loader or DataLoader()
+        self.loader.load_all()
+
+        self.halls: List[Dict[str, Any]] = self.loader.halls
+        self.heroes: List[Dict[str, Any]] = self.loader.heroes
+        self.monster_classes: List[Dict[str, Any]] = self.loader.monster_classes
+        self.monster_decks: List[Dict[str, Any]] = self.loader.monster_decks
+        self.shop_cards: List[Dict[str, Any]] = self.loader.shop_cards
+        self.difficulty_config: Dict[str, Any] = self.loader.difficulty_config
+        self.treasure_effects: Dict[str, List[str]] = self.loader.treasure_effects
+
+        self.halls_by_id: Dict[str, Dict[str, Any]] = {h["id"]: h for h in self.halls}
+        self.monster_classes_by_id: Dict[str, Dict[str, Any]] = {mc["class"]: mc for mc in self.monster_classes}
+
+        # карты магазина проверяются через pydantic один раз, дальше — только id
+        self.shop_cards_by_id: Dict[str, Dict[str, Any]] = {}
+        for data in self.shop_cards:
+            card = ShopCard(**data)
+            if card.id in self.shop_cards_by_id:
+                raise ValueError(f"Duplicate shop card id '{card.id}'")
+            self.shop_cards_by_id[card.id] = card.model_dump()
+
+        # имя эффекта -> (обработчик, параметры)
+        self.effects: Dict[str, CompiledEffect] = compile_effects(
+            self.loader.effect_defs, self.treasure_effects
+        )
+
+        # действия карт монстров и магазина компилируются один раз; ошибки формата — здесь
+        self.card_programs: Dict[str, Program] = compile_cards(
+            self.monster_decks + self.shop_cards,
+            {
+                "spawn": {h["spawn"] for h in self.halls if h.get("spawn")},
+                "view_take_card": {c["class"] for c in self.shop_cards} | set(KINDS),
+                "defense": set(KINDS),
+            },
+        )
+
+        # все сценарии из data/scenario читаются сразу и входят в версию справочника
+        self._scenarios: Dict[str, Dict[str, Any]] = {
+            path.stem: self.loader._load_json(f"scenario/{path.name}")
+            for path in sorted((self.loader.base_path / "scenario").glob("*.json"))
+        }
+        self.version = self._compute_version()
+        logger.info(f"[Catalog] Loaded catalog version {self.version}")
+
+    def _compute_version(self) -> str:
+        payload = json.dumps(
+            [
+                self.halls,
+                self.heroes,
+                self.monster_classes,
+                self.monster_decks,
+                self.shop_cards,
+                self.difficulty_config,
+                self.treasure_effects,
+                self.loader.effect_defs,
+                self._scenarios,
+            ],
+            sort_keys=True,
+            ensure_ascii=False,
+        )
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:12]
+
+    @property
+    def scenarios(self) -> Dict[str, Dict[str, Any]]:
+        return self._scenarios
+
+    def get_scenario(self, scenario_id: str) -> Dict[str, Any]:
+        """Сценарий по id (читается с диска один раз)."""
+        scenario = self._scenarios.get(scenario_id)
+        if scenario is None:
+            scenario = self.loader.load_scenario(scenario_id)
+            self._scenarios[scenario_id] = scenario
+        return scenario
+
+    def get_shop_card(self, card_id: str) -> Optional[Dict[str, Any]]:
+        return self.shop_cards_by_id.get(card_id)
+
+    def get_card_program(self, card_id: str) -> Optional[Program]:
+        return self.card_programs.get(card_id)
+
+    def get_treasure_effects(self, tier) -> List[str]:
+        return self.treasure_effects.get(str(tier), [])
+
+
+_catalog: Optional[Catalog] = None
+
+
+def get_catalog() -> Catalog:
+    global _catalog
+    if _catalog is None:
+        _catalog = Catalog()
+    return _catalog
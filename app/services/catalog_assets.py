@@ -0,0 +1,74 @@
+import gzip
+import json
+from typing import Any, Dict, Optional
+from app.common.http_cache import make_etag
+from app.common.logger import logger
+from app.services.catalog import Catalog, get_catalog
+
+try:
+    import brotli
+except ImportError:  # brotli — необязательная зависимость
+    brotli = None
+
+
+class CatalogAsset:
+    """Один ресурс справочника, закодированный заранее во всех поддерживаемых вариантах."""
+
+    def __init__(self, data: Any):
+        self.identity = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        self.etag = make_etag(self.identity)
+        self.encoded: Dict[str, bytes] = {"gzip": gzip.compress(self.identity, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            self.encoded["br"] = brotli.compress(self.identity, quality=11)
+
+    def negotiate(self, accept_encoding: Optional[str]):
+        """Выбор кодировки по Accept-Encoding: br, затем gzip, иначе без сжатия."""
+        accepted = set()
+        for part in (accept_encoding or "").split(","):
+            name, _, params = part.partition(";")
+            q = params.strip()
+            if q.startswith("q="):
+                try:
+                    if float(q[2:]) <= 0:
+                        continue
+                except ValueError:
+                    continue
+            accepted.add(name.strip().lower())
+        for encoding in ("br", "gzip"):
+            if encoding in accepted and encoding in self.encoded:
+                return encoding, self.encoded[encoding], self.etag[:-1] + f'-{encoding}"'
+        return None, self.identity, self.etag
+
+
+class CatalogAssets:
+    """
+    Публичные ресурсы справочника (залы, герои, монстры, карты магазина, сценарии),
+    сериализованные и сжатые один раз на версию справочника.
+    """
+
+    def __init__(self, catalog: Optional[Catalog] = None):
+        self.catalog = catalog or get_catalog()
+        self.version = self.catalog.version
+        sources = {
+            "halls": self.catalog.halls,
+            "heroes": self.catalog.heroes,
+            "monster_classes": self.catalog.monster_classes,
+            "monster_decks": self.catalog.monster_decks,
+            "shop_cards": list(self.catalog.shop_cards_by_id.values()),
+            "scenarios": self.catalog.scenarios,
+        }
+        self.assets: Dict[str, CatalogAsset] = {name: CatalogAsset(data) for name, data in sources.items()}
+        logger.info(f"[Catalog] Encoded {len(self.assets)} catalog assets for version {self.version}")
+
+    def get(self, name: str) -> Optional[CatalogAsset]:
+        return self.assets.get(name)
+
+
+_assets: Optional[CatalogAssets] = None
+
+
+def get_catalog_assets() -> CatalogAssets:
+    global _assets
+    if _assets is None or _assets.version != get_catalog().version:
+        _assets = CatalogAssets()
+    return _assets
@@ -30,6 +30,7 @@ class DataLoader:
         # Конфигурации
         self.difficulty_config: Dict[str, Any] = {}
         self.treasure_effects: Dict[str, Any] = {}
+        self.effect_defs: Dict[str, Any] = {}
 
         # Активный сценарий
         self.scenario: Dict[str, Any] = {}
@@ -41,7 +42,7 @@ class DataLoader:
         p = self.base_path / rel
         with open(p, "r", encoding="utf-8") as f:
             data = json.load(f)
-        logger.debug(f"[DataLoader] loaded {rel}")
+        logger.debug("[DataLoader] loaded %s", rel)
         return data
 
     def load_all(self):
@@ -53,6 +54,7 @@ class DataLoader:
         self.shop_cards = self._load_json("shop_cards.json")
         self.difficulty_config = self._load_json("config/difficulty.json")
         self.treasure_effects = self._load_json("config/treasure_effects.json")
+        self.effect_defs = self._load_json("config/effects.json")
 
     def load_scenario(self, scenario_id: str):
         """Загружает один сценарий."""
@@ -118,8 +120,7 @@ class DataLoader:
             # num_effects = random.randint(1, min(3, len(effects_all)))
             # effects = random.sample(effects_all, k=num_effects)
             effects = random.sample(effects_all, k=min(1, len(effects_all)))
-            logger.debug(f"[Treasure] base_tid={base_tid} effects_all={effects_all}")
-            logger.debug(f"[Treasure] chosen effects={effects}")
+            logger.debug("[Treasure] base_tid=%s effects_all=%s chosen=%s", base_tid, effects_all, effects, extra={"event": "treasure_roll"})
 
             treasures_list.append({
                 "id": tid,
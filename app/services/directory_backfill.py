@@ -0,0 +1,82 @@
+"""
+Заполнение каталога партий (game_directory) по уже сохранённым состояниям.
+
+    python -m app.services.directory_backfill [--batch 500] [--all] [--dry-run]
+
+Партии, созданные до появления каталога, в нём не числятся: их не видно
+в GET /game и их не убирает sweeper. Скрипт обходит ключи game:* через
+SCAN, читает состояния пачками по --batch и добавляет в каталог те, которых
+там ещё нет (--all — переписать описания всех партий). Время последней
+активности таких партий неизвестно и считается равным времени прогона,
+поэтому уборка не удалит их сразу после заполнения.
+
+Повторный прогон безопасен: уже записанные партии пропускаются.
+"""
+import argparse
+import asyncio
+import sys
+from typing import List, Tuple
+from app.common.logger import logger
+from app.common.redis_manager import RedisStorage
+from app.services.game_directory import META_KEY, GameDirectory
+from app.services.game_service import GameService
+
+
+async def _flush(storage: RedisStorage, service: GameService, directory: GameDirectory, ids: List[str],
+                 rewrite: bool, dry_run: bool) -> Tuple[int, int]:
+    """Добавить пачку партий; возвращает (добавлено, пропущено из-за ошибок)."""
+    if not rewrite:
+        metas = await storage.hmget(META_KEY, ids)
+        ids = [game_id for game_id, meta in zip(ids, metas) if meta is None]
+    raws = await storage.get_raw_many([f"game:{game_id}" for game_id in ids])
+    states, failed = [], 0
+    for game_id, raw in zip(ids, raws):
+        if not raw:
+            continue
+        try:
+            states.append(await service.parse_state(raw))
+        except Exception as e:
+            logger.warning(f"[DirectoryBackfill] Skipping game {game_id}: {e}")
+            failed += 1
+    if states and not dry_run:
+        await directory.update_many(storage, states)
+    return len(states), failed
+
+
+async def backfill(storage: RedisStorage, batch: int = 500, rewrite: bool = False, dry_run: bool = False) -> Tuple[int, int]:
+    """Обойти game:* и заполнить каталог; возвращает (добавлено партий, ошибок)."""
+    service = GameService(storage)
+    directory = GameDirectory()
+    added = failed = 0
+    ids: List[str] = []
+    async for key in storage.scan_keys("game:*", batch):
+        game_id = key[len("game:"):]
+        # game:{id}:log, game:{id}:owner — не состояния
+        if game_id.endswith((":log", ":owner")):
+            continue
+        ids.append(game_id)
+        if len(ids) >= batch:
+            a, f = await _flush(storage, service, directory, ids, rewrite, dry_run)
+            added, failed, ids = added + a, failed + f, []
+    if ids:
+        a, f = await _flush(storage, service, directory, ids, rewrite, dry_run)
+        added, failed = added + a, failed + f
+    return added, failed
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch", type=int, default=500, help="партий на одно чтение и одну запись")
+    parser.add_argument("--all", action="store_true", help="переписать описания и уже известных каталогу партий")
+    parser.add_argument("--dry-run", action="store_true", help="только прочитать состояния, ничего не записывать")
+    parser.add_argument("--redis-url", help="по умолчанию REDIS_URL")
+    args = parser.parse_args()
+
+    storage = RedisStorage(args.redis_url)
+    added, failed = asyncio.run(backfill(storage, args.batch, args.all, args.dry_run))
+    print(f"Indexed {added} game(s), {failed} unreadable")
+    return 0 if not failed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
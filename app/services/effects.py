@@ -0,0 +1,101 @@
+from typing import Any, Callable, Dict, List, Tuple
+from app.models import GameState
+
+
+# Обработчик эффекта: (state, params) -> список payload'ов для записей лога
+EffectHandler = Callable[[GameState, Dict[str, Any]], List[Dict[str, Any]]]
+
+# Скомпилированный эффект: (обработчик, параметры из данных)
+CompiledEffect = Tuple[EffectHandler, Dict[str, Any]]
+
+EFFECT_HANDLERS: Dict[str, EffectHandler] = {}
+
+
+def effect_handler(name: str):
+    """Регистрирует функцию как обработчик эффекта под именем `name`."""
+    def decorator(fn: EffectHandler) -> EffectHandler:
+        if name in EFFECT_HANDLERS:
+            raise ValueError(f"Effect handler '{name}' is already registered")
+        EFFECT_HANDLERS[name] = fn
+        return fn
+    return decorator
+
+
+def compile_effects(effect_defs: Dict[str, Any], treasure_effects: Dict[str, List[str]]) -> Dict[str, CompiledEffect]:
+    """
+    Превращает описания эффектов из config/effects.json в таблицу
+    имя эффекта -> (обработчик, параметры).
+
+    Ошибки данных (неизвестный обработчик, эффект сокровища без описания)
+    выявляются здесь, при загрузке справочника, а не посреди партии.
+    """
+    table: Dict[str, CompiledEffect] = {}
+    for name, spec in effect_defs.items():
+        handler_name = spec.get("handler")
+        handler = EFFECT_HANDLERS.get(handler_name)
+        if handler is None:
+            raise ValueError(f"Effect '{name}' refers to unknown handler '{handler_name}'")
+        table[name] = (handler, dict(spec.get("params") or {}))
+
+    for tier, names in treasure_effects.items():
+        for name in names:
+            if name not in table:
+                raise ValueError(f"Treasure tier {tier} refers to undeclared effect '{name}'")
+    return table
+
+
+# ----------------------------
+# Встроенные обработчики
+# ----------------------------
+@effect_handler("noop")
+def _noop(state: GameState, params: Dict[str, Any]):
+    return []
+
+
+@effect_handler("take_resource")
+def _take_resource(state: GameState, params: Dict[str, Any]):
+    resource = params.get("resource", "gold")
+    amount = int(params.get("amount", 1))
+    for p in state.players:
+        have = p.resources.get(resource, 0)
+        if have > 0:
+            p.resources[resource] = max(0, have - amount)
+    return [{}]
+
+
+@effect_handler("discard_first_card")
+def _discard_first_card(state: GameState, params: Dict[str, Any]):
+    entries = []
+    for p in state.players:
+        if p.hand:
+            discarded = p.hand.pop(0)
+            entries.append({"player": p.name, "card": discarded})
+    return entries
+
+
+@effect_handler("heal_heroes")
+def _heal_heroes(state: GameState, params: Dict[str, Any]):
+    amount = int(params.get("amount", 2))
+    for h in state.heroes:
+        h.hp += amount
+    return [{}]
+
+
+@effect_handler("capture_hero")
+def _capture_hero(state: GameState, params: Dict[str, Any]):
+    # первый герой (если есть) попадает в тюрьму
+    if state.heroes:
+        state.heroes.pop(0)
+        hall_id = params.get("hall", "prison")
+        prison = next((x for x in state.halls if x.id == hall_id), None)
+        if prison:
+            prison.tokens.append(params.get("token", "prisoner"))
+    return [{}]
+
+
+@effect_handler("end_game")
+def _end_game(state: GameState, params: Dict[str, Any]):
+    result = params.get("result", "defeat")
+    state.game_over = True
+    state.result = result
+    return [{"result": result}]
@@ -0,0 +1,400 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional
+from app.common.config import GAME_ACTOR_IDLE_TIMEOUT, GAME_ACTOR_MAX_BATCH, GAME_LEASES, NODE_ID
+from app.common.logger import logger
+from app.common.metrics import Gauge
+from app.common import tracing
+from app.models import GameState
+from app.services.game_directory import game_directory
+from app.services.game_lease import GameLeaseManager, GameOwnedElsewhere, LeaseLost
+from app.services.game_service import GameService
+
+
+# ----------------------------
+# Команды актора: (service, state, *args) -> результат для вызывающего
+# ----------------------------
+async def _cmd_end_turn(service: GameService, state: GameState):
+    await service.apply_next_wave(state)
+    return service.to_response(state)
+
+
+async def _cmd_open_treasure(service: GameService, state: GameState, tier: str):
+    await service.rule_engine.apply_treasure_effect(state, tier)
+    return {"status": "ok"}
+
+
+async def _cmd_shop_buy(service: GameService, state: GameState, card_id: str, player_id: Optional[str] = None):
+    await service.apply_shop_buy(state, card_id, player_id)
+    return {"status": "ok", "shop_display": service.shop.expand_display(state.shop_display)}
+
+
+async def _cmd_play_card(service: GameService, state: GameState, card_id: str, player_id: Optional[str] = None,
+                         option: int = 0, monster_id: Optional[str] = None, targets=()):
+    entries = await service.apply_play_card(state, card_id, player_id, option, monster_id, targets)
+    return {"status": "ok", "events": [{"type": t, "payload": p} for t, p in entries]}
+
+
+async def _cmd_draw_card(service: GameService, state: GameState, player_id: Optional[str] = None):
+    card = await service.apply_draw_card(state, player_id)
+    return {"status": "ok", "card": card}
+
+
+async def _cmd_mark_treasure(service: GameService, state: GameState, treasure_id: str, hero: Optional[str] = None):
+    return await service.apply_mark_treasure(state, treasure_id, hero)
+
+
+COMMANDS: Dict[str, Callable[..., Awaitable[Any]]] = {
+    "end_turn": _cmd_end_turn,
+    "open_treasure": _cmd_open_treasure,
+    "shop_buy": _cmd_shop_buy,
+    "play_card": _cmd_play_card,
+    "draw_card": _cmd_draw_card,
+    "mark_treasure": _cmd_mark_treasure,
+}
+
+# Команды, которые актор без загруженного состояния выполняет скриптом в Redis
+# (app/services/game_scripts.py): (service, game_id, *args, owner=...) -> результат,
+# None — партии нет, NotImplemented — скрипт неприменим, нужен обычный путь.
+SCRIPTED: Dict[str, Callable[..., Awaitable[Any]]] = {
+    "draw_card": GameService.try_draw_card,
+    "mark_treasure": GameService.try_mark_treasure,
+}
+
+_STOP = object()
+
+
+class GameActor:
+    """
+    Владелец одной партии в памяти процесса.
+
+    Команды попадают в очередь и применяются строго по порядку; всё, что
+    накопилось в очереди, применяется пачкой и сохраняется в Redis один раз —
+    вместе с записями лога пачки, одним pipeline (или скриптом при аренде).
+    Состояние читается из Redis только при запуске актора. После
+    idle_timeout секунд без команд актор завершается.
+
+    Пока состояние не загружено, команды из SCRIPTED выполняются скриптом
+    в Redis по одной, без чтения и записи всего состояния.
+
+    Если включена аренда партий (GAME_LEASES), актор существует только
+    пока узел владеет партией: запись идёт через проверку владельца,
+    а при остановке аренда освобождается.
+    """
+
+    def __init__(self, game_id: str, service: GameService, registry: "GameActorRegistry",
+                 idle_timeout: float = GAME_ACTOR_IDLE_TIMEOUT, max_batch: int = GAME_ACTOR_MAX_BATCH):
+        self.game_id = game_id
+        self.service = service
+        self.registry = registry
+        self.idle_timeout = idle_timeout
+        self.max_batch = max_batch
+        self.state: Optional[GameState] = None
+        self.closed = False
+        self.lease_lost = False
+        self.mailbox: asyncio.Queue = asyncio.Queue()
+        self.task = asyncio.create_task(self._run(), name=f"game-actor:{game_id}")
+
+    async def call(self, command: str, *args):
+        fut = asyncio.get_running_loop().create_future()
+        # трассировка запроса продолжается в задаче актора
+        self.mailbox.put_nowait((command, args, fut, tracing.current()))
+        return await fut
+
+    def stop(self):
+        self.mailbox.put_nowait(_STOP)
+
+    async def _run(self):
+        try:
+            while True:
+                try:
+                    first = await asyncio.wait_for(self.mailbox.get(), self.idle_timeout)
+                except asyncio.TimeoutError:
+                    if self.mailbox.empty():
+                        break
+                    continue
+                if first is _STOP:
+                    break
+
+                batch = [first]
+                while len(batch) < self.max_batch and not self.mailbox.empty():
+                    item = self.mailbox.get_nowait()
+                    if item is _STOP:
+                        self.mailbox.put_nowait(_STOP)
+                        break
+                    batch.append(item)
+                await self._process(batch)
+        finally:
+            self.closed = True
+            self.registry._remove(self)
+            leases = self.registry.leases
+            if leases and not self.lease_lost:
+                try:
+                    await leases.release(self.service.redis, self.game_id)
+                except Exception:
+                    logger.exception(f"[GameActor] {self.game_id}: failed to release lease")
+            # команды, пришедшие после остановки, передаются новому актору
+            while not self.mailbox.empty():
+                item = self.mailbox.get_nowait()
+                if item is not _STOP:
+                    command, args, fut, traces = item
+                    if not fut.done():
+                        with tracing.activate(*traces):
+                            asyncio.create_task(self.registry._forward(self.service.redis, self.game_id, command, args, fut))
+            logger.debug("[GameActor] %s stopped", self.game_id, extra={"game_id": self.game_id, "event": "actor_stopped"})
+
+    @tracing.traced()
+    async def _save(self):
+        pushes, increments = self.service.log_service.take_pending()
+        leases = self.registry.leases
+        if leases:
+            await leases.save(self.service.redis, self.game_id, self.service.serialize_state(self.state),
+                              pushes, increments)
+            await game_directory.update(self.service.redis, self.state)
+        else:
+            await self.service.save_state(self.game_id, self.state, pushes, increments)
+
+    async def _process(self, batch):
+        # загрузка и сохранение общие для пачки — попадают во все её трассировки
+        batch_traces = tuple(dict.fromkeys(t for *_, traces in batch for t in traces))
+        with tracing.activate(*batch_traces):
+            await self._process_batch(batch)
+
+    def _fail_lease(self, batch, error: LeaseLost):
+        # партию забрал другой узел — состояние в памяти больше не наше
+        logger.warning(f"[GameActor] {self.game_id}: {error}")
+        self.state = None
+        self.lease_lost = True
+        for _, _, fut, _ in batch:
+            if not fut.done():
+                fut.set_exception(error)
+        self.stop()
+
+    def _not_found(self, batch):
+        # партии нет — отвечаем None и не держим актор
+        for _, _, fut, _ in batch:
+            if not fut.done():
+                fut.set_result(None)
+        self.stop()
+
+    async def _process_scripted(self, batch):
+        """Команды SCRIPTED без состояния в памяти; возвращает остаток пачки для обычного пути."""
+        leases = self.registry.leases
+        owner = leases.node_id if leases else ""
+        for i, (command, args, fut, traces) in enumerate(batch):
+            try:
+                with tracing.activate(*traces), tracing.span(f"GameActor.{command}", "actor", batch=len(batch)):
+                    result = await SCRIPTED[command](self.service, self.game_id, *args, owner=owner)
+            except ValueError as e:
+                fut.set_exception(e)
+                continue
+            except LeaseLost as e:
+                self._fail_lease(batch[i:], e)
+                return []
+            except Exception as e:
+                logger.exception(f"[GameActor] {self.game_id}: {command} script failed")
+                for _, _, rest, _ in batch[i:]:
+                    if not rest.done():
+                        rest.set_exception(e)
+                return []
+            if result is NotImplemented:
+                return batch[i:]
+            if result is None:
+                self._not_found(batch[i:])
+                return []
+            fut.set_result(result)
+        return []
+
+    async def _process_batch(self, batch):
+        if self.state is None and all(command in SCRIPTED for command, *_ in batch):
+            batch = await self._process_scripted(batch)
+            if not batch:
+                return
+        if self.state is None:
+            self.state = await self.service.load_state(self.game_id)
+        if self.state is None:
+            self._not_found(batch)
+            return
+
+        done = []
+        # записи лога команд пишутся вместе с состоянием в _save
+        self.service.log_service.hold()
+        try:
+            for command, args, fut, traces in batch:
+                try:
+                    with tracing.activate(*traces), tracing.span(f"GameActor.{command}", "actor", batch=len(batch)):
+                        result = await COMMANDS[command](self.service, self.state, *args)
+                except ValueError as e:
+                    # ошибка проверки до изменения состояния — отклоняем только эту команду
+                    fut.set_exception(e)
+                    continue
+                done.append((fut, result))
+            await self._save()
+        except LeaseLost as e:
+            self._fail_lease(batch, e)
+            return
+        except Exception as e:
+            # состояние могло измениться частично — не сохраняем (и лог тоже), перечитаем из Redis
+            self.service.log_service.take_pending()
+            logger.exception(f"[GameActor] {self.game_id}: batch failed")
+            self.state = None
+            for _, _, fut, _ in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+
+        for fut, result in done:
+            if not fut.done():
+                fut.set_result(result)
+
+
+class GameActorRegistry:
+    """Активные акторы партий текущего процесса."""
+
+    def __init__(self, leases: Optional[GameLeaseManager] = None):
+        self.actors: Dict[str, GameActor] = {}
+        self.leases = leases
+        # партии, которые сейчас пишутся в обход акторов (owning): новые акторы ждут
+        self._blocked: Dict[str, asyncio.Event] = {}
+        self.redis = None
+        self._renew_task: Optional[asyncio.Task] = None
+
+    async def call(self, redis, game_id: str, command: str, *args):
+        """
+        Выполнить команду в акторе партии (актор создаётся при необходимости).
+        Если партией владеет другой узел — GameOwnedElsewhere.
+        """
+        if command not in COMMANDS:
+            raise KeyError(f"Unknown game command '{command}'")
+        self.redis = redis
+        await self._wait_unblocked(game_id)
+        actor = self.actors.get(game_id)
+        if actor is None or actor.closed:
+            if self.leases:
+                await self.leases.acquire(redis, game_id)
+            actor = self.actors.get(game_id)
+            if actor is None or actor.closed:
+                actor = self.actors[game_id] = GameActor(game_id, GameService(redis), self)
+        return await actor.call(command, *args)
+
+    def _remove(self, actor: GameActor):
+        if self.actors.get(actor.game_id) is actor:
+            del self.actors[actor.game_id]
+
+    async def _forward(self, redis, game_id: str, command: str, args, fut):
+        try:
+            result = await self.call(redis, game_id, command, *args)
+        except Exception as e:
+            if not fut.done():
+                fut.set_exception(e)
+        else:
+            if not fut.done():
+                fut.set_result(result)
+
+    async def startup(self):
+        if self.leases and not self.leases.node_url:
+            logger.warning("[GameActor] GAME_LEASES is on without NODE_URL: requests for games owned "
+                           "by other nodes get 503 instead of a redirect")
+        if self.leases and self._renew_task is None:
+            self._renew_task = asyncio.create_task(self._renew_loop(), name="game-lease-renew")
+
+    async def _renew_loop(self):
+        interval = self.leases.ttl_ms / 3000
+        while True:
+            await asyncio.sleep(interval)
+            if self.redis is None:
+                continue
+            try:
+                lost = await self.leases.renew(self.redis, list(self.actors))
+            except Exception:
+                logger.exception("[GameActor] Lease renewal failed")
+                continue
+            for game_id in lost:
+                actor = self.actors.get(game_id)
+                if actor:
+                    actor.lease_lost = True
+                    actor.stop()
+
+    async def evict(self, game_id: str):
+        """Остановить актор (например, если состояние партии перезаписано в обход него)."""
+        actor = self.actors.get(game_id)
+        if actor:
+            actor.stop()
+            await asyncio.shield(actor.task)
+
+    @asynccontextmanager
+    async def owning(self, redis, game_ids: Iterable[str], evict: bool = True):
+        """
+        Запись партий в обход акторов (создание, удаление).
+
+        Локальные акторы этих партий останавливаются (evict=False — такие
+        партии пропускаются), затем при включённой аренде узел захватывает
+        аренду каждой партии и держит её до выхода из блока: актор другого
+        узла не запишет партию поверх. Внутри блока доступен словарь
+        {game_id: GameOwnedElsewhere} партий, которые забрать не удалось.
+        """
+        game_ids = list(dict.fromkeys(game_ids))
+        for game_id in game_ids:
+            await self._wait_unblocked(game_id)
+        # до выхода из блока команды этих партий ждут, а не поднимают актор со старым состоянием
+        for game_id in game_ids:
+            self._blocked[game_id] = asyncio.Event()
+        claimed = []
+        try:
+            skipped: Dict[str, GameOwnedElsewhere] = {}
+            for game_id in game_ids:
+                actor = self.actors.get(game_id)
+                if actor is None or actor.closed:
+                    continue
+                if evict:
+                    # актор освобождает аренду при остановке — до её захвата ниже
+                    await self.evict(game_id)
+                else:
+                    skipped[game_id] = GameOwnedElsewhere(game_id, self.leases.node_id if self.leases else NODE_ID, None)
+                    self._blocked.pop(game_id).set()
+
+            claimed = [g for g in game_ids if g not in skipped]
+            if self.leases:
+                results = await asyncio.gather(
+                    *(self.leases.acquire(redis, g) for g in claimed), return_exceptions=True
+                )
+                for game_id, result in zip(claimed, results):
+                    if isinstance(result, GameOwnedElsewhere):
+                        skipped[game_id] = result
+                    elif isinstance(result, Exception):
+                        raise result
+                claimed = [g for g in claimed if g not in skipped]
+            yield skipped
+        finally:
+            try:
+                await self._release(redis, claimed)
+            finally:
+                for game_id in game_ids:
+                    blocked = self._blocked.pop(game_id, None)
+                    if blocked:
+                        blocked.set()
+
+    async def _wait_unblocked(self, game_id: str):
+        while (blocked := self._blocked.get(game_id)) is not None:
+            await blocked.wait()
+
+    async def _release(self, redis, game_ids):
+        if self.leases:
+            for game_id in game_ids:
+                await self.leases.release(redis, game_id)
+
+    async def shutdown(self):
+        if self._renew_task:
+            self._renew_task.cancel()
+            self._renew_task = None
+        actors = list(self.actors.values())
+        for actor in actors:
+            actor.stop()
+        if actors:
+            await asyncio.gather(*(a.task for a in actors), return_exceptions=True)
+        logger.info(f"[GameActor] Stopped {len(actors)} actors")
+
+
+game_actors = GameActorRegistry(GameLeaseManager() if GAME_LEASES else None)
+
+Gauge("ttkt_game_actors", "Game actors held in memory by this process", lambda: len(game_actors.actors))
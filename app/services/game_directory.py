@@ -0,0 +1,236 @@
+"""
+Каталог партий: какие партии существуют, без обхода ключей game:*.
+
+Каждая партия лежит в sorted set'ах games:idx:{статус}:{сценарий}:{сложность}
+со score = время последней активности (мс); на месте любого измерения
+может стоять "*", поэтому для каждой комбинации фильтров есть свой набор
+(8 на партию) и страница списка — один ZREVRANGEBYSCORE. Описание партии
+(статус, фаза, волна, сценарий, сложность) — поле хеша games:meta.
+
+Каталог обновляется при сохранении состояния: всегда при смене статуса
+или фазы, иначе не чаще GAME_DIRECTORY_TOUCH_INTERVAL секунд на партию.
+При создании партии (replace) читается прежнее описание: если id занят
+партией с другим сценарием или сложностью, она убирается из её наборов.
+Партии, созданные до появления каталога, добавляет
+app/services/directory_backfill.py.
+
+Уборка (sweep) берёт из тех же наборов самые старые завершённые партии
+(GAME_FINISHED_TTL) и брошенные активные (GAME_IDLE_TTL) и удаляет их
+состояние, лог и записи каталога. Уборку выполняет один узел — владелец
+аренды games:sweeper; партии, которые держит актор (этого или другого
+узла), пропускаются — удаление идёт под арендой партии.
+"""
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from itertools import product
+from typing import Callable, List, Optional, Tuple
+from app.common.config import (
+    GAME_DIRECTORY_TOUCH_INTERVAL,
+    GAME_FINISHED_TTL,
+    GAME_IDLE_TTL,
+    GAME_SWEEP_BATCH,
+    GAME_SWEEP_INTERVAL,
+    NODE_ID,
+)
+from app.common.logger import logger
+from app.models import GameState, PhaseType
+
+META_KEY = "games:meta"
+SWEEPER_LEASE = "games:sweeper"
+ANY = "*"
+STATUSES = ("active", "finished")
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+class GameDirectory:
+    def __init__(self, touch_interval: float = GAME_DIRECTORY_TOUCH_INTERVAL, maxsize: int = 100000):
+        self.touch_interval = touch_interval
+        self.maxsize = maxsize
+        # game_id -> (статус, фаза, время записи): лишние обновления не уходят в Redis
+        self._written: "OrderedDict[str, Tuple[str, str, float]]" = OrderedDict()
+        self._task: Optional[asyncio.Task] = None
+        # GameActorRegistry.owning — захват партий перед удалением (задаётся в startup)
+        self._owning: Optional[Callable] = None
+
+    @staticmethod
+    def index_key(status: str = ANY, scenario: str = ANY, difficulty: str = ANY) -> str:
+        return f"games:idx:{status}:{scenario}:{difficulty}"
+
+    @classmethod
+    def index_keys(cls, status: str, scenario: str, difficulty: str) -> List[str]:
+        """Все наборы, в которых состоит партия с такими измерениями."""
+        return [cls.index_key(*dims) for dims in product((status, ANY), (scenario, ANY), (difficulty, ANY))]
+
+    @staticmethod
+    def status_of(state: GameState) -> str:
+        return "finished" if state.game_over else "active"
+
+    @staticmethod
+    def _dims(meta: dict) -> Tuple[str, str]:
+        return meta.get("scenario") or "unknown", meta.get("difficulty") or "unknown"
+
+    # ----------------------------
+    # Запись
+    # ----------------------------
+    async def update(self, redis, state: GameState, force: bool = False, replace: bool = False):
+        """
+        Отметить активность партии; смена статуса переносит её между наборами.
+        replace — партия создана заново: убрать её из наборов прежнего описания.
+        """
+        status = self.status_of(state)
+        phase = PhaseType(state.phase).value
+        now = time.monotonic()
+        written = self._written.get(state.id)
+        if (not force and not replace and written is not None and written[:2] == (status, phase)
+                and now - written[2] < self.touch_interval):
+            return
+        await self.update_many(redis, [state], replace)
+
+    async def update_many(self, redis, states: List[GameState], replace: bool = False):
+        """Записать описания партий в каталог одной транзакцией (replace — как в update)."""
+        if not states:
+            return
+        previous = await redis.hmget(META_KEY, [s.id for s in states]) if replace else [None] * len(states)
+        entries = [self._entry(state, json.loads(old) if old else None) for state, old in zip(states, previous)]
+        await redis.index_put_many(META_KEY, entries)
+        now = time.monotonic()
+        for state in states:
+            self._written[state.id] = (self.status_of(state), PhaseType(state.phase).value, now)
+            self._written.move_to_end(state.id)
+        while len(self._written) > self.maxsize:
+            self._written.popitem(last=False)
+
+    def _entry(self, state: GameState, previous: Optional[dict] = None) -> tuple:
+        """(member, meta, score, наборы для добавления, наборы для удаления) для index_put_many."""
+        status = self.status_of(state)
+        meta = {
+            "game_id": state.id,
+            "status": status,
+            "phase": PhaseType(state.phase).value,
+            "wave": state.wave,
+            "result": state.result,
+            "scenario": state.scenario_id,
+            "difficulty": state.difficulty,
+            "players": len(state.players),
+            "updated": _now_ms(),
+        }
+        scenario, difficulty = self._dims(meta)
+        add_keys = self.index_keys(status, scenario, difficulty)
+        other = STATUSES[1] if status == STATUSES[0] else STATUSES[0]
+        # из наборов прежнего статуса; наборы без статуса ("*") общие
+        remove_keys = [self.index_key(other, *dims) for dims in product((scenario, ANY), (difficulty, ANY))]
+        if previous and self._dims(previous) != (scenario, difficulty):
+            old = [k for s in STATUSES for k in self.index_keys(s, *self._dims(previous))]
+            remove_keys += [k for k in old if k not in add_keys and k not in remove_keys]
+        return state.id, json.dumps(meta, ensure_ascii=False), meta["updated"], add_keys, remove_keys
+
+    def forget(self, game_id: str):
+        self._written.pop(game_id, None)
+
+    # ----------------------------
+    # Список
+    # ----------------------------
+    @staticmethod
+    def parse_cursor(cursor: Optional[str]) -> Optional[Tuple[int, str]]:
+        """'<score>:<game_id>' -> (score, game_id); ValueError для неверного курсора."""
+        if not cursor:
+            return None
+        score, sep, game_id = cursor.partition(":")
+        if not sep or not game_id:
+            raise ValueError("Invalid cursor")
+        return int(score), game_id
+
+    async def list(self, redis, status: Optional[str] = None, scenario: Optional[str] = None,
+                   difficulty: Optional[str] = None, cursor: Optional[str] = None, limit: int = 50) -> dict:
+        """
+        Страница партий по убыванию последней активности.
+        Курсор — (score, id) последней выданной партии: страницы не съезжают,
+        если в начало списка добавились новые партии.
+        """
+        if status is not None and status not in STATUSES:
+            raise ValueError(f"Unknown status '{status}'")
+        after = self.parse_cursor(cursor)
+        key = self.index_key(status or ANY, scenario or ANY, difficulty or ANY)
+
+        page: List[Tuple[str, float]] = []
+        max_score = after[0] if after else "+inf"
+        offset = 0
+        while len(page) < limit + 1:
+            chunk = await redis.zrevrange_by_score(key, max_score, offset, limit + 1)
+            for member, score in chunk:
+                # при равных score Redis отдаёт members в обратном лексикографическом порядке
+                if after and int(score) == after[0] and member >= after[1]:
+                    continue
+                page.append((member, score))
+            if len(chunk) < limit + 1:
+                break
+            offset += len(chunk)
+
+        has_more = len(page) > limit
+        page = page[:limit]
+        metas = await redis.hmget(META_KEY, [m for m, _ in page])
+        games = [json.loads(raw) for raw in metas if raw]
+        next_cursor = f"{int(page[-1][1])}:{page[-1][0]}" if has_more and page else None
+        return {"games": games, "next_cursor": next_cursor}
+
+    # ----------------------------
+    # Уборка
+    # ----------------------------
+    async def sweep(self, redis, now_ms: Optional[int] = None) -> int:
+        """Удалить завершённые и брошенные партии старше TTL (не больше GAME_SWEEP_BATCH за статус)."""
+        now_ms = now_ms or _now_ms()
+        removed = 0
+        for status, ttl in (("finished", GAME_FINISHED_TTL), ("active", GAME_IDLE_TTL)):
+            ids = await redis.zrange_by_score(self.index_key(status), now_ms - int(ttl * 1000), GAME_SWEEP_BATCH)
+            if not ids:
+                continue
+            if self._owning is None:
+                removed += await self._drop(redis, status, ids)
+                continue
+            async with self._owning(redis, ids, evict=False) as busy:
+                removed += await self._drop(redis, status, [g for g in ids if g not in busy])
+        return removed
+
+    async def _drop(self, redis, status: str, ids: List[str]) -> int:
+        if not ids:
+            return 0
+        metas = await redis.hmget(META_KEY, ids)
+        members, delete_keys = {}, []
+        for game_id, raw in zip(ids, metas):
+            scenario, difficulty = self._dims(json.loads(raw) if raw else {})
+            members[game_id] = self.index_keys(status, scenario, difficulty)
+            delete_keys += [f"game:{game_id}", f"game:{game_id}:log"]
+            self.forget(game_id)
+        await redis.index_drop(META_KEY, members, delete_keys)
+        logger.info("[GameDirectory] Swept %d %s games", len(ids), status, extra={"event": "games_swept"})
+        return len(ids)
+
+    async def _sweep_loop(self, redis):
+        ttl_ms = int(GAME_SWEEP_INTERVAL * 3000)
+        while True:
+            await asyncio.sleep(GAME_SWEEP_INTERVAL)
+            try:
+                # уборку в кластере выполняет один узел
+                if await redis.acquire_lease(SWEEPER_LEASE, NODE_ID, ttl_ms) != NODE_ID:
+                    continue
+                await self.sweep(redis)
+            except Exception:
+                logger.exception("[GameDirectory] Sweep failed")
+
+    async def startup(self, redis, owning: Optional[Callable] = None):
+        self._owning = owning
+        if GAME_SWEEP_INTERVAL > 0 and self._task is None:
+            self._task = asyncio.create_task(self._sweep_loop(redis), name="game-directory-sweeper")
+
+    async def shutdown(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+
+game_directory = GameDirectory()
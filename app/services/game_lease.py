@@ -0,0 +1,87 @@
+from time import monotonic
+from typing import Iterable, List, Optional
+from app.common.config import GAME_LEASE_TTL, NODE_ID, NODE_URL
+from app.common.logger import logger
+
+
+class GameOwnedElsewhere(Exception):
+    """Партией владеет другой узел; запрос нужно отправить ему."""
+
+    def __init__(self, game_id: str, owner: str, owner_url: Optional[str]):
+        super().__init__(f"Game '{game_id}' is owned by node '{owner}'")
+        self.game_id = game_id
+        self.owner = owner
+        self.owner_url = owner_url
+
+
+class LeaseLost(Exception):
+    """Аренда партии истекла или перехвачена другим узлом — состояние в памяти устарело."""
+
+
+class GameLeaseManager:
+    """
+    Аренда партий узлами кластера.
+
+    game:{id}:owner — id узла-владельца с TTL; владелец продлевает аренду,
+    пока держит партию в памяти, и освобождает её при выгрузке или остановке.
+    Если узел умер, аренда истекает и партию забирает первый узел, получивший
+    команду. node:{id} — адрес узла для перенаправления запросов.
+    """
+
+    def __init__(self, node_id: str = NODE_ID, node_url: str = NODE_URL, ttl: float = GAME_LEASE_TTL):
+        self.node_id = node_id
+        self.node_url = node_url.rstrip("/")
+        self.ttl_ms = int(ttl * 1000)
+        self._published = 0.0  # monotonic() последней записи node:{id}
+
+    @staticmethod
+    def lease_key(game_id: str) -> str:
+        return f"game:{game_id}:owner"
+
+    @staticmethod
+    def node_key(node_id: str) -> str:
+        return f"node:{node_id}"
+
+    async def publish(self, redis, force: bool = False):
+        """
+        Записать адрес узла (node:{id}) с TTL аренды. Без force — только если
+        запись старше половины TTL, чтобы захват партий не добавлял запросов.
+        """
+        if not self.node_url:
+            return
+        now = monotonic()
+        if force or (now - self._published) * 1000 > self.ttl_ms / 2:
+            await redis.set_raw(self.node_key(self.node_id), self.node_url, px=self.ttl_ms)
+            self._published = now
+
+    async def acquire(self, redis, game_id: str):
+        """Захватить партию или выбросить GameOwnedElsewhere, если она занята."""
+        owner = await redis.acquire_lease(self.lease_key(game_id), self.node_id, self.ttl_ms)
+        if owner == self.node_id:
+            # адрес должен быть виден сразу, до первого продления аренды
+            await self.publish(redis)
+            return
+        owner_url = await redis.get_raw(self.node_key(owner)) if owner else None
+        raise GameOwnedElsewhere(game_id, owner, owner_url)
+
+    async def release(self, redis, game_id: str):
+        await redis.release_lease(self.lease_key(game_id), self.node_id)
+
+    async def renew(self, redis, game_ids: Iterable[str]) -> List[str]:
+        """Продлить аренды; возвращает id партий, которые узел потерял."""
+        game_ids = list(game_ids)
+        await self.publish(redis, force=True)
+        lost = await redis.renew_leases([self.lease_key(g) for g in game_ids], self.node_id, self.ttl_ms)
+        lost_ids = [k[len("game:"):-len(":owner")] for k in lost]
+        for game_id in lost_ids:
+            logger.warning(f"[Lease] Node {self.node_id} lost lease on game {game_id}")
+        return lost_ids
+
+    async def save(self, redis, game_id: str, raw: str, pushes: dict = None, increments: dict = None):
+        """
+        Записать сериализованное состояние (и записи лога pushes/increments),
+        только если узел всё ещё владеет партией.
+        """
+        if not await redis.set_if_owner(f"game:{game_id}", raw, self.lease_key(game_id), self.node_id,
+                                        pushes, increments):
+            raise LeaseLost(f"Node {self.node_id} no longer owns game '{game_id}'")
@@ -1,22 +1,82 @@
 import json
 from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from app.common.config import ANALYTICS
 from app.common.logger import logger
+from app.common.tracing import traced
+from app.services.analytics_service import analytics
 
 class GameLogService:
     def __init__(self, redis):
         self.redis = redis
+        # game_id -> [(строка записи, (тип, payload))]; None — записи уходят в Redis сразу
+        self._pending: Optional[Dict[str, List[Tuple[str, tuple]]]] = None
 
+    def hold(self):
+        """Копить записи в памяти, пока их не заберёт take_pending (пачка команд актора)."""
+        if self._pending is None:
+            self._pending = {}
+
+    def take_pending(self) -> Tuple[dict, dict]:
+        """
+        Накопленные записи -> (pushes, increments) для RedisStorage.write_batch;
+        дальше записи снова уходят сразу.
+        """
+        pending, self._pending = self._pending or {}, None
+        pushes = {self.log_key(game_id): [raw for raw, _ in items] for game_id, items in pending.items()}
+        increments: Dict[str, Dict[str, int]] = {}
+        if ANALYTICS:
+            for game_id, items in pending.items():
+                analytics.increments(game_id, [entry for _, entry in items], increments)
+        return pushes, increments
+
+    @staticmethod
+    def log_key(game_id: str) -> str:
+        return f"game:{game_id}:log"
+
+    @staticmethod
+    def format_entry(entry_type: str, payload, timestamp: str = None) -> str:
+        entry = {"timestamp": timestamp or datetime.utcnow().isoformat(), "type": entry_type, "payload": payload}
+        return json.dumps(entry, ensure_ascii=False)
+
+    @traced()
     async def add_entry(self, game_id: str, entry_type: str, payload):
-        entry = {"timestamp": datetime.utcnow().isoformat(), "type": entry_type, "payload": payload}
-        key = f"game:{game_id}:log"
-        await self.redis.client.rpush(key, json.dumps(entry, ensure_ascii=False))
-        logger.debug(f"[GameLog] {game_id} <- {entry_type}")
+        key = self.log_key(game_id)
+        entry = self.format_entry(entry_type, payload)
+        if self._pending is not None:
+            self._pending.setdefault(game_id, []).append((entry, (entry_type, payload)))
+            return
+        if ANALYTICS:
+            # запись в лог и счётчики сводки — одним pipeline
+            await self.redis.write_batch(
+                pushes={key: [entry]}, increments=analytics.increments(game_id, [(entry_type, payload)])
+            )
+        else:
+            await self.redis.rpush(key, entry)
+        logger.debug("[GameLog] %s <- %s", game_id, entry_type, extra={"game_id": game_id, "event": entry_type})
+
+    @traced()
+    async def add_entries(self, game_id: str, entries):
+        """Записать пачку событий [(type, payload), ...] одним RPUSH."""
+        if not entries:
+            return
+        ts = datetime.utcnow().isoformat()
+        values = [self.format_entry(entry_type, payload, ts) for entry_type, payload in entries]
+        if self._pending is not None:
+            self._pending.setdefault(game_id, []).extend(zip(values, entries))
+            return
+        key = self.log_key(game_id)
+        if ANALYTICS:
+            await self.redis.write_batch(pushes={key: values}, increments=analytics.increments(game_id, entries))
+        else:
+            await self.redis.rpush(key, *values)
+        logger.debug("[GameLog] %s <- %d entries", game_id, len(values), extra={"game_id": game_id, "event": "log_batch"})
 
     async def get_log(self, game_id: str):
-        key = f"game:{game_id}:log"
-        raw = await self.redis.client.lrange(key, 0, -1)
+        key = self.log_key(game_id)
+        raw = await self.redis.lrange(key, 0, -1)
         return [json.loads(x) for x in raw]
 
     async def clear_log(self, game_id: str):
-        key = f"game:{game_id}:log"
+        key = self.log_key(game_id)
         await self.redis.delete(key)
@@ -0,0 +1,238 @@
+"""
+Простые изменения партии скриптами на стороне Redis.
+
+Взять карту и отметить сокровище открытым — каждое из них меняет пару
+полей состояния и добавляет одну запись лога. Без скрипта это чтение
+всего состояния, запись всего состояния и RPUSH в лог (3–4 round-trip),
+а между чтением и записью состояние может изменить другой процесс.
+Скрипт делает то же атомарно за один EVALSHA: изменение, запись лога и
+счётчики сводки (analytics_service).
+
+Скрипты работают только с json-форматом состояния (STATE_FORMAT=json).
+Для packed-состояния возвращается UNSUPPORTED — вызывающий выполняет
+обычный путь через GameState.
+
+Аргументы всех скриптов:
+  KEYS[1]=game:{id}, KEYS[2]=game:{id}:log, KEYS[3]=game:{id}:owner,
+  KEYS[4]=хеш сводки analytics:{сценарий}:{сложность} (нет — сводка выключена);
+  ARGV[1]=владелец аренды ("" — без проверки), ARGV[2]=время записи лога,
+  далее — аргументы скрипта. Результат — [код, значение].
+"""
+import json
+import random
+from datetime import datetime
+from typing import Optional, Tuple
+from app.common.config import ANALYTICS
+from app.common.memory_redis import InMemoryRedis, emulate_script
+from app.common.redis_scripts import RedisScript, redis_script
+from app.services.analytics_service import AnalyticsService, analytics
+from app.services.game_lease import GameLeaseManager, LeaseLost
+from app.services.game_log_service import GameLogService
+from app.services.state_codec import StateCodec
+
+# коды результата
+MISSING, OK, UNSUPPORTED, NOT_OWNER, REJECTED = range(5)
+
+# Общая часть скриптов. cjson не различает пустые [] и {}: перед разбором
+# они (только вне строковых значений) заменяются строками-маркерами
+# "\u0001[]" и "\u0001{}", при записи маркеры возвращаются обратно.
+# Состояние, где \u0001 уже встречается (управляющий символ в имени и т.п.),
+# скрипт не трогает.
+_LUA_PRELUDE = r"""
+local EMPTY = '\1[]'
+local function list(v)
+  if v == nil or v == EMPTY or v == cjson.null then return {} end
+  return v
+end
+local function packed(v)
+  if #v == 0 then return EMPTY end
+  return v
+end
+local function mark_empty(raw)
+  local out, pos = {}, 1
+  while true do
+    local q = string.find(raw, '"', pos, true)
+    out[#out + 1] = (string.gsub(string.sub(raw, pos, (q or 0) - 1), '([%[{])%s*([%]}])', '"\\u0001%1%2"'))
+    if not q then break end
+    local i = q + 1
+    while true do
+      local e = string.find(raw, '["\\]', i)
+      if string.sub(raw, e, e) == '"' then i = e break end
+      i = e + 2
+    end
+    out[#out + 1] = string.sub(raw, q, i)
+    pos = i + 1
+  end
+  return table.concat(out)
+end
+local function load_state()
+  if ARGV[1] ~= '' and redis.call('get', KEYS[3]) ~= ARGV[1] then return nil, 3 end
+  local raw = redis.call('get', KEYS[1])
+  if not raw then return nil, 0 end
+  if string.find(raw, '\\u0001', 1, true) then return nil, 2 end
+  local state = cjson.decode(mark_empty(raw))
+  if state._p ~= nil then return nil, 2 end
+  return state
+end
+local function commit(state, entry_type, payload, breakdown)
+  redis.call('set', KEYS[1], (string.gsub(cjson.encode(state), '"\\u0001([%[{][%]}])"', '%1')))
+  redis.call('rpush', KEYS[2], cjson.encode({timestamp = ARGV[2], type = entry_type, payload = payload}))
+  if KEYS[4] then
+    redis.call('hincrby', KEYS[4], 'e:' .. entry_type, 1)
+    if breakdown then redis.call('hincrby', KEYS[4], 'b:' .. entry_type .. ':' .. breakdown, 1) end
+  end
+end
+"""
+
+# ARGV[3]=id игрока ("" — текущий), ARGV[4]=seed перемешивания сброса -> [код, карта или ""]
+_LUA_DRAW_CARD = _LUA_PRELUDE + r"""
+local state, code = load_state()
+if not state then return {code, ''} end
+if state.game_over then return {4, 'Game is over'} end
+local pid = ARGV[3]
+if pid == '' then pid = state.current_player_id end
+local player
+for _, p in ipairs(state.players) do
+  if p.id == pid then player = p end
+end
+if not player then return {4, "Unknown player '" .. tostring(pid) .. "'"} end
+local deck, discard = list(player.deck), list(player.discard_pile)
+if #deck == 0 and #discard > 0 then
+  deck, discard = discard, {}
+  math.randomseed(tonumber(ARGV[4]))
+  for i = #deck, 2, -1 do
+    local j = math.random(i)
+    deck[i], deck[j] = deck[j], deck[i]
+  end
+end
+if #deck == 0 then return {1, ''} end
+local card = table.remove(deck)
+local hand = list(player.hand)
+hand[#hand + 1] = card
+player.deck, player.discard_pile, player.hand = packed(deck), packed(discard), packed(hand)
+commit(state, 'card_draw', {player = player.id})
+return {1, card}
+"""
+
+# ARGV[3]=id сокровища, ARGV[4]=имя героя ("" — нет) -> [код, json эффектов или "" если уже открыто]
+_LUA_OPEN_TREASURE = _LUA_PRELUDE + r"""
+local state, code = load_state()
+if not state then return {code, ''} end
+local tid = ARGV[3]
+local found = {}
+for _, t in ipairs(list(state.treasures)) do
+  if t.id == tid then found[#found + 1] = t end
+end
+for _, h in ipairs(state.halls) do
+  if type(h.treasure) == 'table' and h.treasure.id == tid then found[#found + 1] = h.treasure end
+end
+if #found == 0 then return {4, "Unknown treasure '" .. tid .. "'"} end
+local treasure = found[#found]
+if treasure.opened then return {1, ''} end
+for _, t in ipairs(found) do t.opened = true end
+local hero = cjson.null
+if ARGV[4] ~= '' then hero = ARGV[4] end
+local tier = tostring(treasure.tier)
+commit(state, 'treasure_open', {hero = hero, tier = tier, treasure = tid}, tier)
+local effects = list(treasure.effects)
+if #effects == 0 then return {1, '[]'} end
+return {1, cjson.encode(effects)}
+"""
+
+DRAW_CARD = redis_script("game_draw_card", _LUA_DRAW_CARD)
+OPEN_TREASURE = redis_script("game_open_treasure", _LUA_OPEN_TREASURE)
+
+
+# ----------------------------
+# Эквиваленты для InMemoryRedis
+# ----------------------------
+def _load_state(r: InMemoryRedis, keys, argv) -> Tuple[Optional[dict], int]:
+    if argv[0] and r.get_now(keys[2]) != argv[0]:
+        return None, NOT_OWNER
+    raw = r.get_now(keys[0])
+    if raw is None:
+        return None, MISSING
+    if "\\u0001" in raw:
+        return None, UNSUPPORTED
+    state = json.loads(raw)
+    if StateCodec.is_packed(state):
+        return None, UNSUPPORTED
+    return state, OK
+
+
+def _commit(r: InMemoryRedis, keys, argv, state: dict, entry_type: str, payload: dict):
+    r.set_now(keys[0], json.dumps(state, ensure_ascii=False))
+    r.rpush_now(keys[1], GameLogService.format_entry(entry_type, payload, argv[1]))
+    if len(keys) > 3:
+        for field in AnalyticsService.fields(entry_type, payload):
+            r.hincrby_now(keys[3], field, 1)
+
+
+@emulate_script(_LUA_DRAW_CARD)
+def _draw_card_emulated(r: InMemoryRedis, keys, argv):
+    state, code = _load_state(r, keys, argv)
+    if state is None:
+        return [code, ""]
+    if state.get("game_over"):
+        return [REJECTED, "Game is over"]
+    pid = argv[2] or state.get("current_player_id")
+    player = next((p for p in state["players"] if p["id"] == pid), None)
+    if player is None:
+        return [REJECTED, f"Unknown player '{pid}'"]
+    if not player["deck"] and player["discard_pile"]:
+        player["deck"], player["discard_pile"] = player["discard_pile"], []
+        random.Random(int(argv[3])).shuffle(player["deck"])
+    if not player["deck"]:
+        return [OK, ""]
+    card = player["deck"].pop()
+    player["hand"].append(card)
+    _commit(r, keys, argv, state, "card_draw", {"player": player["id"]})
+    return [OK, card]
+
+
+@emulate_script(_LUA_OPEN_TREASURE)
+def _open_treasure_emulated(r: InMemoryRedis, keys, argv):
+    state, code = _load_state(r, keys, argv)
+    if state is None:
+        return [code, ""]
+    tid = argv[2]
+    found = [t for t in state.get("treasures") or [] if t["id"] == tid]
+    found += [h["treasure"] for h in state["halls"] if h.get("treasure") and h["treasure"]["id"] == tid]
+    if not found:
+        return [REJECTED, f"Unknown treasure '{tid}'"]
+    treasure = found[-1]
+    if treasure.get("opened"):
+        return [OK, ""]
+    for t in found:
+        t["opened"] = True
+    tier = str(treasure["tier"])
+    _commit(r, keys, argv, state, "treasure_open", {"hero": argv[3] or None, "tier": tier, "treasure": tid})
+    return [OK, json.dumps(treasure.get("effects") or [], ensure_ascii=False)]
+
+
+# ----------------------------
+# Вызов
+# ----------------------------
+async def run_game_script(redis, script: RedisScript, game_id: str, *args, owner: str = "") -> Tuple[int, str]:
+    """
+    Выполнить скрипт над партией game_id. owner — узел, который должен
+    владеть арендой партии (LeaseLost, если это не так). Отказ проверки
+    (конец партии, неизвестный игрок) — ValueError, как в движке.
+    Возвращает (MISSING | OK | UNSUPPORTED, значение).
+    """
+    keys = [f"game:{game_id}", GameLogService.log_key(game_id), GameLeaseManager.lease_key(game_id)]
+    if ANALYTICS:
+        # группа сводки — как у остальных записей лога партии (GameLogService)
+        keys.append(AnalyticsService.key(*analytics.dims(game_id)))
+    argv = [owner, datetime.utcnow().isoformat(), *args]
+    code, value = await redis.run_script(script, keys, argv)
+    if code == NOT_OWNER:
+        raise LeaseLost(f"Node {owner} no longer owns game '{game_id}'")
+    if code == REJECTED:
+        raise ValueError(value)
+    return code, value
+
+
+def shuffle_seed() -> str:
+    """Seed перемешивания сброса для DRAW_CARD."""
+    return str(random.getrandbits(31))
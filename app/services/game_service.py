@@ -1,10 +1,32 @@
+import asyncio
+import json
+from time import perf_counter
+from app.common.config import ANALYTICS, STATE_FORMAT
 from app.common.logger import logger
+from app.common.metrics import STATE_BYTES, STATE_DESERIALIZE_SECONDS, STATE_SERIALIZE_SECONDS
+from app.common.tracing import traced
 from app.models import GameState, PhaseType
+from app.services.analytics_service import analytics
+from app.services.bot_service import bot_service
 from app.services.data_loader import DataLoader
+from app.services.game_directory import game_directory
 from app.services.game_initializer import GameInitializer
+from app.services.game_scripts import (
+    DRAW_CARD, MISSING, OK, OPEN_TREASURE, run_game_script, shuffle_seed,
+)
 from app.services.hero_ai_service import HeroAIService
 from app.services.game_log_service import GameLogService
 from app.services.rule_engine import RuleEngine
+from app.services.shop_service import ShopService
+from app.services.state_codec import StateCodec, UnknownCatalogVersion, get_state_codec
+
+_SERIALIZE = STATE_SERIALIZE_SECONDS.labels()
+_DESERIALIZE = STATE_DESERIALIZE_SECONDS.labels()
+_SAVE_BYTES = STATE_BYTES.labels("save")
+_LOAD_BYTES = STATE_BYTES.labels("load")
+
+# версия справочника -> таблица StateCodec (json), для чтения packed-состояний старых версий
+CODEC_TABLES_KEY = "codec:tables"
 
 class GameService:
     def __init__(self, redis):
@@ -15,45 +37,309 @@ class GameService:
         self.log_service = GameLogService(redis)
         self.rule_engine = RuleEngine()
         self.rule_engine.bind_log_service(self.log_service)
+        # записи волны идут через тот же журнал (и его буфер в акторе)
+        self.hero_ai.bind_log_service(self.log_service)
+        self.shop = ShopService()
 
+    @traced()
     async def load_state(self, game_id: str):
+        raw = await self.redis.get_raw(f"game:{game_id}")
+        if not raw:
+            return None
+        state = await self.parse_state(raw)
+        analytics.remember(state.id, state.scenario_id, state.difficulty)
+        return state
+
+    async def parse_state(self, raw: str) -> GameState:
+        """decode_state с подгрузкой таблицы кодека, если состояние упаковано другой версией справочника."""
+        try:
+            return self.decode_state(raw)
+        except UnknownCatalogVersion as e:
+            await self.load_codec_table(e.version)
+            return self.decode_state(raw)
+
+    async def load_codec_table(self, version: str):
+        """Подгрузить из Redis таблицу кодека версии version (UnknownCatalogVersion, если её нет)."""
+        raw, = await self.redis.hmget(CODEC_TABLES_KEY, [version])
+        if raw is None:
+            raise UnknownCatalogVersion(version)
+        get_state_codec().register_table(version, json.loads(raw))
+        logger.info(f"[GameService] Loaded state codec table for catalog {version}")
+
+    async def publish_codec_table(self):
+        """Сохранить таблицу кодека текущей версии справочника (вызывается при старте)."""
+        codec = get_state_codec()
+        await self.redis.hset(CODEC_TABLES_KEY, codec.version, json.dumps(codec.export_table(), ensure_ascii=False))
+
+    def decode_state(self, raw: str) -> GameState:
+        """Сохранённая строка (json или packed) -> GameState."""
+        start = perf_counter()
+        if StateCodec.is_packed_raw(raw):
+            state = get_state_codec().decode(json.loads(raw))
+        else:
+            # валидация pydantic-core прямо из строки, без промежуточного dict
+            state = GameState.model_validate_json(raw)
+        _DESERIALIZE.observe(perf_counter() - start)
+        _LOAD_BYTES.observe(len(raw))
+        return state
+
+    def dump_state(self, state: GameState):
+        """Представление состояния для хранения (зависит от STATE_FORMAT)."""
+        if STATE_FORMAT == "packed":
+            return get_state_codec().encode(state)
+        return state.to_dict()
+
+    @traced()
+    def serialize_state(self, state: GameState) -> str:
+        """Строка, которая кладётся в Redis."""
+        start = perf_counter()
+        raw = json.dumps(self.dump_state(state), ensure_ascii=False)
+        _SERIALIZE.observe(perf_counter() - start)
+        _SAVE_BYTES.observe(len(raw))
+        return raw
+
+    @traced()
+    async def save_state(self, game_id: str, state: GameState, pushes: dict = None, increments: dict = None):
+        """Сохранить состояние; pushes/increments (GameLogService.take_pending) — тем же pipeline."""
+        key = f"game:{game_id}"
+        if pushes or increments:
+            await self.redis.write_batch(pushes=pushes, increments=increments, raw={key: self.serialize_state(state)})
+        else:
+            await self.redis.set_raw(key, self.serialize_state(state))
+        await game_directory.update(self.redis, state)
+
+    def to_response(self, state: GameState) -> dict:
+        """Состояние для клиента: витрина магазина разворачивается из справочника."""
+        data = state.to_dict()
+        data["shop_display"] = self.shop.expand_display(state.shop_display)
+        return data
+
+    async def get_state(self, game_id: str):
+        """
+        Состояние только для чтения: модель GameState не строится,
+        сохранённые данные отдаются после разворачивания витрины.
+        """
         data = await self.redis.get(f"game:{game_id}")
         if not data:
             return None
-        return GameState(**data)
+        return await self.render_stored(data)
 
-    async def save_state(self, game_id: str, state: GameState):
-        await self.redis.set(f"game:{game_id}", state.to_dict())
+    async def get_state_raw(self, game_id: str):
+        """Сохранённое состояние строкой, как оно лежит в Redis."""
+        return await self.redis.get_raw(f"game:{game_id}")
 
-    async def get_state(self, game_id: str):
-        s = await self.load_state(game_id)
-        return s.to_dict() if s else None
+    def render_state(self, data: dict, expand: bool = True) -> dict:
+        """Сохранённый dict (json или packed) -> ответ клиенту."""
+        if StateCodec.is_packed(data):
+            data = get_state_codec().decode_dict(data)
+        if expand:
+            data["shop_display"] = self.shop.expand_display(data.get("shop_display"))
+        return data
 
-    async def create_game(self, game_id: str, player_names: list[str], scenario_id: str, difficulty: str = "family"):
-        state = await self.initializer.create_new_game(game_id, player_names, scenario_id, difficulty)
-        await self.log_service.add_entry(game_id, "game_start", {"players":[p.name for p in state.players], "scenario": scenario_id})
+    async def render_stored(self, data: dict, expand: bool = True) -> dict:
+        """render_state с подгрузкой таблицы кодека другой версии справочника."""
+        try:
+            return self.render_state(data, expand)
+        except UnknownCatalogVersion as e:
+            await self.load_codec_table(e.version)
+            return self.render_state(data, expand)
+
+    @traced()
+    async def create_game(self, game_id: str, player_names: list[str], scenario_id: str, difficulty: str = "family",
+                          fill_bots: bool = False):
+        state = self.initializer.build_game(game_id, player_names, scenario_id, difficulty, fill_bots)
+        await self.log_service.add_entry(
+            game_id, "game_start", {"players": [p.name for p in state.players], "scenario": scenario_id, "difficulty": difficulty}
+        )
+        # id мог быть занят другой партией — её записи в каталоге заменяются
+        await game_directory.update(self.redis, state, replace=True)
         await self.save_state(game_id, state)
         return state
 
+    @traced()
+    def _build_games(self, specs: list[dict]):
+        """Сборка пачки партий (выполняется в рабочем потоке). Ошибки — по каждой партии отдельно."""
+        results = []
+        seen = set()
+        for spec in specs:
+            game_id = spec.get("game_id")
+            try:
+                if game_id in seen:
+                    raise ValueError(f"Duplicate game_id '{game_id}' in request")
+                seen.add(game_id)
+                state = self.initializer.build_game(
+                    game_id, spec.get("player_names") or [], spec.get("scenario_id"), spec.get("difficulty") or "family",
+                    bool(spec.get("fill_bots")),
+                )
+                results.append((game_id, state, None))
+            except (ValueError, FileNotFoundError, KeyError) as e:
+                results.append((game_id, None, str(e)))
+        return results
+
+    @traced()
+    async def create_games_bulk(self, specs: list[dict], overwrite: bool = False):
+        """
+        Создание многих партий за один запрос: сборка в рабочем потоке,
+        все состояния и записи game_start — одним pipeline.
+        Без overwrite партии с уже занятым id не создаются (ошибка по партии).
+        Возвращает [(game_id, state | None, error | None), ...].
+        """
+        taken = []
+        if not overwrite:
+            ids = [spec.get("game_id") for spec in specs]
+            found = await self.redis.exists_many(f"game:{game_id}" for game_id in ids)
+            taken = [(game_id, None, f"Game '{game_id}' already exists") for game_id, hit in zip(ids, found) if hit]
+            specs = [spec for spec, hit in zip(specs, found) if not hit]
+        results = await asyncio.to_thread(self._build_games, specs)
+
+        values, pushes, increments = {}, {}, {}
+        for game_id, state, error in results:
+            if state is None:
+                continue
+            values[f"game:{game_id}"] = self.dump_state(state)
+            payload = {"players": [p.name for p in state.players], "scenario": state.scenario_id, "difficulty": state.difficulty}
+            pushes[self.log_service.log_key(game_id)] = [self.log_service.format_entry("game_start", payload)]
+            if ANALYTICS:
+                analytics.increments(game_id, [("game_start", payload)], increments)
+        if values:
+            await self.redis.write_batch(values, pushes, increments)
+            await game_directory.update_many(self.redis, [s for _, s, _ in results if s is not None], replace=True)
+        results += taken
+        logger.info(f"[GameService] Bulk created {len(values)}/{len(results)} games")
+        return results
+
+    @traced()
     async def start_next_wave(self, game_id: str):
         state = await self.load_state(game_id)
         if not state:
             return None
         if state.game_over:
             return state
+        await self.apply_next_wave(state, checkpoint=True)
+        await self.save_state(game_id, state)
+        return state
+
+    @traced()
+    async def apply_next_wave(self, state: GameState, checkpoint: bool = False):
+        """Волна героев над состоянием в памяти. checkpoint — сохранить фазу heroes до начала волны."""
+        if state.game_over:
+            return state
+        await self.run_bots(state)
         state.phase = PhaseType.HEROES
         state.wave += 1
-        await self.save_state(game_id, state)
-        await self.log_service.add_entry(game_id, "wave_start", {"wave": state.wave})
+        if checkpoint:
+            await self.save_state(state.id, state)
+        await self.log_service.add_entry(state.id, "wave_start", {"wave": state.wave})
+        return await self.finish_wave(state)
+
+    @traced()
+    async def finish_wave(self, state: GameState):
+        """Ходы героев начатой волны (фаза heroes), проверка конца партии и возврат хода игрокам."""
         actions = await self.hero_ai.run_wave(state)
         # after wave, check victory
         await self.check_victory(state)
         if not state.game_over:
             state.phase = PhaseType.PLAYER
-            await self.log_service.add_entry(game_id, "phase_change", {"phase":"player"})
+            await self.log_service.add_entry(state.id, "phase_change", {"phase":"player"})
+        return state
+
+    @traced()
+    async def run_bots(self, state: GameState):
+        """Ходы ботов в конце фазы игроков: план считается вне event loop, розыгрыш — через движок."""
+        if state.phase != PhaseType.PLAYER:
+            return
+        bots = [p.id for p in state.players if p.bot and not p.defeated]
+        for i, player_id in enumerate(bots):
+            if state.game_over:
+                break
+            plan = await bot_service.plan_turn(state, player_id, self.rule_engine.catalog, bots[i + 1:])
+            for card_id, option, monster_id, targets in plan:
+                try:
+                    await self.rule_engine.play_card(state, card_id, player_id, option, monster_id, targets)
+                except ValueError as e:
+                    # розыгрыш не совпал с симуляцией (другая карта из колоды и т.п.)
+                    logger.debug("[GameService] %s: bot %s skipped %s: %s", state.id, player_id, card_id, e,
+                                 extra={"game_id": state.id, "event": "bot_skip"})
+
+    async def try_draw_card(self, game_id: str, player_id: str = None, owner: str = ""):
+        """
+        Взять карту из колоды игрока (с перемешиванием сброса) скриптом на
+        стороне Redis, без чтения состояния (команда draw_card актора, пока
+        состояние не загружено). NotImplemented — скрипт неприменим
+        (packed-состояние), нужен apply_draw_card.
+        """
+        code, card = await run_game_script(self.redis, DRAW_CARD, game_id, player_id or "", shuffle_seed(), owner=owner)
+        if code == MISSING:
+            return None
+        if code != OK:
+            return NotImplemented
+        return {"status": "ok", "card": card or None}
+
+    @traced()
+    async def apply_draw_card(self, state: GameState, player_id: str = None):
+        """Взять карту над состоянием в памяти; None — колода и сброс пусты."""
+        if state.game_over:
+            raise ValueError("Game is over")
+        pid = player_id or state.current_player_id
+        player = next((p for p in state.players if p.id == pid), None)
+        if player is None:
+            raise ValueError(f"Unknown player '{pid}'")
+        card = player.draw_card()
+        if card:
+            await self.log_service.add_entry(state.id, "card_draw", {"player": player.id})
+        return card
+
+    async def try_mark_treasure(self, game_id: str, treasure_id: str, hero: str = None, owner: str = ""):
+        """
+        Отметить сокровище открытым, не применяя эффекты, скриптом на стороне
+        Redis. Возвращает эффекты сокровища; opened=False, если оно уже было
+        открыто. NotImplemented — скрипт неприменим, нужен apply_mark_treasure.
+        """
+        code, effects = await run_game_script(self.redis, OPEN_TREASURE, game_id, treasure_id, hero or "", owner=owner)
+        if code == MISSING:
+            return None
+        if code != OK:
+            return NotImplemented
+        return {"status": "ok", "opened": bool(effects), "effects": json.loads(effects) if effects else []}
+
+    @traced()
+    async def apply_mark_treasure(self, state: GameState, treasure_id: str, hero: str = None):
+        """try_mark_treasure над состоянием в памяти."""
+        found = [t for t in state.treasures if t.id == treasure_id]
+        found += [h.treasure for h in state.halls if h.treasure and h.treasure.id == treasure_id]
+        if not found:
+            raise ValueError(f"Unknown treasure '{treasure_id}'")
+        treasure = found[-1]
+        if treasure.opened:
+            return {"status": "ok", "opened": False, "effects": []}
+        effects = self.rule_engine.open_treasure(state, treasure)
+        await self.log_service.add_entry(
+            state.id, "treasure_open", {"hero": hero, "tier": str(treasure.tier), "treasure": treasure.id}
+        )
+        return {"status": "ok", "opened": True, "effects": list(effects)}
+
+    @traced()
+    async def buy_shop_card(self, game_id: str, card_id: str, player_id: str = None):
+        state = await self.load_state(game_id)
+        if not state:
+            return None
+        await self.apply_shop_buy(state, card_id, player_id)
         await self.save_state(game_id, state)
         return state
 
+    @traced()
+    async def apply_shop_buy(self, state: GameState, card_id: str, player_id: str = None):
+        """Покупка карты магазина над состоянием в памяти."""
+        self.shop.buy(state, card_id, player_id)
+        await self.log_service.add_entry(state.id, "shop_buy", {"player": player_id or state.current_player_id, "card": card_id})
+        return state
+
+    @traced()
+    async def apply_play_card(self, state: GameState, card_id: str, player_id: str = None, option: int = 0,
+                              monster_id: str = None, targets: list = ()):
+        """Розыгрыш карты из руки над состоянием в памяти."""
+        return await self.rule_engine.play_card(state, card_id, player_id, option, monster_id, targets)
+
     async def check_victory(self, state: GameState):
         # simple: victory after configured max waves in scenario or 3 by default
         scenario = None
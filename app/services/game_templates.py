@@ -0,0 +1,133 @@
+import random
+import threading
+from typing import Dict, List, Optional, Tuple
+from app.common.logger import logger
+from app.models import Hall, Player, Treasure
+from app.services.catalog import Catalog, get_catalog
+
+
+class ScenarioTemplate:
+    """
+    Проверенная заготовка партии сценария (от сложности она не зависит).
+
+    Всё, что одинаково во всех партиях сценария — залы, колоды классов
+    монстров, слоты сокровищ, колода героев — собирается и проверяется один
+    раз. Новая партия получает копии залов и только перемешивает колоды
+    и выбирает эффекты сокровищ.
+    """
+
+    def __init__(self, catalog: Catalog, scenario_id: str):
+        self.catalog_version = catalog.version
+        self.scenario_id = scenario_id
+
+        scenario = catalog.get_scenario(scenario_id)
+
+        # Проверяем данные и целостность — один раз на заготовку
+        loader = catalog.loader
+        loader.scenario = scenario
+        loader.validate_all()
+        loader.check_data_integrity(scenario_id)
+
+        # ---- Залы ----
+        halls: List[Hall] = []
+        for h in scenario.get("halls", []):
+            base = catalog.halls_by_id.get(h["id"], {})
+            halls.append(
+                Hall(
+                    id=h["id"],
+                    label=base.get("label"),
+                    spawn=base.get("spawn"),
+                    action=base.get("action"),
+                    connections=h.get("connections", []),
+                    tokens=h.get("tokens", []),
+                    max_connections=base.get("max_connections"),
+                )
+            )
+        self._halls: Tuple[Hall, ...] = tuple(halls)
+
+        # ---- Классы монстров и их колоды (по порядку мест за столом) ----
+        self.seats: Tuple[Tuple[str, Tuple[str, ...]], ...] = tuple(
+            (mc["class"], tuple(c["id"] for c in catalog.monster_decks if c["class"] == mc["class"]))
+            for mc in catalog.monster_classes
+        )
+
+        # ---- Слоты сокровищ: (id, уровень, возможные эффекты, зал) ----
+        slots = []
+        for h in scenario.get("halls", []):
+            base_tid = h.get("treasure")
+            if not base_tid:
+                continue
+            digits = "".join(ch for ch in str(base_tid) if ch.isdigit())
+            tier = int(digits) if digits.isdigit() else 1
+            effects_all = catalog.get_treasure_effects(tier) or loader.get_treasure_effects_for_id(base_tid)
+            slots.append((f"{base_tid}_{h['id']}", tier, tuple(effects_all or ["none"]), h["id"]))
+        self.treasure_slots: Tuple[Tuple[str, int, Tuple[str, ...], str], ...] = tuple(slots)
+
+        # ---- Колода героев ----
+        self.guild_deck: Tuple[str, ...] = tuple(h["id"] for h in catalog.heroes)
+
+        logger.info(f"[Templates] Built template for scenario '{scenario_id}' (catalog {catalog.version})")
+
+    def clone_halls(self) -> List[Hall]:
+        """Копии залов: неизменяемые поля общие, изменяемые списки — свои."""
+        return [
+            h.model_copy(update={
+                "connections": list(h.connections or []),
+                "tokens": list(h.tokens or []),
+                "heroes": [],
+                "monsters": [],
+            })
+            for h in self._halls
+        ]
+
+    def make_players(self, player_names: List[str], fill_bots: bool = False) -> List[Player]:
+        """Игроки по местам за столом; fill_bots — свободные места классов монстров занимают боты."""
+        names = [(name, False) for name in player_names]
+        if fill_bots:
+            names += [(f"Bot {i + 1}", True) for i in range(len(self.seats) - len(player_names))]
+        players = []
+        for i, (name, bot) in enumerate(names):
+            mc, deck = self.seats[i] if i < len(self.seats) else (None, ())
+            player = Player(id=f"p{i+1}", name=name, monster_class=mc, deck=list(deck), bot=bot)
+            player.shuffle_deck()         # 🔹 перемешиваем
+            player.draw_starting_hand(5)  # 🔹 берём стартовую руку
+            players.append(player)
+        return players
+
+    def make_treasures(self) -> List[Treasure]:
+        """Сокровища со случайно выбранными эффектами."""
+        return [
+            Treasure(id=tid, tier=tier, effects=random.sample(effects_all, k=min(1, len(effects_all))), location=location)
+            for tid, tier, effects_all, location in self.treasure_slots
+        ]
+
+    def make_guild_deck(self) -> List[str]:
+        deck = list(self.guild_deck)
+        random.shuffle(deck)
+        return deck
+
+
+# (сценарий, версия справочника) -> заготовка; не больше одной на сценарий справочника
+_templates: Dict[Tuple[str, str], ScenarioTemplate] = {}
+_templates_lock = threading.Lock()  # партии могут собираться в рабочих потоках (bulk_new)
+
+
+def get_template(scenario_id: str, catalog: Optional[Catalog] = None) -> ScenarioTemplate:
+    """
+    Заготовка из кэша по ключу (сценарий, версия справочника). Неизвестный
+    сценарий — ValueError, в кэш попадают только сценарии справочника;
+    заготовки прежних версий справочника удаляются.
+    """
+    catalog = catalog or get_catalog()
+    key = (scenario_id, catalog.version)
+    template = _templates.get(key)
+    if template is None:
+        if scenario_id not in catalog.scenarios:
+            raise ValueError(f"Unknown scenario '{scenario_id}'")
+        with _templates_lock:
+            template = _templates.get(key)
+            if template is None:
+                for stale in [k for k in _templates if k[1] != catalog.version]:
+                    del _templates[stale]
+                template = _templates[key] = ScenarioTemplate(catalog, scenario_id)
+    return template
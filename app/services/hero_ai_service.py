@@ -1,17 +1,39 @@
 import random
+from time import perf_counter
 from app.common.logger import logger
+from app.common.metrics import WAVE_LOG_ENTRIES, WAVE_SECONDS
+from app.common.tracing import traced
 from app.models import GameState, Hero, Hall
 from app.services.rule_engine import RuleEngine
 from app.services.game_log_service import GameLogService
 
+_WAVE_SECONDS = WAVE_SECONDS.labels()
+_WAVE_LOG_ENTRIES = WAVE_LOG_ENTRIES.labels()
+
 class HeroAIService:
     def __init__(self, redis):
         self.redis = redis
         self.rule_engine = RuleEngine()
-        self.log_service = GameLogService(redis)
+        self.bind_log_service(GameLogService(redis))
+
+    def bind_log_service(self, log_service):
+        self.log_service = log_service
+        self.rule_engine.bind_log_service(log_service)
 
+    async def _trigger(self, state: GameState, effects, cause: dict) -> int:
+        """
+        Эффекты сокровища применяются сразу, когда на него зашёл герой, —
+        следующие герои волны ходят уже в изменённой партии. Возвращает
+        число записей лога.
+        """
+        entries = await self.rule_engine.apply_batch(state, [(effects, cause)], [("treasure_open", dict(cause))])
+        return len(entries)
+
+    @traced()
     async def run_wave(self, state: GameState):
-        logger.info(f"[HeroAI] Starting wave {state.wave} for game {state.id}")
+        logger.info("[HeroAI] Starting wave %d for game %s", state.wave, state.id, extra={"game_id": state.id, "event": "wave_start"})
+        start = perf_counter()
+        logged = 0      # записей лога за волну (для метрик)
         actions = []
         if not state.heroes:
             state.heroes = []
@@ -20,6 +42,7 @@ class HeroAIService:
                 h = Hero(id=f"h{state.wave}_{i}", name=f"Hero_{state.wave}_{i}", hp=5 + state.wave, attack=2, defense=1, location="prison", status="active")
                 state.heroes.append(h)
             await self.log_service.add_entry(state.id, "heroes_spawn", {"count": len(state.heroes)})
+            logged += 1
 
         for hero in list(state.heroes):
             # move
@@ -34,6 +57,7 @@ class HeroAIService:
                 from_id = hero.location
                 hero.location = next_id
                 await self.log_service.add_entry(state.id, "hero_move", {"hero": hero.name, "from": from_id, "to": next_id})
+                logged += 1
                 actions.append({"type":"move","hero":hero.name,"from":from_id,"to":next_id})
 
             # check tokens
@@ -42,8 +66,16 @@ class HeroAIService:
                 for token in list(current_after.tokens):
                     if token.startswith("treasury_"):
                         tier = token.split("_")[1]
-                        await self.rule_engine.apply_treasure_effect(state, tier)
-                        await self.log_service.add_entry(state.id, "treasure_open", {"hero": hero.name, "tier": tier})
+                        cause = {"hero": hero.name, "tier": tier}
+                        logged += await self._trigger(state, self.rule_engine.catalog.get_treasure_effects(tier), cause)
                         actions.append({"type":"treasure","hero":hero.name,"tier":tier})
-        logger.info(f"[HeroAI] Wave {state.wave} finished with {len(actions)} actions")
+                treasure = current_after.treasure
+                if treasure and not treasure.opened:
+                    cause = {"hero": hero.name, "tier": str(treasure.tier), "treasure": treasure.id}
+                    logged += await self._trigger(state, self.rule_engine.open_treasure(state, treasure), cause)
+                    actions.append({"type":"treasure","hero":hero.name,"tier":str(treasure.tier)})
+
+        _WAVE_SECONDS.observe(perf_counter() - start)
+        _WAVE_LOG_ENTRIES.observe(logged)
+        logger.info("[HeroAI] Wave %d finished with %d actions", state.wave, len(actions), extra={"game_id": state.id, "event": "wave_end"})
         return actions
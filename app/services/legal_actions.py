@@ -0,0 +1,270 @@
+"""
+Перечисление допустимых действий игрока (подсказки клиенту, боты).
+
+Поле партии переводится в битовые маски: зал с индексом i — бит 1 << i.
+HallGraph хранит маски соседей каждого зала (из connections сценария),
+BoardMasks — где стоят герои, монстры и жетоны. Достижимость за k
+перемещений — k шагов расширения фронта операциями над int.
+
+Граф строится один раз на топологию залов; результат legal_actions
+кэшируется по версии сохранённого состояния (LegalActionCache).
+"""
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+from app.models import GameState, Hall, PhaseType, Player
+from app.services.card_programs import (
+    OP_ACTION,
+    OP_ALL_ATTACK,
+    OP_ALL_MOVE,
+    OP_ALL_RANGE_ATTACK,
+    OP_ATTACK,
+    OP_CREATE_PORTAL,
+    OP_CREATE_TRAP,
+    OP_MOVE,
+    OP_RANGE_ATTACK,
+    OP_SPAWN,
+    OP_TAKE_CARD,
+    OP_VIEW_TAKE_CARD,
+    OPCODE_NAMES,
+    Program,
+)
+from app.services.catalog import Catalog
+
+# шаги, которым нужен монстр игрока на поле
+_NEEDS_MONSTER = frozenset({
+    OP_MOVE, OP_ATTACK, OP_RANGE_ATTACK, OP_ALL_MOVE, OP_ALL_ATTACK, OP_ALL_RANGE_ATTACK,
+    OP_ACTION, OP_CREATE_TRAP, OP_CREATE_PORTAL,
+})
+
+
+def iter_bits(mask: int):
+    """Индексы установленных битов, от младшего."""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+class HallGraph:
+    """Граф залов партии в битах."""
+
+    __slots__ = ("ids", "index", "adjacency", "all")
+
+    def __init__(self, halls: Iterable[Hall]):
+        halls = list(halls)
+        self.ids: Tuple[str, ...] = tuple(h.id for h in halls)
+        self.index: Dict[str, int] = {hid: i for i, hid in enumerate(self.ids)}
+        adjacency = [0] * len(self.ids)
+        for i, hall in enumerate(halls):
+            for target in hall.connections or []:
+                j = self.index.get(target)
+                if j is not None:
+                    adjacency[i] |= 1 << j
+        self.adjacency: Tuple[int, ...] = tuple(adjacency)
+        self.all = (1 << len(self.ids)) - 1
+
+    def bit(self, hall_id: Optional[str]) -> int:
+        i = self.index.get(hall_id)
+        return 0 if i is None else 1 << i
+
+    def mask(self, hall_ids: Iterable[str]) -> int:
+        m = 0
+        for hid in hall_ids:
+            m |= self.bit(hid)
+        return m
+
+    def neighbors(self, mask: int) -> int:
+        """Залы, соседние хотя бы с одним залом из mask."""
+        out = 0
+        adjacency = self.adjacency
+        for i in iter_bits(mask):
+            out |= adjacency[i]
+        return out
+
+    def reach(self, start: int, k: int) -> int:
+        """Залы, достижимые из start не более чем за k перемещений (включая start)."""
+        seen = frontier = start
+        for _ in range(k):
+            frontier = self.neighbors(frontier) & ~seen
+            if not frontier:
+                break
+            seen |= frontier
+        return seen
+
+    def halls(self, mask: int) -> List[str]:
+        ids = self.ids
+        return [ids[i] for i in iter_bits(mask)]
+
+
+_graphs: "OrderedDict[tuple, HallGraph]" = OrderedDict()
+_GRAPH_CACHE_SIZE = 64
+
+
+def get_hall_graph(halls: List[Hall]) -> HallGraph:
+    """Граф из кэша по топологии (id и connections залов) — обычно один на сценарий."""
+    key = tuple((h.id, tuple(h.connections or ())) for h in halls)
+    graph = _graphs.get(key)
+    if graph is None:
+        graph = _graphs[key] = HallGraph(halls)
+        if len(_graphs) > _GRAPH_CACHE_SIZE:
+            _graphs.popitem(last=False)
+    else:
+        _graphs.move_to_end(key)
+    return graph
+
+
+class BoardMasks:
+    """Занятость залов: герои, монстры игрока, чужие монстры, жетоны по видам."""
+
+    __slots__ = ("heroes", "own_monsters", "other_monsters", "tokens", "spawn")
+
+    def __init__(self, state: GameState, graph: HallGraph, player_id: Optional[str]):
+        bit = graph.bit
+        self.heroes = 0
+        for hero in state.heroes:
+            self.heroes |= bit(hero.location)
+        self.own_monsters = self.other_monsters = 0
+        for monster in state.monsters:
+            if monster.owner_id == player_id:
+                self.own_monsters |= bit(monster.location)
+            else:
+                self.other_monsters |= bit(monster.location)
+        self.tokens: Dict[str, int] = {}
+        self.spawn: Dict[str, int] = {}
+        for hall in state.halls:
+            b = bit(hall.id)
+            for token in hall.tokens or []:
+                self.tokens[token] = self.tokens.get(token, 0) | b
+            if hall.spawn:
+                self.spawn[hall.spawn] = self.spawn.get(hall.spawn, 0) | b
+
+
+def _max_moves(programs: Iterable[Program]) -> int:
+    """Сколько перемещений подряд может дать одна карта руки (не меньше 1)."""
+    best = 1
+    for program in programs:
+        for option in program:
+            best = max(best, sum(1 for op, _ in option if op in (OP_MOVE, OP_ALL_MOVE)))
+    return best
+
+
+def _option_effective(option, player: Player, state: GameState, graph: HallGraph, board: BoardMasks,
+                      monster_bits: List[int], can_spawn: bool) -> bool:
+    """Изменит ли вариант карты что-нибудь на поле (иначе розыгрыш пустой)."""
+    for op, arg in option:
+        if op == OP_SPAWN:
+            if can_spawn and board.spawn.get(arg):
+                return True
+        elif op in _NEEDS_MONSTER:
+            if op in (OP_ATTACK, OP_ALL_ATTACK):
+                if any(board.heroes & b for b in monster_bits):
+                    return True
+            elif op in (OP_RANGE_ATTACK, OP_ALL_RANGE_ATTACK):
+                if any(board.heroes & graph.neighbors(b) for b in monster_bits):
+                    return True
+            elif op in (OP_MOVE, OP_ALL_MOVE):
+                if any(graph.neighbors(b) for b in monster_bits):
+                    return True
+            elif monster_bits:
+                return True
+        elif op == OP_TAKE_CARD:
+            if player.deck or player.discard_pile:
+                return True
+        elif op == OP_VIEW_TAKE_CARD:
+            if state.shop_deck:
+                return True
+        else:
+            return True
+    return False
+
+
+def legal_actions(state: GameState, player_id: Optional[str], catalog: Catalog) -> dict:
+    """
+    Допустимые действия игрока в текущем состоянии:
+    перемещения и цели атак монстров, варианты карт руки, покупки в магазине.
+    """
+    pid = player_id or state.current_player_id
+    player = next((p for p in state.players if p.id == pid), None)
+    if player is None:
+        raise ValueError(f"Unknown player '{pid}'")
+
+    active = not state.game_over and state.phase == PhaseType.PLAYER and not player.defeated
+    graph = get_hall_graph(state.halls)
+    board = BoardMasks(state, graph, player.id)
+
+    programs = {cid: catalog.get_card_program(cid) for cid in dict.fromkeys(player.hand)}
+    programs = {cid: p for cid, p in programs.items() if p}
+    k = _max_moves(programs.values())
+
+    # ---- Монстры ----
+    own = [m for m in state.monsters if m.owner_id == player.id]
+    monsters, monster_bits = [], []
+    hero_ids_by_hall: Dict[str, List[str]] = {}
+    for hero in state.heroes:
+        hero_ids_by_hall.setdefault(hero.location, []).append(hero.id)
+    for m in own:
+        b = graph.bit(m.location)
+        monster_bits.append(b)
+        adjacent = graph.neighbors(b)
+        monsters.append({
+            "id": m.id,
+            "location": m.location,
+            "moves": graph.halls(adjacent) if active else [],
+            "reach": graph.halls(graph.reach(b, k) & ~b) if active else [],
+            "attack": list(hero_ids_by_hall.get(m.location, [])) if active else [],
+            "range_attack": [h for hall in graph.halls(adjacent & board.heroes) for h in hero_ids_by_hall[hall]] if active else [],
+        })
+
+    # ---- Карты руки ----
+    cls = catalog.monster_classes_by_id.get(player.monster_class) or {}
+    can_spawn = bool(cls) and len(own) < int(cls.get("max_count", 1))
+    cards = []
+    if active:
+        for card_id, program in programs.items():
+            cards.append({
+                "card": card_id,
+                "options": [
+                    {
+                        "option": i,
+                        "steps": [OPCODE_NAMES[op] for op, _ in option],
+                        "effective": _option_effective(option, player, state, graph, board, monster_bits, can_spawn),
+                    }
+                    for i, option in enumerate(program)
+                ],
+            })
+
+    # ---- Магазин: цен в данных нет, доступно всё с витрины ----
+    shop = list(state.shop_display or []) if active else []
+
+    return {
+        "player_id": player.id,
+        "active": active,
+        "max_moves": k,
+        "monsters": monsters,
+        "cards": cards,
+        "shop": shop,
+        "spawn_halls": {tag: graph.halls(mask) for tag, mask in board.spawn.items()} if active and can_spawn else {},
+    }
+
+
+class LegalActionCache:
+    """LRU ответов (готовый JSON) по ключу (партия, версия состояния, игрок)."""
+
+    def __init__(self, maxsize: int = 4096):
+        self.maxsize = maxsize
+        self._items: "OrderedDict[tuple, bytes]" = OrderedDict()
+
+    def get(self, key: tuple) -> Optional[bytes]:
+        value = self._items.get(key)
+        if value is not None:
+            self._items.move_to_end(key)
+        return value
+
+    def put(self, key: tuple, value: bytes):
+        self._items[key] = value
+        self._items.move_to_end(key)
+        if len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+
+legal_action_cache = LegalActionCache()
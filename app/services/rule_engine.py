@@ -1,64 +1,109 @@
+from typing import Iterable, List, Optional, Sequence, Tuple
 from app.common.logger import logger
-from app.models import GameState
-from app.services.data_loader import DataLoader
+from app.common.tracing import traced
+from app.models import GameState, PhaseType, Treasure
+from app.services.card_programs import PlayContext, run_program
+from app.services.catalog import Catalog, get_catalog
 
 class RuleEngine:
-    def __init__(self):
+    def __init__(self, catalog: Optional[Catalog] = None):
         self.log_service = None
+        self.catalog = catalog or get_catalog()
 
     def bind_log_service(self, log_service):
         self.log_service = log_service
 
-    async def apply_treasure_effect(self, state: GameState, tier: str):
-        loader = DataLoader()
-        loader.load_all()
-        effects = loader.get_treasure_effects(tier) or []
-        logger.info(f"[RuleEngine] Applying effects {effects} for tier {tier}")
+    @traced()
+    def run_effects(self, state: GameState, effects: Iterable[str], entries: List[Tuple[str, dict]],
+                    cause: Optional[dict] = None):
+        """
+        Применяет эффекты по таблице из справочника.
+        Записи лога не пишутся сразу, а добавляются в `entries`.
+        Если эффект завершил партию поражением, добавляется game_defeat
+        с волной и причиной `cause` (уровень и id сокровища, герой).
+        """
+        table = self.catalog.effects
+        was_over = state.game_over
         for eff in effects:
-            if eff == "robbery":
-                await self._robbery(state)
-            elif eff == "curse":
-                await self._curse(state)
-            elif eff == "heal":
-                await self._heal(state)
-            elif eff == "prisoner":
-                await self._prisoner(state)
-            elif eff == "defeat":
-                await self._defeat(state)
+            compiled = table.get(eff)
+            if compiled is None:
+                logger.warning(f"[RuleEngine] Unknown effect '{eff}' ignored")
+                continue
+            handler, params = compiled
+            for payload in handler(state, params):
+                entries.append((f"effect_{eff}", payload))
+            if state.game_over and not was_over:
+                was_over = True
+                if state.result != "victory":
+                    entries.append(("game_defeat", {"wave": state.wave, "result": state.result, "effect": eff, **(cause or {})}))
 
-    async def _robbery(self, state: GameState):
-        for p in state.players:
-            if p.resources.get("gold", 0) > 0:
-                p.resources["gold"] -= 1
+    @traced()
+    async def apply_batch(self, state: GameState, triggered: Iterable[Tuple[Iterable[str], Optional[dict]]],
+                          entries: Optional[List[Tuple[str, dict]]] = None):
+        """
+        Применяет наборы эффектов нескольких сработавших сокровищ за один проход
+        и записывает все события лога одним запросом. triggered — пары
+        (эффекты, причина для game_defeat).
+        """
+        entries = [] if entries is None else entries
+        for effects, cause in triggered:
+            self.run_effects(state, effects, entries, cause)
         if self.log_service:
-            await self.log_service.add_entry(state.id, "effect_robbery", {})
+            await self.log_service.add_entries(state.id, entries)
+        return entries
 
-    async def _curse(self, state: GameState):
-        for p in state.players:
-            if p.hand:
-                discarded = p.hand.pop(0)
-                if self.log_service:
-                    await self.log_service.add_entry(state.id, "effect_curse", {"player": p.name, "card": discarded})
+    @traced()
+    async def apply_treasure_effect(self, state: GameState, tier: str):
+        effects = self.catalog.get_treasure_effects(tier)
+        logger.info("[RuleEngine] Applying effects %s for tier %s", effects, tier, extra={"game_id": state.id, "event": "treasure_effect"})
+        await self.apply_batch(state, [(effects, {"tier": tier})])
 
-    async def _heal(self, state: GameState):
-        for h in state.heroes:
-            h.hp += 2
-        if self.log_service:
-            await self.log_service.add_entry(state.id, "effect_heal", {})
+    def open_treasure(self, state: GameState, treasure: Treasure) -> List[str]:
+        """Помечает сокровище открытым и возвращает его эффекты (выбранные при создании партии)."""
+        treasure.opened = True
+        for t in state.treasures:
+            if t.id == treasure.id:
+                t.opened = True
+        return treasure.effects
 
-    async def _prisoner(self, state: GameState):
-        # move first hero (if any) to prison or create captive
-        if state.heroes:
-            hero = state.heroes.pop(0)
-            # find prison hall
-            prison = next((x for x in state.halls if x.id == "prison"), None)
-            if prison:
-                prison.tokens.append("prisoner")
-        if self.log_service:
-            await self.log_service.add_entry(state.id, "effect_prisoner", {})
+    @traced()
+    async def play_card(self, state: GameState, card_id: str, player_id: Optional[str] = None, option: int = 0,
+                        monster_id: Optional[str] = None, targets: Sequence[str] = ()) -> List[Tuple[str, dict]]:
+        """
+        Розыгрыш карты из руки игрока: выполняется вариант `option` её
+        скомпилированной программы, карта уходит в сброс. Все проверки —
+        до изменения состояния (ValueError).
+        """
+        if state.game_over:
+            raise ValueError("Game is over")
+        if state.phase != PhaseType.PLAYER:
+            raise ValueError("Cards can be played only in player phase")
+        pid = player_id or state.current_player_id
+        player = next((p for p in state.players if p.id == pid), None)
+        if player is None:
+            raise ValueError(f"Unknown player '{pid}'")
+        if player.defeated:
+            raise ValueError(f"Player '{pid}' is defeated")
+        if card_id not in player.hand:
+            raise ValueError(f"Card '{card_id}' is not in hand of player '{player.id}'")
+        program = self.catalog.get_card_program(card_id)
+        if program is None:
+            raise ValueError(f"Card '{card_id}' has no actions")
+        if not 0 <= option < len(program):
+            raise ValueError(f"Card '{card_id}' has no option {option}")
+        own = [m for m in state.monsters if m.owner_id == player.id]
+        if monster_id is not None:
+            monster = next((m for m in own if m.id == monster_id), None)
+            if monster is None:
+                raise ValueError(f"Monster '{monster_id}' does not belong to player '{player.id}'")
+        else:
+            monster = own[0] if own else None
 
-    async def _defeat(self, state: GameState):
-        state.game_over = True
-        state.result = "defeat"
+        player.hand.remove(card_id)
+        player.discard_pile.append(card_id)
+        ctx = PlayContext(state, player, monster, targets, self.catalog)
+        ctx.entries.append(("card_play", {"player": player.id, "card": card_id, "option": option}))
+        entries = run_program(ctx, program, option)
         if self.log_service:
-            await self.log_service.add_entry(state.id, "effect_defeat", {"result":"defeat"})
+            await self.log_service.add_entries(state.id, entries)
+        return entries
@@ -0,0 +1,71 @@
+import random
+from typing import Any, Dict, List, Optional
+from app.common.logger import logger
+from app.models import GameState, PhaseType
+from app.services.catalog import Catalog, get_catalog
+
+DISPLAY_SIZE = 5
+
+
+class ShopService:
+    """
+    Операции магазина прямо над GameState.
+
+    В состоянии хранятся только id: shop_deck — оставшаяся стопка
+    (верхняя карта — конец списка), shop_display — витрина.
+    Данные карт берутся из общего справочника, поэтому покупка не создаёт
+    и не валидирует pydantic-модели.
+    """
+
+    def __init__(self, catalog: Optional[Catalog] = None):
+        self.catalog = catalog or get_catalog()
+
+    def setup(self, state: GameState):
+        """Перемешать колоду магазина и выложить стартовую витрину."""
+        deck = list(self.catalog.shop_cards_by_id)
+        random.shuffle(deck)
+        display = [deck.pop() for _ in range(min(DISPLAY_SIZE, len(deck)))]
+        state.shop_deck = deck
+        state.shop_display = display
+
+    def buy(self, state: GameState, card_id: str, player_id: Optional[str] = None) -> str:
+        """
+        Покупка карты с витрины: карта уходит в сброс игрока,
+        освободившееся место занимает верхняя карта стопки.
+        """
+        if state.game_over:
+            raise ValueError("Game is over")
+        if state.phase != PhaseType.PLAYER:
+            raise ValueError("Shop is available only in player phase")
+
+        player_id = player_id or state.current_player_id
+        player = next((p for p in state.players if p.id == player_id), None)
+        if not player:
+            raise ValueError(f"Unknown player '{player_id}'")
+        if player.defeated:
+            raise ValueError(f"Player '{player_id}' is defeated")
+
+        display = state.shop_display or []
+        try:
+            slot = display.index(card_id)
+        except ValueError:
+            raise ValueError(f"Card '{card_id}' is not on display") from None
+
+        deck = state.shop_deck or []
+        if deck:
+            display[slot] = deck.pop()
+        else:
+            display.pop(slot)
+
+        player.discard_pile.append(card_id)
+        logger.info("[Shop] %s: player %s bought %s", state.id, player.id, card_id, extra={"game_id": state.id, "event": "shop_buy"})
+        return card_id
+
+    def expand_display(self, display_ids: Optional[List[str]]) -> List[Dict[str, Any]]:
+        """Полные данные карт витрины для ответа клиенту."""
+        if not display_ids:
+            return []
+        cards = self.catalog.shop_cards_by_id
+        # в состояниях до перехода на id витрина хранит полные данные карт
+        display_ids = [c.get("id") if isinstance(c, dict) else c for c in display_ids]
+        return [cards[cid] for cid in display_ids if cid in cards]
@@ -0,0 +1,441 @@
+"""
+Состояние партии для перебора ходов (боты, поиск по дереву).
+
+GameState — pydantic-модель, и глубокая копия на каждый просматриваемый
+вариант слишком дорога. SimState хранит то же поле в плоских списках:
+залы — индексы, герои и монстры — параллельные списки, скаляры партии —
+список g. Все изменения идут через журнал отмены: snapshot() — длина
+журнала, O(1); undo(mark) откатывает записи после отметки, стоимость —
+число сделанных с тех пор изменений, а не размер состояния.
+
+То, что не меняется в пределах партии (граф залов, программы карт,
+эффекты сокровищ, классы монстров), собрано в SimRules и общее для всех
+ветвей поиска.
+
+Правила повторяют движок: розыгрыш — RuleEngine.play_card и
+card_programs, волна — HeroAIService.run_wave и GameService.check_victory,
+эффекты сокровищ — effects.py. Не моделируется то, что не влияет на
+исход: записи лога, ресурсы игроков, жетоны ловушек и порталов.
+"""
+import random
+from typing import Dict, FrozenSet, List, Optional, Sequence, Tuple
+from app.models import GameState
+from app.services.card_programs import (
+    KINDS,
+    OP_ALL_ATTACK,
+    OP_ALL_MOVE,
+    OP_ALL_RANGE_ATTACK,
+    OP_ATTACK,
+    OP_MOVE,
+    OP_RANGE_ATTACK,
+    OP_SPAWN,
+    OP_TAKE_CARD,
+    OP_VIEW_TAKE_CARD,
+    Program,
+)
+from app.services.catalog import Catalog
+
+MAX_WAVES = 3  # как в GameService.check_victory
+
+# индексы скаляров партии в SimState.g
+G_WAVE, G_OVER, G_RESULT, G_BAD_EFFECTS, G_HEROES_DEFEATED = range(5)
+
+# записи журнала отмены
+_U_SET, _U_APPEND, _U_POP, _U_REPLACE = range(4)
+
+# эффекты, которые не вредят монстрам (для оценки позиции)
+_HARMLESS_EFFECTS = frozenset({"noop", "take_resource"})
+
+# (карта, вариант, индекс монстра или -1, зал первого перемещения или -1); None — закончить ход
+Action = Optional[Tuple[str, int, int, int]]
+
+
+class SimRules:
+    """Неизменяемая часть партии: топология, программы карт, эффекты, классы монстров игроков."""
+
+    __slots__ = (
+        "hall_ids", "adjacency", "spawn_hall", "prison", "token_effects", "treasure_effects",
+        "programs", "effects", "shop_cards", "player_ids", "max_monsters", "monster_hp",
+        "monster_class", "defeated",
+    )
+
+    def __init__(self, state: GameState, catalog: Catalog):
+        halls = state.halls
+        self.hall_ids: Tuple[str, ...] = tuple(h.id for h in halls)
+        index = {hid: i for i, hid in enumerate(self.hall_ids)}
+        self.adjacency: Tuple[Tuple[int, ...], ...] = tuple(
+            tuple(index[c] for c in (h.connections or []) if c in index) for h in halls
+        )
+        self.spawn_hall: Dict[str, int] = {}
+        for i, h in enumerate(halls):
+            if h.spawn and h.spawn not in self.spawn_hall:
+                self.spawn_hall[h.spawn] = i
+        self.prison = index.get("prison", -1)
+
+        # жетоны сокровищ срабатывают каждый раз, когда герой оказывается в зале
+        self.token_effects: Tuple[Tuple[Tuple[str, ...], ...], ...] = tuple(
+            tuple(
+                tuple(catalog.get_treasure_effects(token.split("_")[1]))
+                for token in (h.tokens or []) if token.startswith("treasury_")
+            )
+            for h in halls
+        )
+        # сокровище зала — один раз
+        self.treasure_effects: Tuple[Optional[Tuple[str, ...]], ...] = tuple(
+            tuple(h.treasure.effects) if h.treasure else None for h in halls
+        )
+
+        self.programs: Dict[str, Program] = catalog.card_programs
+        defs = catalog.loader.effect_defs
+        self.effects: Dict[str, Tuple[str, dict]] = {
+            name: (defs.get(name, {}).get("handler"), params) for name, (_, params) in catalog.effects.items()
+        }
+        self.shop_cards: Dict[str, Tuple[Optional[str], FrozenSet[int]]] = {
+            cid: (card.get("class_id"), frozenset(op for option in self.programs.get(cid, ()) for op, _ in option))
+            for cid, card in catalog.shop_cards_by_id.items()
+        }
+
+        self.player_ids: Tuple[str, ...] = tuple(p.id for p in state.players)
+        classes = [catalog.monster_classes_by_id.get(p.monster_class) for p in state.players]
+        self.max_monsters: Tuple[int, ...] = tuple(int(c.get("max_count", 1)) if c else 0 for c in classes)
+        self.monster_hp: Tuple[int, ...] = tuple(int(c.get("hp", 1)) if c else 0 for c in classes)
+        self.monster_class: Tuple[Optional[str], ...] = tuple(c["class"] if c else None for c in classes)
+        self.defeated: Tuple[bool, ...] = tuple(p.defeated for p in state.players)
+
+
+class SimState:
+    """Изменяемая часть партии с журналом отмены."""
+
+    __slots__ = (
+        "rules", "g", "hero_hp", "hero_loc", "hero_alive", "mon_ids", "mon_owner", "mon_loc",
+        "hands", "decks", "discards", "player_monsters", "opened", "shop_deck", "rng", "_trail",
+    )
+
+    def __init__(self, rules: SimRules):
+        self.rules = rules
+        self.g: list = [0, False, None, 0, 0]
+        self.hero_hp: List[int] = []
+        self.hero_loc: List[int] = []
+        self.hero_alive: List[bool] = []
+        self.mon_ids: List[str] = []
+        self.mon_owner: List[int] = []
+        self.mon_loc: List[int] = []
+        self.hands: List[List[str]] = []
+        self.decks: List[List[str]] = []
+        self.discards: List[List[str]] = []
+        self.player_monsters: List[int] = []  # len(Player.monsters): от него зависит id нового монстра
+        self.opened: List[bool] = []
+        self.shop_deck: List[str] = []
+        self.rng = random.Random()
+        self._trail: list = []
+
+    @classmethod
+    def from_game(cls, state: GameState, catalog: Catalog, seed: Optional[int] = None) -> "SimState":
+        rules = SimRules(state, catalog)
+        sim = cls(rules)
+        index = {hid: i for i, hid in enumerate(rules.hall_ids)}
+        players = {pid: i for i, pid in enumerate(rules.player_ids)}
+        sim.g = [state.wave, state.game_over, state.result, 0, 0]
+        for hero in state.heroes:
+            sim.hero_hp.append(hero.hp)
+            sim.hero_loc.append(index.get(hero.location, -1))
+            sim.hero_alive.append(True)
+        for monster in state.monsters:
+            sim.mon_ids.append(monster.id)
+            sim.mon_owner.append(players.get(monster.owner_id, -1))
+            sim.mon_loc.append(index.get(monster.location, -1))
+        for p in state.players:
+            sim.hands.append(list(p.hand))
+            sim.decks.append(list(p.deck))
+            sim.discards.append(list(p.discard_pile))
+            sim.player_monsters.append(len(p.monsters))
+        sim.opened = [bool(h.treasure and h.treasure.opened) for h in state.halls]
+        sim.shop_deck = list(state.shop_deck or [])
+        sim.rng = random.Random(seed)
+        return sim
+
+    # ----------------------------
+    # Журнал отмены
+    # ----------------------------
+    def snapshot(self) -> int:
+        return len(self._trail)
+
+    def undo(self, mark: int):
+        trail = self._trail
+        while len(trail) > mark:
+            kind, lst, i, value = trail.pop()
+            if kind == _U_SET:
+                lst[i] = value
+            elif kind == _U_APPEND:
+                lst.pop()
+            elif kind == _U_POP:
+                lst.insert(i, value)
+            else:
+                lst[:] = value
+
+    def _set(self, lst: list, i: int, value):
+        self._trail.append((_U_SET, lst, i, lst[i]))
+        lst[i] = value
+
+    def _append(self, lst: list, value):
+        self._trail.append((_U_APPEND, lst, 0, None))
+        lst.append(value)
+
+    def _pop(self, lst: list, i: int = -1):
+        i = i % len(lst)
+        value = lst.pop(i)
+        self._trail.append((_U_POP, lst, i, value))
+        return value
+
+    def _replace(self, lst: list, values: list):
+        self._trail.append((_U_REPLACE, lst, 0, lst[:]))
+        lst[:] = values
+
+    # ----------------------------
+    # Поле
+    # ----------------------------
+    @property
+    def game_over(self) -> bool:
+        return self.g[G_OVER]
+
+    def own_monsters(self, p: int) -> List[int]:
+        return [i for i, owner in enumerate(self.mon_owner) if owner == p]
+
+    def _hero_halls(self) -> set:
+        return {loc for loc, alive in zip(self.hero_loc, self.hero_alive) if alive}
+
+    def _heroes_in(self, halls: Sequence[int]) -> List[int]:
+        return [i for i, (loc, alive) in enumerate(zip(self.hero_loc, self.hero_alive)) if alive and loc in halls]
+
+    def active_players(self) -> List[int]:
+        rules = self.rules
+        return [p for p in range(len(rules.player_ids)) if not rules.defeated[p] and rules.monster_class[p]]
+
+    # ----------------------------
+    # Ход игрока
+    # ----------------------------
+    def _effective(self, p: int, option, own: List[int], hero_halls: set) -> bool:
+        """Изменит ли вариант карты исход (как legal_actions._option_effective, без шагов-пустышек)."""
+        rules = self.rules
+        adjacency = rules.adjacency
+        for op, arg in option:
+            if op == OP_SPAWN:
+                if len(own) < rules.max_monsters[p] and arg in rules.spawn_hall:
+                    return True
+            elif op in (OP_ATTACK, OP_ALL_ATTACK):
+                if any(self.mon_loc[m] in hero_halls for m in own):
+                    return True
+            elif op in (OP_RANGE_ATTACK, OP_ALL_RANGE_ATTACK):
+                if any(c in hero_halls for m in own if self.mon_loc[m] >= 0 for c in adjacency[self.mon_loc[m]]):
+                    return True
+            elif op in (OP_MOVE, OP_ALL_MOVE):
+                if any(self.mon_loc[m] >= 0 and adjacency[self.mon_loc[m]] for m in own):
+                    return True
+            elif op == OP_TAKE_CARD:
+                if self.decks[p] or self.discards[p]:
+                    return True
+            elif op == OP_VIEW_TAKE_CARD:
+                if self.shop_deck:
+                    return True
+        return False
+
+    def actions(self, p: int) -> List[Action]:
+        """Розыгрыши, которые что-то меняют: карта x вариант x монстр x зал первого шага move."""
+        rules = self.rules
+        own = self.own_monsters(p)
+        hero_halls = self._hero_halls()
+        result: List[Action] = []
+        for card in dict.fromkeys(self.hands[p]):
+            program = rules.programs.get(card)
+            if not program:
+                continue
+            for o, option in enumerate(program):
+                if not self._effective(p, option, own, hero_halls):
+                    continue
+                ops = {op for op, _ in option}
+                if OP_MOVE in ops and own:
+                    for m in own:
+                        if self.mon_loc[m] >= 0:
+                            result.extend((card, o, m, t) for t in rules.adjacency[self.mon_loc[m]])
+                elif len(own) > 1 and ops & {OP_ATTACK, OP_RANGE_ATTACK}:
+                    result.extend((card, o, m, -1) for m in own)
+                else:
+                    result.append((card, o, -1, -1))
+        return result
+
+    def play(self, p: int, action: Action):
+        """Розыгрыш карты: как RuleEngine.play_card (проверки — на стороне вызывающего)."""
+        card, option, m, target = action
+        hand = self.hands[p]
+        self._pop(hand, hand.index(card))
+        self._append(self.discards[p], card)
+        if m < 0:
+            own = self.own_monsters(p)
+            m = own[0] if own else -1
+        targets = [target] if target >= 0 else []
+        for op, arg in self.rules.programs[card][option]:
+            m = self._step(p, op, arg, m, targets)
+
+    def _step(self, p: int, op: int, arg, m: int, targets: list) -> int:
+        """Один шаг программы; возвращает текущего монстра (spawn может его назначить)."""
+        if op in (OP_MOVE, OP_ATTACK, OP_RANGE_ATTACK):
+            if m >= 0:
+                self._monster_step(op, m, targets)
+            elif op == OP_MOVE and targets:
+                targets.pop()
+        elif op in (OP_ALL_MOVE, OP_ALL_ATTACK, OP_ALL_RANGE_ATTACK):
+            single = op - OP_ALL_MOVE + OP_MOVE
+            for monster in self.own_monsters(p):
+                self._monster_step(single, monster, targets)
+        elif op == OP_SPAWN:
+            m = self._spawn(p, arg, m)
+        elif op == OP_TAKE_CARD:
+            self._draw(p)
+        elif op == OP_VIEW_TAKE_CARD:
+            self._view_take(p, arg)
+        return m
+
+    def _monster_step(self, op: int, m: int, targets: list):
+        adjacency = self.rules.adjacency
+        loc = self.mon_loc[m]
+        connections = adjacency[loc] if loc >= 0 else ()
+        if op == OP_MOVE:
+            target = targets.pop() if targets else None
+            if target not in connections:
+                hero_halls = self._hero_halls()
+                target = next((c for c in connections if c in hero_halls), None)
+            if target is not None:
+                self._set(self.mon_loc, m, target)
+            return
+        heroes = self._heroes_in((loc,) if op == OP_ATTACK else connections)
+        if heroes:
+            self._damage(min(heroes, key=self.hero_hp.__getitem__))
+
+    def _damage(self, h: int):
+        hp = self.hero_hp[h] - 1
+        self._set(self.hero_hp, h, hp)
+        if hp <= 0:
+            self._set(self.hero_alive, h, False)
+            self._set(self.g, G_HEROES_DEFEATED, self.g[G_HEROES_DEFEATED] + 1)
+
+    def _spawn(self, p: int, tag: str, m: int) -> int:
+        rules = self.rules
+        if not rules.monster_class[p] or len(self.own_monsters(p)) >= rules.max_monsters[p]:
+            return m
+        hall = rules.spawn_hall.get(tag)
+        if hall is None:
+            return m
+        n = self.player_monsters[p] + 1
+        self._set(self.player_monsters, p, n)
+        self._append(self.mon_ids, f"{rules.player_ids[p]}_m{n}")
+        self._append(self.mon_owner, p)
+        self._append(self.mon_loc, hall)
+        return len(self.mon_ids) - 1 if m < 0 else m
+
+    def _draw(self, p: int):
+        deck, discard = self.decks[p], self.discards[p]
+        if not deck and discard:
+            cards = discard[:]
+            self.rng.shuffle(cards)
+            self._replace(deck, cards)
+            self._replace(discard, [])
+        if deck:
+            self._append(self.hands[p], self._pop(deck))
+
+    def _view_take(self, p: int, value: str):
+        opcode = KINDS[value][0] if value in KINDS else None
+        deck = self.shop_deck
+        cards = self.rules.shop_cards
+        for i in range(len(deck) - 1, -1, -1):
+            class_id, ops = cards.get(deck[i], (None, frozenset()))
+            if class_id == value or opcode in ops:
+                self._append(self.hands[p], self._pop(deck, i))
+                return
+
+    def random_turn(self, p: int, rng: random.Random, max_plays: int = 5):
+        """Случайный ход для доигрывания: несколько случайных карт руки с вариантом по умолчанию."""
+        hand = self.hands[p]
+        programs = self.rules.programs
+        for _ in range(max_plays):
+            if not hand or rng.random() < 0.2:
+                return
+            card = rng.choice(hand)
+            program = programs.get(card)
+            if not program:
+                return
+            self.play(p, (card, rng.randrange(len(program)), -1, -1))
+
+    # ----------------------------
+    # Волна героев
+    # ----------------------------
+    def run_wave(self, rng: random.Random):
+        """Фаза героев: как GameService.apply_next_wave без записей лога."""
+        rules, g = self.rules, self.g
+        wave = g[G_WAVE] + 1
+        self._set(g, G_WAVE, wave)
+        if not any(self.hero_alive):
+            for _ in range(min(3, wave + 1)):
+                self._append(self.hero_hp, 5 + wave)
+                self._append(self.hero_loc, rules.prison)
+                self._append(self.hero_alive, True)
+
+        adjacency = rules.adjacency
+        for h in range(len(self.hero_hp)):
+            if not self.hero_alive[h]:
+                continue
+            loc = self.hero_loc[h]
+            if loc < 0:
+                if not adjacency:
+                    continue
+                loc = 0
+            if adjacency[loc]:
+                loc = rng.choice(adjacency[loc])
+            if loc != self.hero_loc[h]:
+                self._set(self.hero_loc, h, loc)
+            # эффекты применяются сразу, как в HeroAIService.run_wave
+            for effects in rules.token_effects[loc]:
+                for name in effects:
+                    self._effect(name)
+            effects = rules.treasure_effects[loc]
+            if effects is not None and not self.opened[loc]:
+                self._set(self.opened, loc, True)
+                for name in effects:
+                    self._effect(name)
+        if wave >= MAX_WAVES and not g[G_OVER]:
+            self._set(g, G_OVER, True)
+            self._set(g, G_RESULT, "victory")
+
+    def _effect(self, name: str):
+        handler, params = self.rules.effects.get(name, (None, {}))
+        if handler is None:
+            return
+        if handler not in _HARMLESS_EFFECTS:
+            self._set(self.g, G_BAD_EFFECTS, self.g[G_BAD_EFFECTS] + 1)
+        if handler == "discard_first_card":
+            for hand in self.hands:
+                if hand:
+                    self._pop(hand, 0)
+        elif handler == "heal_heroes":
+            amount = int(params.get("amount", 2))
+            for h, alive in enumerate(self.hero_alive):
+                if alive:
+                    self._set(self.hero_hp, h, self.hero_hp[h] + amount)
+        elif handler == "capture_hero":
+            h = next((i for i, alive in enumerate(self.hero_alive) if alive), None)
+            if h is not None:
+                self._set(self.hero_alive, h, False)
+        elif handler == "end_game":
+            self._set(self.g, G_OVER, True)
+            self._set(self.g, G_RESULT, params.get("result", "defeat"))
+
+    # ----------------------------
+    # Оценка
+    # ----------------------------
+    def score(self) -> float:
+        """Оценка для стороны монстров в [0, 1]: исход партии, вредные эффекты, побеждённые герои."""
+        g = self.g
+        if g[G_RESULT] == "defeat":
+            return 0.0
+        value = 1.0 if g[G_OVER] else 0.6
+        value += 0.04 * g[G_HEROES_DEFEATED] - 0.08 * g[G_BAD_EFFECTS]
+        return min(1.0, max(0.0, value))
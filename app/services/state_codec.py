@@ -0,0 +1,380 @@
+import binascii
+import json
+import sys
+from array import array
+from typing import Any, Dict, List, Optional
+from app.models import GameState, Hero, Monster, PhaseType
+from app.services.catalog import Catalog, get_catalog
+
+PACKED_FORMAT = 1
+_BIG_ENDIAN = sys.byteorder == "big"  # массивы хранятся в little-endian
+
+# служебные токены залов, которые не объявлены в справочнике
+_KNOWN_TOKENS = ["closed_portal", "prisoner", "treasury_1", "treasury_2", "treasury_3", "treasury_4"]
+
+_HERO_FIELDS = list(Hero.model_fields)
+_MONSTER_FIELDS = list(Monster.model_fields)
+
+
+class UnknownCatalogVersion(ValueError):
+    """Состояние упаковано по таблице символов справочника, которой у кодека нет."""
+
+    def __init__(self, version: Optional[str]):
+        super().__init__(f"Packed state was encoded with unknown catalog version {version}")
+        self.version = version
+
+
+class StateCodec:
+    """
+    Компактное представление GameState для хранения и передачи.
+
+    - строки из справочника (id карт, залов, героев, эффектов, токены)
+      заменяются маленькими целыми по таблице, привязанной к версии справочника;
+    - колоды, руки и сбросы хранятся как массивы uint16 (base64);
+    - токены зала — пары (токен, число повторов подряд);
+    - статическая топология залов (label/spawn/action/connections) не
+      хранится, если совпадает со сценарием.
+
+    Строки, которых нет в таблице, попадают в список "x" состояния,
+    поэтому кодирование без потерь.
+
+    Таблица символов и статика залов зависят от справочника, поэтому
+    состояние, упакованное до его изменения, читается по таблице своей
+    версии (tables). Таблица текущей версии публикуется в Redis при старте
+    (GameService.publish_codec_table), чужие подгружаются при встрече с
+    незнакомой версией (GameService.parse_state, render_stored).
+
+    Выигрыш формата — размер (в 4–5 раз меньше json); по времени
+    сохранения+чтения он близок к json, а не заметно быстрее.
+    """
+
+    def __init__(self, catalog: Optional[Catalog] = None):
+        self.catalog = catalog or get_catalog()
+        self.version = self.catalog.version
+
+        symbols: List[str] = []
+        symbols += [h["id"] for h in self.catalog.halls]
+        symbols += [h["id"] for h in self.catalog.heroes]
+        symbols += [m["class"] for m in self.catalog.monster_classes]
+        symbols += [c["id"] for c in self.catalog.monster_decks]
+        symbols += list(self.catalog.shop_cards_by_id)
+        symbols += list(self.catalog.effects)
+        symbols += _KNOWN_TOKENS
+        symbols += list(self.catalog.difficulty_config)
+        symbols += [p.value for p in PhaseType]
+
+        self.symbols: List[str] = list(dict.fromkeys(symbols))
+        self.index: Dict[str, int] = {s: i for i, s in enumerate(self.symbols)}
+        self._static_halls: Dict[str, Dict[str, Any]] = {}
+        # другие версии справочника -> {"symbols": [...], "halls": {сценарий: {зал: статика}}}
+        self.tables: Dict[str, Dict[str, Any]] = {}
+
+    def export_table(self) -> Dict[str, Any]:
+        """Таблица текущей версии для хранения: символы и статика залов всех сценариев."""
+        return {
+            "symbols": self.symbols,
+            "halls": {sid: self._static_hall_map(sid) for sid in self.catalog.scenarios},
+        }
+
+    def register_table(self, version: str, table: Dict[str, Any]):
+        """Добавить таблицу другой версии справочника (для чтения старых состояний)."""
+        if version != self.version:
+            self.tables.setdefault(version, table)
+
+    # ----------------------------
+    # Строки и последовательности
+    # ----------------------------
+    def _sym(self, value: Optional[str], extra: Dict[str, int]) -> int:
+        if value is None:
+            return -1
+        i = self.index.get(value)
+        if i is not None:
+            return i
+        j = extra.get(value)
+        if j is None:
+            j = extra[value] = len(extra)
+        return len(self.symbols) + j
+
+    @staticmethod
+    def _str(i: int, names: List[str]) -> Optional[str]:
+        """names — таблица символов версии состояния + его список "x"."""
+        return None if i < 0 else names[i]
+
+    def _pack_seq(self, values: Optional[List[str]], extra: Dict[str, int]) -> Optional[str]:
+        if values is None:
+            return None
+        try:
+            arr = array("H", map(self.index.__getitem__, values))
+        except KeyError:
+            arr = array("H", [self._sym(v, extra) for v in values])
+        if _BIG_ENDIAN:
+            arr.byteswap()
+        return binascii.b2a_base64(arr.tobytes(), newline=False).decode("ascii")
+
+    @staticmethod
+    def _unpack_seq(packed: Optional[str], names: List[str]) -> Optional[List[str]]:
+        if packed is None:
+            return None
+        arr = array("H")
+        arr.frombytes(binascii.a2b_base64(packed))
+        if _BIG_ENDIAN:
+            arr.byteswap()
+        return [names[i] for i in arr]
+
+    def _pack_tokens(self, tokens: Optional[List[str]], extra: Dict[str, int]) -> Optional[List[int]]:
+        if tokens is None:
+            return None
+        runs: List[int] = []
+        for t in tokens:
+            sym = self._sym(t, extra)
+            if runs and runs[-2] == sym:
+                runs[-1] += 1
+            else:
+                runs += [sym, 1]
+        return runs
+
+    def _unpack_tokens(self, runs: Optional[List[int]], names: List[str]) -> Optional[List[str]]:
+        if runs is None:
+            return None
+        tokens: List[str] = []
+        for i in range(0, len(runs), 2):
+            tokens += [self._str(runs[i], names)] * runs[i + 1]
+        return tokens
+
+    # ----------------------------
+    # Статика залов
+    # ----------------------------
+    def _static_hall_map(self, scenario_id: Optional[str]) -> Dict[str, Any]:
+        if not scenario_id:
+            return {}
+        cached = self._static_halls.get(scenario_id)
+        if cached is None:
+            try:
+                scenario = self.catalog.get_scenario(scenario_id)
+            except FileNotFoundError:
+                scenario = {}
+            cached = {}
+            for h in scenario.get("halls", []):
+                base = self.catalog.halls_by_id.get(h["id"], {})
+                cached[h["id"]] = (
+                    base.get("label"),
+                    base.get("spawn"),
+                    base.get("action"),
+                    h.get("connections", []),
+                    base.get("max_connections"),
+                )
+            self._static_halls[scenario_id] = cached
+        return cached
+
+    # ----------------------------
+    # Кодирование
+    # ----------------------------
+    def encode(self, state: GameState) -> Dict[str, Any]:
+        """GameState -> компактный JSON-совместимый словарь."""
+        extra: Dict[str, int] = {}
+        sym = lambda v: self._sym(v, extra)
+        seq = lambda v: self._pack_seq(v, extra)
+
+        static = self._static_hall_map(state.scenario_id)
+        treasures = [self._encode_treasure(t, extra) for t in state.treasures]
+        treasure_index = {row[0]: i for i, row in enumerate(treasures)}
+
+        halls = []
+        for h in state.halls:
+            fixed = (h.label, h.spawn, h.action, h.connections, h.max_connections)
+            if static.get(h.id) == fixed:
+                topology = 0
+            else:
+                topology = [h.label, h.spawn, h.action, seq(h.connections), h.max_connections]
+            treasure = None
+            if h.treasure is not None:
+                i = treasure_index.get(h.treasure.id)
+                t = state.treasures[i] if i is not None else None
+                if t is not None and (t.tier, t.effects, t.opened, t.location) == (
+                        h.treasure.tier, h.treasure.effects, h.treasure.opened, h.treasure.location):
+                    treasure = i
+                else:
+                    treasure = self._encode_treasure(h.treasure, extra)
+            halls.append([
+                sym(h.id), topology, self._pack_tokens(h.tokens, extra),
+                h.heroes, h.monsters, treasure, h.open_portal,
+            ])
+
+        players = [
+            [
+                p.id, p.name, sym(p.monster_class),
+                seq(p.hand), seq(p.deck), seq(p.discard_pile),
+                p.monsters, p.defeated, p.resources, p.bot,
+            ]
+            for p in state.players
+        ]
+
+        heroes = [[getattr(h, f) for f in _HERO_FIELDS] for h in state.heroes]
+        for row in heroes:
+            row[_HERO_FIELDS.index("location")] = sym(row[_HERO_FIELDS.index("location")])
+        monsters = [[getattr(m, f) for f in _MONSTER_FIELDS] for m in state.monsters]
+        for row in monsters:
+            row[_MONSTER_FIELDS.index("class_id")] = sym(row[_MONSTER_FIELDS.index("class_id")])
+            row[_MONSTER_FIELDS.index("location")] = sym(row[_MONSTER_FIELDS.index("location")])
+
+        monster_decks = None
+        if state.monster_decks is not None:
+            monster_decks = {k: seq(v) for k, v in state.monster_decks.items()}
+
+        packed = {
+            "_p": PACKED_FORMAT,
+            "cv": self.version,
+            "id": state.id,
+            "sc": state.scenario_id,
+            "s": [
+                sym(state.difficulty), sym(PhaseType(state.phase).value), state.current_player_id,
+                state.wave, state.game_over, state.result,
+            ],
+            "pl": players,
+            "h": halls,
+            "hr": heroes,
+            "m": monsters,
+            "t": treasures,
+            "gd": seq(state.guild_deck),
+            "md": monster_decks,
+            "sd": seq(state.shop_deck),
+            "sp": seq(state.shop_display),
+        }
+        packed["x"] = list(extra)
+        return packed
+
+    def _encode_treasure(self, t, extra: Dict[str, int]) -> List[Any]:
+        return [t.id, t.tier, self._pack_seq(t.effects, extra), t.opened, self._sym(t.location, extra)]
+
+    # ----------------------------
+    # Декодирование
+    # ----------------------------
+    def decode(self, packed: Dict[str, Any]) -> GameState:
+        """Компактный словарь -> GameState."""
+        return GameState(**self.decode_dict(packed))
+
+    def decode_dict(self, packed: Dict[str, Any]) -> Dict[str, Any]:
+        """Компактный словарь -> словарь в формате GameState.to_dict()."""
+        if packed.get("_p") != PACKED_FORMAT:
+            raise ValueError(f"Unsupported packed state format: {packed.get('_p')}")
+        version = packed.get("cv")
+        if version == self.version:
+            symbols = self.symbols
+            static = self._static_hall_map(packed.get("sc"))
+        else:
+            table = self.tables.get(version)
+            if table is None:
+                raise UnknownCatalogVersion(version)
+            symbols = table["symbols"]
+            static = table["halls"].get(packed.get("sc")) or {}
+
+        names: List[str] = symbols + packed.get("x", [])
+        s = lambda i: None if i < 0 else names[i]
+        seq = lambda v: self._unpack_seq(v, names)
+
+        treasures = [self._decode_treasure(t, names) for t in packed["t"]]
+
+        halls = []
+        for hid, topology, tokens, heroes, monsters, treasure, open_portal in packed["h"]:
+            hall_id = s(hid)
+            if topology == 0:
+                label, spawn, action, connections, max_connections = static[hall_id]
+                connections = list(connections)
+            else:
+                label, spawn, action, connections, max_connections = topology
+                connections = seq(connections)
+            if isinstance(treasure, int):
+                treasure = dict(treasures[treasure])
+            elif treasure is not None:
+                treasure = self._decode_treasure(treasure, names)
+            halls.append({
+                "id": hall_id, "label": label, "spawn": spawn, "action": action,
+                "connections": connections, "tokens": self._unpack_tokens(tokens, names),
+                "max_connections": max_connections, "heroes": heroes, "monsters": monsters,
+                "treasure": treasure, "open_portal": open_portal,
+            })
+
+        players = [
+            {
+                "id": pid, "name": name, "monster_class": s(mc),
+                "hand": seq(hand), "deck": seq(deck), "discard_pile": seq(discard),
+                "monsters": monsters, "resources": resources, "defeated": defeated,
+                "bot": bool(bot and bot[0]),
+            }
+            # состояния, упакованные до появления ботов, — без последнего поля
+            for pid, name, mc, hand, deck, discard, monsters, defeated, resources, *bot in packed["pl"]
+        ]
+
+        heroes = []
+        for row in packed["hr"]:
+            hero = dict(zip(_HERO_FIELDS, row))
+            hero["location"] = s(hero["location"])
+            heroes.append(hero)
+        monsters = []
+        for row in packed["m"]:
+            monster = dict(zip(_MONSTER_FIELDS, row))
+            monster["class_id"] = s(monster["class_id"])
+            monster["location"] = s(monster["location"])
+            monsters.append(monster)
+
+        difficulty, phase, current_player_id, wave, game_over, result = packed["s"]
+        monster_decks = packed.get("md")
+        if monster_decks is not None:
+            monster_decks = {k: seq(v) for k, v in monster_decks.items()}
+
+        return {
+            "id": packed["id"],
+            "players": players,
+            "halls": halls,
+            "heroes": heroes,
+            "monsters": monsters,
+            "treasures": treasures,
+            "scenario_id": packed.get("sc"),
+            "difficulty": s(difficulty),
+            "phase": PhaseType(s(phase)),
+            "current_player_id": current_player_id,
+            "wave": wave,
+            "game_over": game_over,
+            "result": result,
+            "guild_deck": seq(packed.get("gd")),
+            "monster_decks": monster_decks,
+            "shop_deck": seq(packed.get("sd")),
+            "shop_display": seq(packed.get("sp")),
+        }
+
+    def _decode_treasure(self, row: List[Any], names: List[str]) -> Dict[str, Any]:
+        tid, tier, effects, opened, location = row
+        return {
+            "id": tid, "tier": tier, "effects": self._unpack_seq(effects, names),
+            "opened": opened, "location": self._str(location, names),
+        }
+
+    @staticmethod
+    def is_packed(data: Any) -> bool:
+        return isinstance(data, dict) and "_p" in data
+
+    @staticmethod
+    def is_packed_raw(raw: str) -> bool:
+        """
+        Сохранённая строка — packed-состояние. encode() кладёт маркер формата
+        первым ключом, это быстрый путь; если строка переписана с другим
+        порядком ключей, маркер ищется в разобранном словаре.
+        """
+        if raw.startswith('{"_p"'):
+            return True
+        if '"_p"' not in raw:
+            return False
+        try:
+            return StateCodec.is_packed(json.loads(raw))
+        except ValueError:
+            return False
+
+
+_codec: Optional[StateCodec] = None
+
+
+def get_state_codec() -> StateCodec:
+    global _codec
+    if _codec is None:
+        _codec = StateCodec()
+    return _codec
@@ -1,7 +1,13 @@
 import json
+from time import perf_counter
 from typing import List
 from fastapi import WebSocket
 from app.common.logger import logger
+from app.common.metrics import Gauge, WS_BROADCAST_RECIPIENTS, WS_BROADCAST_SECONDS
+from app.common.tracing import traced
+
+_BROADCAST_SECONDS = WS_BROADCAST_SECONDS.labels()
+_BROADCAST_RECIPIENTS = WS_BROADCAST_RECIPIENTS.labels()
 
 class WSManager:
     def __init__(self):
@@ -22,16 +28,19 @@ class WSManager:
     async def connect(self, websocket: WebSocket):
         await websocket.accept()
         self.connections.append(websocket)
-        logger.info(f"[WS] Connection accepted. Total: {len(self.connections)}")
+        logger.info("[WS] Connection accepted. Total: %d", len(self.connections), extra={"event": "ws_connect"})
 
     def disconnect(self, websocket: WebSocket):
         if websocket in self.connections:
             self.connections.remove(websocket)
-            logger.info(f"[WS] Disconnected. Total: {len(self.connections)}")
+            logger.info("[WS] Disconnected. Total: %d", len(self.connections), extra={"event": "ws_disconnect"})
 
+    @traced()
     async def broadcast_game_update(self, game_id: str, payload: dict):
+        start = perf_counter()
         message = json.dumps({"game_id": game_id, "payload": payload}, ensure_ascii=False)
-        for ws in list(self.connections):
+        recipients = list(self.connections)
+        for ws in recipients:
             try:
                 await ws.send_text(message)
             except Exception:
@@ -40,5 +49,9 @@ class WSManager:
                 except Exception:
                     pass
                 self.disconnect(ws)
+        _BROADCAST_SECONDS.observe(perf_counter() - start)
+        _BROADCAST_RECIPIENTS.observe(len(recipients))
 
 ws_manager = WSManager()
+
+Gauge("ttkt_ws_connections", "Open websocket connections", lambda: len(ws_manager.connections))
@@ -0,0 +1,80 @@
+"""
+Набор бенчмарков движка и хранилища (без сети).
+
+    python -m benchmarks                          # все случаи, результат в benchmarks/results/
+    python -m benchmarks -k run_wave --repeat 3   # случаи, в имени которых есть подстрока
+    python -m benchmarks --save-baseline          # записать benchmarks/baseline.json
+    python -m benchmarks --baseline benchmarks/baseline.json --threshold 0.2
+
+С --baseline код выхода 1, если медиана какого-либо случая выросла
+больше порога (общего --threshold или заданного в самом случае).
+Базовую линию стоит снимать на той же машине, что и сравнение.
+"""
+import argparse
+import logging
+import os
+import sys
+from datetime import datetime
+from app.common.logger import logger
+from benchmarks import cases  # noqa: F401  (регистрация случаев)
+from benchmarks.runner import BENCHMARKS, DEFAULT_THRESHOLD, compare, load_json, run_benchmarks, save_json
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BASELINE_PATH = os.path.join(HERE, "baseline.json")
+RESULTS_DIR = os.path.join(HERE, "results")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-k", "--filter", action="append", default=[], help="подстрока имени случая (можно несколько)")
+    parser.add_argument("--list", action="store_true", help="только перечислить случаи")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--scale", type=float, default=1.0, help="множитель числа вызовов (0.1 — быстрый прогон)")
+    parser.add_argument("--out", help="файл результатов (по умолчанию benchmarks/results/<время>.json)")
+    parser.add_argument("--baseline", help="сравнить с базовой линией")
+    parser.add_argument("--save-baseline", action="store_true", help=f"записать результат в {BASELINE_PATH}")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    args = parser.parse_args()
+
+    names = [n for n in BENCHMARKS if not args.filter or any(f in n for f in args.filter)]
+    if args.list:
+        for name in names:
+            print(f"{BENCHMARKS[name].group:8s} {name}")
+        return 0
+    if not names:
+        print("No benchmarks match the filter", file=sys.stderr)
+        return 2
+
+    # логи движка на каждый вызов исказили бы замеры
+    logger.setLevel(logging.WARNING)
+
+    def progress(name, r):
+        print(f"{name:32s} median {r['median_us']:10.1f} us   p95 {r['p95_us']:10.1f} us   x{r['number']}")
+
+    results = run_benchmarks(names, seed=args.seed, repeat=args.repeat, scale=args.scale, progress=progress)
+
+    out = args.out or os.path.join(RESULTS_DIR, datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    save_json(out, results)
+    print(f"results: {out}")
+    if args.save_baseline:
+        save_json(BASELINE_PATH, results)
+        print(f"baseline: {BASELINE_PATH}")
+
+    if not args.baseline:
+        return 0
+    rows = compare(results, load_json(args.baseline), args.threshold)
+    failed = [r for r in rows if r["regression"]]
+    print()
+    for r in rows:
+        mark = "REGRESSION" if r["regression"] else "ok"
+        print(f"{r['name']:32s} {r['baseline_us']:10.1f} -> {r['current_us']:10.1f} us  x{r['ratio']:.2f}  "
+              f"(limit x{1 + r['threshold']:.2f})  {mark}")
+    if failed:
+        print(f"\n{len(failed)} regression(s) against {args.baseline}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
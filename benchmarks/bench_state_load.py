@@ -0,0 +1,81 @@
+"""
+Сравнение путей загрузки GameState из сохранённой JSON-строки.
+
+    python -m benchmarks.bench_state_load [--scenario scenario_02] [--waves 2] [-n 2000]
+
+- validate_dict      — прежний путь: json.loads + GameState(**data)
+- validate_json      — GameState.model_validate_json(raw), без промежуточного dict
+- construct_nested   — сборка вложенных моделей через model_construct (без валидации)
+- get_state_old      — прежний GET state: validate_dict + to_dict()
+- get_state_raw      — текущий GET state: json.loads без построения модели
+"""
+import argparse
+import asyncio
+import json
+import random
+import timeit
+
+from app.common.redis_manager import RedisStorage
+from app.models import GameState, Hall, Hero, Monster, PhaseType, Player, Treasure
+from app.services.game_initializer import GameInitializer
+from app.services.hero_ai_service import HeroAIService
+
+
+async def build_state(scenario_id: str, waves: int) -> GameState:
+    # хранилище в памяти: бенчмарку нужен только сам GameState
+    redis = RedisStorage("memory://")
+    state = await GameInitializer(redis).create_new_game("bench", ["a", "b"], scenario_id)
+    hero_ai = HeroAIService(redis)
+    for _ in range(waves):
+        state.wave += 1
+        await hero_ai.run_wave(state)
+    return state
+
+
+def construct_nested(data: dict) -> GameState:
+    halls = []
+    for h in data["halls"]:
+        h = dict(h)
+        if h.get("treasure"):
+            h["treasure"] = Treasure.model_construct(**h["treasure"])
+        halls.append(Hall.model_construct(**h))
+    return GameState.model_construct(**{
+        **data,
+        "phase": PhaseType(data["phase"]),
+        "players": [Player.model_construct(**p) for p in data["players"]],
+        "halls": halls,
+        "heroes": [Hero.model_construct(**x) for x in data["heroes"]],
+        "monsters": [Monster.model_construct(**x) for x in data["monsters"]],
+        "treasures": [Treasure.model_construct(**x) for x in data["treasures"]],
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", default="scenario_02")
+    parser.add_argument("--waves", type=int, default=2)
+    parser.add_argument("-n", "--number", type=int, default=2000)
+    args = parser.parse_args()
+
+    random.seed(0)
+    state = asyncio.run(build_state(args.scenario, args.waves))
+    raw = json.dumps(state.to_dict(), ensure_ascii=False)
+    data = json.loads(raw)
+
+    cases = {
+        "validate_dict": lambda: GameState(**json.loads(raw)),
+        "validate_json": lambda: GameState.model_validate_json(raw),
+        "construct_nested": lambda: construct_nested(json.loads(raw)),
+        "get_state_old": lambda: GameState(**json.loads(raw)).to_dict(),
+        "get_state_raw": lambda: json.loads(raw),
+    }
+    assert construct_nested(data).to_dict() == GameState(**data).to_dict()
+
+    print(f"state: {len(raw.encode('utf-8'))} bytes, {args.number} iterations")
+    for name, fn in cases.items():
+        t = timeit.timeit(fn, number=args.number)
+        print(f"{name:18s} {t / args.number * 1e6:9.1f} us/op")
+
+
+if __name__ == "__main__":
+    main()
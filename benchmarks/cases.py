@@ -0,0 +1,240 @@
+"""
+Случаи бенчмарков движка и хранилища. Сеть не нужна: RedisStorage
+работает поверх InMemoryRedis (REDIS_URL=memory://).
+"""
+import random
+from itertools import count
+from app.common.redis_manager import RedisStorage
+from app.models import GameState, Hall, Hero, Monster
+from app.services import game_service as game_service_module
+from app.services.bot_service import rollout
+from app.services.card_programs import PlayContext, run_program
+from app.services.catalog import get_catalog
+from app.services.data_loader import DataLoader
+from app.services.game_initializer import GameInitializer
+from app.services.game_log_service import GameLogService
+from app.services.game_service import GameService
+from app.services.hero_ai_service import HeroAIService
+from app.services.legal_actions import legal_actions
+from app.services.sim_state import SimState
+from app.services.ws_manager import WSManager
+from benchmarks.runner import Case, benchmark
+
+SCENARIO = "scenario_02"
+PLAYERS = ["a", "b", "c"]
+
+
+def memory_storage() -> RedisStorage:
+    return RedisStorage("memory://")
+
+
+def build_state(game_id: str = "bench", scenario_id: str = SCENARIO) -> GameState:
+    return GameInitializer(memory_storage()).build_game(game_id, PLAYERS, scenario_id)
+
+
+def build_large_state(halls: int = 300, heroes: int = 60, treasure_share: float = 0.1) -> GameState:
+    """Синтетическая партия: кольцо залов с хордами, жетоны сокровищ, много героев."""
+    state = build_state("bench_large")
+    hall_list = []
+    for i in range(halls):
+        connections = [f"hall_{(i + 1) % halls}", f"hall_{(i - 1) % halls}"]
+        connections.append(f"hall_{random.randrange(halls)}")
+        tokens = ["treasury_1"] if random.random() < treasure_share else []
+        hall_list.append(Hall(id=f"hall_{i}", connections=connections, tokens=tokens))
+    state.halls = hall_list
+    state.treasures = []
+    state.heroes = [
+        Hero(id=f"h{i}", name=f"Hero_{i}", hp=5, attack=2, defense=1, location=f"hall_{random.randrange(halls)}", status="active")
+        for i in range(heroes)
+    ]
+    return state
+
+
+# ----------------------------
+# Справочники и создание партий
+# ----------------------------
+@benchmark("loader.load_all", "data", number=50)
+def bench_load_all():
+    def run(_):
+        DataLoader().load_all()
+    return Case(run)
+
+
+@benchmark("initializer.create_new_game", "engine", number=200)
+def bench_create_new_game():
+    initializer = GameInitializer(memory_storage())
+    ids = count()
+
+    async def run(_):
+        await initializer.create_new_game(f"g{next(ids)}", PLAYERS, SCENARIO)
+    build_state()  # заготовка сценария строится вне замера
+    return Case(run)
+
+
+# ----------------------------
+# GameState через RedisStorage
+# ----------------------------
+def _roundtrip(state_format: str):
+    service = GameService(memory_storage())
+    state = build_state()
+    previous = game_service_module.STATE_FORMAT
+    game_service_module.STATE_FORMAT = state_format
+
+    async def run(_):
+        await service.save_state(state.id, state)
+        await service.load_state(state.id)
+
+    def teardown():
+        game_service_module.STATE_FORMAT = previous
+    return Case(run, teardown=teardown)
+
+
+@benchmark("state.roundtrip.json", "storage", number=500)
+def bench_roundtrip_json():
+    return _roundtrip("json")
+
+
+@benchmark("state.roundtrip.packed", "storage", number=500)
+def bench_roundtrip_packed():
+    return _roundtrip("packed")
+
+
+# ----------------------------
+# Волна героев
+# ----------------------------
+def _run_wave(base: GameState):
+    storage = memory_storage()
+    hero_ai = HeroAIService(storage)
+    log_key = GameLogService.log_key(base.id)
+    base.wave = 1
+
+    def prepare():
+        storage.client.delete_now(log_key)
+        return base.model_copy(deep=True)
+
+    async def run(state):
+        await hero_ai.run_wave(state)
+    return Case(run, prepare)
+
+
+@benchmark("hero_ai.run_wave.small", "engine", number=300)
+def bench_run_wave_small():
+    return _run_wave(build_state())
+
+
+@benchmark("hero_ai.run_wave.large", "engine", number=50)
+def bench_run_wave_large():
+    return _run_wave(build_large_state())
+
+
+# ----------------------------
+# Розыгрыш карт
+# ----------------------------
+@benchmark("cards.run_program", "engine", number=2000)
+def bench_run_program():
+    catalog = get_catalog()
+    base = build_state()
+    player = base.players[0]
+    program = catalog.get_card_program("shop_12")  # три шага move
+
+    def prepare():
+        return PlayContext(base, player, None, (), catalog)
+
+    def run(ctx):
+        run_program(ctx, program, 1)
+    return Case(run, prepare)
+
+
+@benchmark("actions.legal_actions.large", "engine", number=300)
+def bench_legal_actions():
+    catalog = get_catalog()
+    state = build_large_state()
+    player = state.players[0]
+    state.monsters = [
+        Monster(id=f"m{i}", class_id=player.monster_class or "", owner_id=player.id, hp=3, location=f"hall_{i * 30}")
+        for i in range(10)
+    ]
+
+    def run(_):
+        legal_actions(state, player.id, catalog)
+    return Case(run)
+
+
+# ----------------------------
+# Доигрывание для ботов
+# ----------------------------
+@benchmark("sim.rollout_undo", "engine", number=1000)
+def bench_sim_rollout():
+    sim = SimState.from_game(build_state(), get_catalog(), seed=0)
+    rng = random.Random(0)
+
+    def run(_):
+        mark = sim.snapshot()
+        rollout(sim, 1, (), rng, False)
+        sim.undo(mark)
+    return Case(run)
+
+
+# ----------------------------
+# Лог партии
+# ----------------------------
+@benchmark("log.add_entry", "storage", number=2000)
+def bench_log_add_entry():
+    log = GameLogService(memory_storage())
+
+    async def run(_):
+        await log.add_entry("bench", "hero_move", {"hero": "Hero_1", "from": "prison", "to": "forge"})
+    return Case(run)
+
+
+@benchmark("log.add_entries.50", "storage", number=500)
+def bench_log_add_entries():
+    log = GameLogService(memory_storage())
+    entries = [("hero_move", {"hero": f"Hero_{i}", "from": "prison", "to": "forge"}) for i in range(50)]
+
+    async def run(_):
+        await log.add_entries("bench", entries)
+    return Case(run)
+
+
+@benchmark("log.get_log.1000", "storage", number=100)
+async def bench_log_get_log():
+    log = GameLogService(memory_storage())
+    await log.add_entries("bench", [("hero_move", {"hero": f"Hero_{i}", "to": "forge"}) for i in range(1000)])
+
+    async def run(_):
+        await log.get_log("bench")
+    return Case(run)
+
+
+# ----------------------------
+# Рассылка по websocket
+# ----------------------------
+class _FakeSocket:
+    """Соединение, которое принимает сообщения и ничего с ними не делает."""
+
+    async def send_text(self, message: str):
+        pass
+
+    async def close(self):
+        pass
+
+
+def _broadcast(connections: int):
+    manager = WSManager()
+    manager.connections = [_FakeSocket() for _ in range(connections)]
+    payload = {"event": "wave_completed", "game_id": "bench", "wave": 1}
+
+    async def run(_):
+        await manager.broadcast_game_update("bench", payload)
+    return Case(run)
+
+
+@benchmark("ws.broadcast.10", "ws", number=2000)
+def bench_broadcast_10():
+    return _broadcast(10)
+
+
+@benchmark("ws.broadcast.1000", "ws", number=200)
+def bench_broadcast_1000():
+    return _broadcast(1000)
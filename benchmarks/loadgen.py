@@ -0,0 +1,420 @@
+"""
+Нагрузочный генератор: много одновременных партий и websocket-подписчиков.
+
+    python -m benchmarks.loadgen                                  # приложение в процессе (ASGI), memory://
+    python -m benchmarks.loadgen --stages 50,200,500 --stage-seconds 20 --sockets 200
+    python -m benchmarks.loadgen --target http://127.0.0.1:8000 --processes 4
+
+Каждый виртуальный игрок создаёт партию (POST /game/new), затем в цикле
+ждёт «время на раздумье» (экспоненциальное, среднее --think-ms) и либо
+завершает ход (POST end_turn, доля --end-turn-share), либо опрашивает
+GET state. Когда партия окончена, создаётся новая. Подписчики /ws держат
+соединения открытыми весь прогон и считают полученные сообщения.
+
+Нагрузка растёт ступенями (--stages): к уже работающим игрокам добавляются
+новые. По каждой ступени печатаются пропускная способность, p50/p99/p999
+задержки и доля ошибок по маршрутам; --out сохраняет то же в JSON.
+
+В режиме ASGI генератор и приложение делят один event loop, так что
+задержки включают работу самого генератора. Для честной картины
+насыщения узла используйте --target с отдельно запущенным uvicorn
+(нужны пакеты httpx и websockets из requirements-dev.txt) и несколько
+процессов генератора.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import sys
+import uuid
+from time import perf_counter
+from typing import Dict, List, Optional
+
+ROUTE_NEW = "POST /game/new"
+ROUTE_END_TURN = "POST /game/{game_id}/end_turn"
+ROUTE_STATE = "GET /game/{game_id}/state"
+
+
+# ----------------------------
+# Цели: приложение в процессе или внешний сервер
+# ----------------------------
+class AsgiSocket:
+    """Websocket-клиент, подключённый к ASGI-приложению напрямую."""
+
+    def __init__(self, app, path: str):
+        self.app = app
+        self.path = path
+        self.received = 0
+        self.inbox: asyncio.Queue = asyncio.Queue()
+        self.accepted = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+    async def open(self):
+        scope = {
+            "type": "websocket", "asgi": {"version": "3.0"}, "scheme": "ws", "path": self.path,
+            "raw_path": self.path.encode(), "query_string": b"", "root_path": "", "headers": [(b"host", b"loadgen")],
+            "client": ("127.0.0.1", 0), "server": ("loadgen", 80), "subprotocols": [],
+        }
+        self.inbox.put_nowait({"type": "websocket.connect"})
+        self.task = asyncio.create_task(self.app(scope, self.inbox.get, self._send))
+        await self.accepted.wait()
+
+    async def _send(self, message):
+        if message["type"] == "websocket.accept":
+            self.accepted.set()
+        elif message["type"] == "websocket.send":
+            self.received += 1
+        elif message["type"] == "websocket.close":
+            self.accepted.set()
+
+    async def close(self):
+        self.inbox.put_nowait({"type": "websocket.disconnect", "code": 1000})
+        if self.task:
+            await self.task
+
+
+class AsgiTarget:
+    """FastAPI-приложение в этом же процессе, без сети."""
+
+    def __init__(self, app):
+        self.app = app
+        self._lifespan: Optional[asyncio.Task] = None
+        self._lifespan_inbox: asyncio.Queue = asyncio.Queue()
+        self._lifespan_events: asyncio.Queue = asyncio.Queue()
+
+    async def start(self):
+        async def send(message):
+            await self._lifespan_events.put(message["type"])
+        self._lifespan = asyncio.create_task(
+            self.app({"type": "lifespan", "asgi": {"version": "3.0"}}, self._lifespan_inbox.get, send)
+        )
+        await self._lifespan_inbox.put({"type": "lifespan.startup"})
+        await self._lifespan_events.get()
+
+    async def stop(self):
+        await self._lifespan_inbox.put({"type": "lifespan.shutdown"})
+        await self._lifespan_events.get()
+        await self._lifespan
+
+    async def request(self, method: str, path: str, body: Optional[dict] = None):
+        payload = json.dumps(body).encode() if body is not None else b""
+        path, _, query = path.partition("?")
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method, "scheme": "http",
+            "path": path, "raw_path": path.encode(), "query_string": query.encode(), "root_path": "",
+            "headers": [(b"host", b"loadgen"), (b"content-type", b"application/json"),
+                        (b"content-length", str(len(payload)).encode())],
+            "client": ("127.0.0.1", 0), "server": ("loadgen", 80),
+        }
+        done = asyncio.Event()
+        state = {"sent": False, "status": 0, "body": []}
+
+        async def receive():
+            if not state["sent"]:
+                state["sent"] = True
+                return {"type": "http.request", "body": payload, "more_body": False}
+            await done.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                state["status"] = message["status"]
+            elif message["type"] == "http.response.body":
+                state["body"].append(message.get("body", b""))
+                if not message.get("more_body"):
+                    done.set()
+
+        await self.app(scope, receive, send)
+        done.set()
+        return state["status"], b"".join(state["body"])
+
+    def socket(self, path: str = "/ws") -> AsgiSocket:
+        return AsgiSocket(self.app, path)
+
+
+class RemoteSocket:
+    def __init__(self, url: str):
+        self.url = url
+        self.received = 0
+        self.conn = None
+        self.task: Optional[asyncio.Task] = None
+
+    async def open(self):
+        import websockets
+        self.conn = await websockets.connect(self.url, max_queue=None)
+        self.task = asyncio.create_task(self._read())
+
+    async def _read(self):
+        try:
+            async for _ in self.conn:
+                self.received += 1
+        except Exception:
+            pass
+
+    async def close(self):
+        if self.conn:
+            await self.conn.close()
+        if self.task:
+            await self.task
+
+
+class RemoteTarget:
+    """Отдельно запущенный сервер (uvicorn app.main:app)."""
+
+    def __init__(self, base_url: str, connections: int):
+        self.base_url = base_url.rstrip("/")
+        self.connections = connections
+        self.client = None
+
+    async def start(self):
+        try:
+            import httpx
+        except ImportError:
+            raise SystemExit("--target requires httpx (pip install -r requirements-dev.txt)")
+        self.client = httpx.AsyncClient(
+            base_url=self.base_url,
+            timeout=30,
+            limits=httpx.Limits(max_connections=self.connections, max_keepalive_connections=self.connections),
+        )
+
+    async def stop(self):
+        await self.client.aclose()
+
+    async def request(self, method: str, path: str, body: Optional[dict] = None):
+        r = await self.client.request(method, path, json=body)
+        return r.status_code, r.content
+
+    def socket(self, path: str = "/ws") -> RemoteSocket:
+        return RemoteSocket(self.base_url.replace("http", "ws", 1) + path)
+
+
+# ----------------------------
+# Статистика
+# ----------------------------
+class RouteStats:
+    __slots__ = ("latencies", "errors")
+
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.errors = 0
+
+
+class StageStats:
+    def __init__(self, concurrency: int):
+        self.concurrency = concurrency
+        self.routes: Dict[str, RouteStats] = {}
+        self.started = perf_counter()
+        self.duration = 0.0
+        self.ws_messages = 0
+
+    def record(self, route: str, seconds: float, ok: bool):
+        stats = self.routes.get(route)
+        if stats is None:
+            stats = self.routes[route] = RouteStats()
+        stats.latencies.append(seconds)
+        if not ok:
+            stats.errors += 1
+
+    def to_dict(self) -> dict:
+        return {
+            "concurrency": self.concurrency,
+            "duration_s": self.duration,
+            "ws_messages": self.ws_messages,
+            "routes": {name: {"latencies": s.latencies, "errors": s.errors} for name, s in self.routes.items()},
+        }
+
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q))]
+
+
+def summarize(stage: dict) -> dict:
+    """Сырые задержки ступени -> пропускная способность, перцентили, доля ошибок."""
+    duration = stage["duration_s"] or 1e-9
+    routes = {}
+    total = 0
+    for name, data in sorted(stage["routes"].items()):
+        values = sorted(data["latencies"])
+        total += len(values)
+        routes[name] = {
+            "requests": len(values),
+            "rps": len(values) / duration,
+            "p50_ms": _percentile(values, 0.50) * 1000,
+            "p99_ms": _percentile(values, 0.99) * 1000,
+            "p999_ms": _percentile(values, 0.999) * 1000,
+            "error_rate": data["errors"] / len(values) if values else 0.0,
+        }
+    return {
+        "concurrency": stage["concurrency"],
+        "duration_s": stage["duration_s"],
+        "rps": total / duration,
+        "ws_messages": stage["ws_messages"],
+        "routes": routes,
+    }
+
+
+def merge_stages(runs: List[List[dict]]) -> List[dict]:
+    """Объединение ступеней нескольких процессов генератора."""
+    merged = []
+    for stages in zip(*runs):
+        routes: Dict[str, dict] = {}
+        for stage in stages:
+            for name, data in stage["routes"].items():
+                r = routes.setdefault(name, {"latencies": [], "errors": 0})
+                r["latencies"].extend(data["latencies"])
+                r["errors"] += data["errors"]
+        merged.append({
+            "concurrency": sum(s["concurrency"] for s in stages),
+            "duration_s": max(s["duration_s"] for s in stages),
+            "ws_messages": sum(s["ws_messages"] for s in stages),
+            "routes": routes,
+        })
+    return merged
+
+
+# ----------------------------
+# Сценарий нагрузки
+# ----------------------------
+class LoadRun:
+    def __init__(self, target, args, rng: random.Random, worker: int = 0):
+        self.target = target
+        self.args = args
+        self.rng = rng
+        self.worker = worker
+        self.stage: Optional[StageStats] = None
+        self.running = True
+        self.sockets = []
+
+    async def _call(self, route: str, method: str, path: str, body: Optional[dict] = None):
+        start = perf_counter()
+        try:
+            status, content = await self.target.request(method, path, body)
+        except Exception:
+            self.stage.record(route, perf_counter() - start, False)
+            return None, None
+        self.stage.record(route, perf_counter() - start, status < 400)
+        return status, content
+
+    async def _think(self):
+        await asyncio.sleep(self.rng.expovariate(1000 / self.args.think_ms) if self.args.think_ms > 0 else 0)
+
+    async def player(self, n: int):
+        while self.running:
+            game_id = f"load-{self.worker}-{n}-{uuid.uuid4().hex[:8]}"
+            status, _ = await self._call(ROUTE_NEW, "POST", "/game/new", {
+                "game_id": game_id, "player_names": ["a", "b"], "scenario_id": self.args.scenario,
+            })
+            if status != 200:
+                await self._think()
+                continue
+            while self.running:
+                await self._think()
+                if self.rng.random() < self.args.end_turn_share:
+                    status, content = await self._call(ROUTE_END_TURN, "POST", f"/game/{game_id}/end_turn")
+                    if status == 200 and json.loads(content).get("game_over"):
+                        break
+                else:
+                    await self._call(ROUTE_STATE, "GET", f"/game/{game_id}/state")
+
+    async def run(self, stages: List[int], stage_seconds: float, sockets: int) -> List[dict]:
+        for _ in range(sockets):
+            ws = self.target.socket()
+            await ws.open()
+            self.sockets.append(ws)
+
+        results, players = [], []
+        for concurrency in stages:
+            self.stage = StageStats(concurrency)
+            received_before = sum(ws.received for ws in self.sockets)
+            while len(players) < concurrency:
+                players.append(asyncio.create_task(self.player(len(players))))
+            await asyncio.sleep(stage_seconds)
+            self.stage.duration = perf_counter() - self.stage.started
+            self.stage.ws_messages = sum(ws.received for ws in self.sockets) - received_before
+            results.append(self.stage.to_dict())
+
+        self.running = False
+        await asyncio.gather(*players, return_exceptions=True)
+        for ws in self.sockets:
+            await ws.close()
+        return results
+
+
+def _split(total: int, parts: int, index: int) -> int:
+    return total // parts + (1 if index < total % parts else 0)
+
+
+async def _run_worker(args, worker: int) -> List[dict]:
+    if args.target:
+        target = RemoteTarget(args.target, connections=max(args.stages) + 10)
+    else:
+        os.environ["REDIS_URL"] = args.redis
+        os.environ.setdefault("LOG_LEVEL", "WARNING")
+        # все виртуальные игроки приходят с одного адреса — лимиты клиента их бы душили
+        os.environ.setdefault("ADMISSION", "0")
+        from app.main import app
+        target = AsgiTarget(app)
+    await target.start()
+    try:
+        rng = random.Random(args.seed * 1000 + worker)
+        stages = [_split(c, args.processes, worker) for c in args.stages]
+        sockets = _split(args.sockets, args.processes, worker)
+        return await LoadRun(target, args, rng, worker).run(stages, args.stage_seconds, sockets)
+    finally:
+        await target.stop()
+
+
+def _worker_entry(payload):
+    args, worker = payload
+    return asyncio.run(_run_worker(args, worker))
+
+
+def print_report(summaries: List[dict]):
+    for s in summaries:
+        print(f"\n== concurrency {s['concurrency']}: {s['rps']:.0f} req/s over {s['duration_s']:.1f}s, "
+              f"ws messages {s['ws_messages']}")
+        print(f"{'route':34s} {'req':>8s} {'req/s':>8s} {'p50 ms':>9s} {'p99 ms':>9s} {'p999 ms':>9s} {'err':>7s}")
+        for name, r in s["routes"].items():
+            print(f"{name:34s} {r['requests']:8d} {r['rps']:8.0f} {r['p50_ms']:9.2f} {r['p99_ms']:9.2f} "
+                  f"{r['p999_ms']:9.2f} {r['error_rate']:7.2%}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", help="адрес сервера (http://127.0.0.1:8000); без него — ASGI в процессе")
+    parser.add_argument("--redis", default="memory://", help="REDIS_URL для режима ASGI")
+    parser.add_argument("--stages", default="10,50,100", help="число одновременных игроков по ступеням")
+    parser.add_argument("--stage-seconds", type=float, default=10)
+    parser.add_argument("--sockets", type=int, default=50, help="websocket-подписчиков на весь прогон")
+    parser.add_argument("--think-ms", type=float, default=200, help="среднее время на раздумье")
+    parser.add_argument("--end-turn-share", type=float, default=0.3, help="доля end_turn среди действий")
+    parser.add_argument("--scenario", default="scenario_02")
+    parser.add_argument("--processes", type=int, default=1, help="процессов генератора (только с --target)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="сохранить сводку в JSON")
+    args = parser.parse_args()
+    args.stages = [int(x) for x in args.stages.split(",") if x]
+    if args.processes > 1 and not args.target:
+        parser.error("--processes needs --target: in ASGI mode every process would get its own app")
+
+    if args.processes == 1:
+        runs = [asyncio.run(_run_worker(args, 0))]
+    else:
+        with multiprocessing.get_context("spawn").Pool(args.processes) as pool:
+            runs = pool.map(_worker_entry, [(args, i) for i in range(args.processes)])
+
+    summaries = [summarize(stage) for stage in merge_stages(runs)]
+    print_report(summaries)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "stages": summaries}, f, indent=2)
+        print(f"\nsummary: {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
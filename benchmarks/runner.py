@@ -0,0 +1,167 @@
+"""
+Исполнитель бенчмарков: регистрация случаев, замеры, JSON с результатами
+и сравнение с базовой линией.
+
+Случай — функция setup(ctx), возвращающая Case. Перед setup генератор
+random сбрасывается к seed + crc32(имя), поэтому прогоны повторяемы
+и не зависят от того, какие ещё случаи запускались.
+"""
+import asyncio
+import inspect
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import zlib
+from time import perf_counter_ns, time
+from typing import Any, Callable, Dict, List, Optional
+
+DEFAULT_THRESHOLD = 0.25  # допустимое замедление медианы относительно базовой линии
+
+
+class Case:
+    """
+    Что замерять.
+
+    run(arg)  — измеряемый вызов (обычная функция или async);
+    prepare() — необязательная подготовка аргумента перед каждым вызовом,
+                не входит в замер (свежая копия изменяемого состояния и т.п.).
+    """
+
+    def __init__(self, run: Callable, prepare: Optional[Callable[[], Any]] = None, teardown: Optional[Callable] = None):
+        self.run = run
+        self.prepare = prepare
+        self.teardown = teardown
+        self.is_async = inspect.iscoroutinefunction(run)
+
+
+class Benchmark:
+    def __init__(self, name: str, group: str, setup: Callable, number: int, threshold: Optional[float]):
+        self.name = name
+        self.group = group
+        self.setup = setup
+        self.number = number
+        self.threshold = threshold
+
+
+BENCHMARKS: Dict[str, Benchmark] = {}
+
+
+def benchmark(name: str, group: str, number: int = 200, threshold: Optional[float] = None):
+    """Регистрация случая; number — вызовов в одном повторе, threshold — свой порог регрессии."""
+
+    def decorator(setup):
+        if name in BENCHMARKS:
+            raise ValueError(f"Benchmark '{name}' is already registered")
+        BENCHMARKS[name] = Benchmark(name, group, setup, number, threshold)
+        return setup
+    return decorator
+
+
+def _seed_for(name: str, seed: int) -> int:
+    return seed + zlib.crc32(name.encode("utf-8"))
+
+
+async def _measure(case: Case, number: int) -> List[int]:
+    samples = []
+    for _ in range(number):
+        arg = case.prepare() if case.prepare else None
+        if case.is_async:
+            start = perf_counter_ns()
+            await case.run(arg)
+        else:
+            start = perf_counter_ns()
+            case.run(arg)
+        samples.append(perf_counter_ns() - start)
+    return samples
+
+
+async def _run_one(bench: Benchmark, seed: int, repeat: int, scale: float) -> dict:
+    random.seed(_seed_for(bench.name, seed))
+    case = bench.setup()
+    if inspect.isawaitable(case):
+        case = await case
+    number = max(1, int(bench.number * scale))
+    try:
+        await _measure(case, max(1, number // 10))  # прогрев
+        medians, samples = [], []
+        for _ in range(repeat):
+            run = await _measure(case, number)
+            medians.append(statistics.median(run))
+            samples.extend(run)
+    finally:
+        if case.teardown:
+            result = case.teardown()
+            if inspect.isawaitable(result):
+                await result
+    samples.sort()
+    return {
+        "group": bench.group,
+        "number": number,
+        "repeat": repeat,
+        # медиана по повторам устойчивее к фоновому шуму, чем среднее
+        "median_us": statistics.median(medians) / 1000,
+        "min_us": samples[0] / 1000,
+        "mean_us": statistics.fmean(samples) / 1000,
+        "p95_us": samples[min(len(samples) - 1, int(len(samples) * 0.95))] / 1000,
+    }
+
+
+def run_benchmarks(names: List[str], seed: int = 0, repeat: int = 5, scale: float = 1.0,
+                   progress: Callable[[str, dict], None] = None) -> dict:
+    """Прогнать выбранные случаи; результат — документ для JSON."""
+
+    async def run_all():
+        results = {}
+        for name in names:
+            results[name] = await _run_one(BENCHMARKS[name], seed, repeat, scale)
+            if progress:
+                progress(name, results[name])
+        return results
+
+    return {
+        "created": int(time()),
+        "seed": seed,
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "results": asyncio.run(run_all()),
+    }
+
+
+def compare(current: dict, baseline: dict, threshold: float = DEFAULT_THRESHOLD) -> List[dict]:
+    """
+    Сравнение медиан с базовой линией. Возвращает строки по общим случаям;
+    regression=True, если медиана выросла больше чем на порог случая.
+    """
+    rows = []
+    for name, cur in current["results"].items():
+        base = baseline.get("results", {}).get(name)
+        if not base:
+            continue
+        bench = BENCHMARKS.get(name)
+        limit = bench.threshold if bench and bench.threshold is not None else threshold
+        ratio = cur["median_us"] / base["median_us"] if base["median_us"] else float("inf")
+        rows.append({
+            "name": name,
+            "baseline_us": base["median_us"],
+            "current_us": cur["median_us"],
+            "ratio": ratio,
+            "threshold": limit,
+            "regression": ratio > 1 + limit,
+        })
+    return rows
+
+
+def load_json(path: str) -> dict:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_json(path: str, data: dict):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
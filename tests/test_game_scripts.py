@@ -0,0 +1,109 @@
+"""
+Скрипты app/services/game_scripts.py: Lua (fakeredis + lupa) против
+Python-эквивалентов InMemoryRedis на одних и тех же состояниях.
+Нужен fakeredis[lua] из requirements-dev.txt, без него модуль пропускается.
+"""
+import asyncio
+import json
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("lupa")
+
+from app.common.memory_redis import InMemoryRedis
+from app.common.redis_manager import RedisStorage
+from app.models import GameState
+from app.services.analytics_service import AnalyticsService, analytics
+from app.services.catalog import get_catalog
+from app.services.game_initializer import GameInitializer
+from app.services.game_scripts import DRAW_CARD, MISSING, OK, OPEN_TREASURE, UNSUPPORTED, run_game_script
+from app.services.state_codec import get_state_codec
+
+# имена с [] и запятыми внутри строк ломали разбор состояния в Lua
+PLAYERS = ["Bob,[]", "[ ]", 'Eve "[]"']
+
+
+def _storage(client) -> RedisStorage:
+    storage = RedisStorage("memory://")
+    storage.client = client
+    return storage
+
+
+def _state() -> GameState:
+    # первый сценарий, где в залах лежат сокровища
+    states = (GameInitializer(None).build_game("g1", PLAYERS, s) for s in get_catalog().scenarios)
+    return next(st for st in states if any(h.treasure for h in st.halls))
+
+
+async def _run(client, raw: str, script, *args):
+    storage = _storage(client)
+    await client.set("game:g1", raw)
+    result = await run_game_script(storage, script, "g1", *args)
+    return (
+        result,
+        await client.get("game:g1"),
+        [json.loads(e) for e in await client.lrange("game:g1:log", 0, -1)],
+        await client.hgetall(AnalyticsService.key(*analytics.dims("g1"))),
+    )
+
+
+def _both(raw: str, script, *args):
+    async def run():
+        lua = await _run(fakeredis.FakeAsyncRedis(decode_responses=True), raw, script, *args)
+        emulated = await _run(InMemoryRedis(), raw, script, *args)
+        return lua, emulated
+    return asyncio.run(run())
+
+
+def _same(lua, emulated):
+    assert lua[0] == tuple(emulated[0])
+    assert GameState.model_validate_json(lua[1]).to_dict() == GameState.model_validate_json(emulated[1]).to_dict()
+    strip = lambda log: [(e["type"], e["payload"]) for e in log]
+    assert strip(lua[2]) == strip(emulated[2])
+    assert lua[3] == emulated[3]
+
+
+def test_draw_card_matches_emulation():
+    state = _state()
+    lua, emulated = _both(json.dumps(state.to_dict(), ensure_ascii=False), DRAW_CARD, "", "7")
+    assert lua[0][0] == OK and lua[0][1]
+    _same(lua, emulated)
+    assert [p["name"] for p in json.loads(lua[1])["players"]] == PLAYERS
+
+
+def test_draw_card_reshuffles_discard():
+    state = _state()
+    player = state.players[0]
+    player.discard_pile, player.deck = player.deck, []
+    lua, emulated = _both(json.dumps(state.to_dict(), ensure_ascii=False), DRAW_CARD, player.id, "7")
+    assert lua[0][0] == emulated[0][0] == OK
+    # порядок перемешивания у Lua и Python разный — сравниваются составы
+    lp, ep = (GameState.model_validate_json(r[1]).players[0] for r in (lua, emulated))
+    assert sorted(lp.deck + lp.hand) == sorted(ep.deck + ep.hand)
+    assert lp.discard_pile == ep.discard_pile == []
+
+
+def test_open_treasure_matches_emulation():
+    state = _state()
+    treasure = next(h.treasure for h in state.halls if h.treasure)
+    raw = json.dumps(state.to_dict(), ensure_ascii=False)
+    lua, emulated = _both(raw, OPEN_TREASURE, treasure.id, "")
+    assert lua[0][0] == OK
+    _same(lua, emulated)
+    # повторное открытие — без изменений и записей
+    again, _ = _both(lua[1], OPEN_TREASURE, treasure.id, "")
+    assert again[0] == (OK, "") and again[1] == lua[1] and again[2] == []
+
+
+def test_packed_state_is_unsupported():
+    packed = get_state_codec().encode(_state())
+    raw = json.dumps(dict(reversed(list(packed.items()))), ensure_ascii=False)
+    lua, emulated = _both(raw, DRAW_CARD, "", "7")
+    assert lua[0] == tuple(emulated[0]) == (UNSUPPORTED, "")
+    assert lua[1] == emulated[1] == raw
+
+
+def test_missing_game():
+    async def run():
+        return await run_game_script(_storage(fakeredis.FakeAsyncRedis(decode_responses=True)), DRAW_CARD, "nope", "", "7")
+    assert asyncio.run(run())[0] == MISSING